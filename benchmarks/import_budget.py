@@ -0,0 +1,78 @@
+"""
+Startup benchmark: time to import each evaluator module in a fresh interpreter
+Fails when an import exceeds its budget or loads one of the heavy scientific packages,
+which must only be imported by the code paths using them
+
+python -m CLEF_evaluators_2018.benchmarks.import_budget --budget 0.2
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from ..common.registry import EVALUATORS
+
+
+_ROOT_PACKAGE = __package__.rpartition('.')[0]
+_PARENT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#packages that must not be loaded by importing an evaluator
+HEAVY_PACKAGES = ['nltk', 'scipy', 'pandas', 'sklearn']
+
+DEFAULT_BUDGET_SECONDS = 0.2
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+"""
+Imports the evaluator module of a challenge in a fresh interpreter, returns (seconds, heavy packages loaded)
+"""
+def measure_import(challenge):
+    module = '{}.{}.{}_evaluator'.format(_ROOT_PACKAGE, challenge, challenge)
+    output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT.format(module=module, heavy=HEAVY_PACKAGES)],
+                                     cwd=_PARENT_DIRECTORY)
+    measure = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    return measure['seconds'], measure['heavy']
+
+
+"""
+Returns the list of budget violations, the fastest of 'repeat' imports is compared with the budget
+"""
+def check_import_budget(challenges, budget=DEFAULT_BUDGET_SECONDS, repeat=3):
+    violations = []
+    for challenge in challenges:
+        measures = [measure_import(challenge) for i in range(repeat)]
+        seconds = min(seconds for seconds, heavy in measures)
+        heavy = measures[0][1]
+        print('{:<32} {:>7.3f} s{}'.format(challenge, seconds, ' (loads {})'.format(', '.join(heavy)) if heavy else ''))
+        if seconds > budget:
+            violations.append('{}: import takes {:.3f} s, budget is {:.3f} s'.format(challenge, seconds, budget))
+        if heavy:
+            violations.append('{}: import loads {}'.format(challenge, ', '.join(heavy)))
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import time of the evaluators")
+    parser.add_argument('--challenges', nargs='+', choices=sorted(EVALUATORS), default=sorted(EVALUATORS))
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_SECONDS, help="max nbr of seconds per import")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    violations = check_import_budget(args.challenges, args.budget, args.repeat)
+    for violation in violations:
+        print('OVER BUDGET {}'.format(violation))
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Equivalence check of the vectorised rank-based average precisions (common/average_precision.py, used by
+bird_monophone) against a reference Python loop over the sorted correct ranks of each query
+Fails when a sum of precisions is not the same float as the reference one
+
+python -m CLEF_evaluators_2018.benchmarks.rank_ap_equivalence --queries 10000
+"""
+
+import argparse
+import random
+import sys
+
+from ..common.average_precision import sum_rank_precisions
+
+
+"""
+Reference sum of the precisions of one query: precision at each correct rank, in increasing rank order
+"""
+def reference_sum_precisions(correct_ranks):
+    total = 0.0
+    for count_relevant, rank in enumerate(sorted(correct_ranks), 1):
+        total += float(count_relevant) / float(rank)
+    return total
+
+
+"""
+Returns random sets of distinct correct ranks between 1 and 'max_rank' (some of them empty)
+"""
+def random_correct_ranks(nbr_queries, max_rank, max_correct, seed=0):
+    rng = random.Random(seed)
+    return [set(rng.sample(range(1, max_rank + 1), rng.randint(0, max_correct))) for i in range(nbr_queries)]
+
+
+"""
+Returns the list of the queries whose vectorised sum differs from the reference one
+"""
+def check_equivalence(queries_correct_ranks):
+    import numpy as np
+    width = max([len(ranks) for ranks in queries_correct_ranks] or [0])
+    padded_ranks = np.zeros((len(queries_correct_ranks), width), dtype=np.int64)
+    for i, ranks in enumerate(queries_correct_ranks):
+        padded_ranks[i, :len(ranks)] = list(ranks)
+
+    sums = sum_rank_precisions(padded_ranks).tolist()
+    mismatches = []
+    for i, ranks in enumerate(queries_correct_ranks):
+        expected = reference_sum_precisions(ranks)
+        if sums[i] != expected:
+            mismatches.append((i, sorted(ranks), sums[i], expected))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the vectorised rank-based average precisions")
+    parser.add_argument('--queries', type=int, default=10000)
+    parser.add_argument('--max-rank', type=int, default=100)
+    parser.add_argument('--max-correct', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    queries_correct_ranks = random_correct_ranks(args.queries, args.max_rank, args.max_correct, args.seed)
+    mismatches = check_equivalence(queries_correct_ranks)
+    for i, ranks, value, expected in mismatches[:10]:
+        print('MISMATCH query {} ranks {}: {!r} != {!r}'.format(i, ranks, value, expected))
+    print('{} queries, {} mismatches'.format(len(queries_correct_ranks), len(mismatches)))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
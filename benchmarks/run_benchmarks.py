@@ -0,0 +1,172 @@
+"""
+Benchmarks of the evaluators on synthetic data (see synthetic.py)
+Each challenge runs in its own process; every phase (load_gt, load_predictions, each scoring method)
+is timed separately and the peak resident memory of the process after the phase is recorded
+Results can be stored as a baseline and later runs compared against it
+
+python -m CLEF_evaluators_2018.benchmarks.run_benchmarks --scale medium --output baseline.json
+python -m CLEF_evaluators_2018.benchmarks.run_benchmarks --scale medium --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+from ..common.registry import EVALUATORS, create_evaluator, get_evaluator_class
+from ..common.telemetry import measure_phase
+from .synthetic import SCALES, generate
+
+
+#challenge name => scoring methods called with the predictions, the whole _evaluate is timed when there are none
+SCORING_METHODS = {
+    'bird_monophone': ['retrieval_mean_average_precision_foreground', 'retrieval_mean_average_precision_background'],
+    'bird_soundscape': ['classification_mean_average_precision', 'retrieval_mean_average_precision'],
+    'caption_prediction': ['compute_bleu'],
+    'concept_detection': ['compute_f1'],
+    'expert': ['compute_top_1_experts', 'compute_top_1_all'],
+    'geo': ['compute_top_1_experts'],
+    'lifelog_adlt': ['compute_percentage_dissimilarity'],
+    'lifelog_lmrt': ['compute_f1_at_10'],
+    'tuberculosis_mdr_detection': [],
+    'tuberculosis_severity_scoring': [],
+    'tuberculosis_tb_type': [],
+    'vqa_med': ['compute_wbss', 'compute_bleu'],
+}
+
+
+"""
+Runs a function and returns (its result, measures of the phase)
+"""
+def _measure(function, *args, **kwargs):
+    with measure_phase() as measures:
+        result = function(*args, **kwargs)
+    return result, measures
+
+
+"""
+Benchmarks one challenge on the generated files, returns dict phase => measures
+The import of the evaluator module is timed apart from load_gt (which includes the loading of the allowed ids)
+A failing phase is recorded with its error and ends the benchmark of the challenge
+"""
+def benchmark_challenge(challenge, files):
+    phases = {}
+    parameters = dict(files)
+    answer_file_path = parameters.pop('answer_file_path')
+    submission_file_path = parameters.pop('submission_file_path')
+    with open(submission_file_path, 'rb') as f:
+        rows = sum(1 for line in f)
+
+    #messages printed by the evaluators would be mixed with the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            evaluator_class, phases['import'] = _measure(get_evaluator_class, challenge)
+            evaluator, phases['load_gt'] = _measure(create_evaluator, challenge, answer_file_path, **parameters)
+
+            predictions, phases['load_predictions'] = _measure(evaluator.load_predictions, submission_file_path)
+
+            for method in SCORING_METHODS[challenge]:
+                score, phases[method] = _measure(getattr(evaluator, method), predictions)
+            if not SCORING_METHODS[challenge]:
+                result, phases['_evaluate'] = _measure(evaluator._evaluate, {'submission_file_path': submission_file_path})
+        except Exception as e:
+            message = str(e).strip().splitlines()
+            phases['error'] = '{}: {}'.format(type(e).__name__, message[0] if message else '')
+
+    return {'rows': rows, 'phases': phases}
+
+
+"""
+Generates the data of each challenge and benchmarks it in a fresh process
+"""
+def run_benchmarks(challenges, scale, data_directory, seed=0):
+    results = {}
+    process_context = multiprocessing.get_context('fork')
+    for challenge in challenges:
+        files = generate(challenge, scale, os.path.join(data_directory, scale, challenge), seed)
+        with process_context.Pool(1) as pool:
+            results[challenge] = pool.apply(benchmark_challenge, (challenge, files))
+        print_challenge(challenge, results[challenge])
+    return {'scale': scale, 'seed': seed, 'results': results}
+
+
+def print_challenge(challenge, result):
+    print('{} ({} rows)'.format(challenge, result['rows']))
+    for phase, measures in result['phases'].items():
+        if phase == 'error':
+            print('    ERROR {}'.format(measures))
+        else:
+            print('    {:<48} {:>9.3f} s {:>9.3f} s cpu {:>9} KB peak {:>9} KB growth'
+                .format(phase, measures['seconds'], measures['cpu_seconds'], measures['process_peak_rss_kb'],
+                        measures['peak_rss_growth_kb']))
+    sys.stdout.flush()
+
+
+"""
+Compares results with a baseline, returns the list of regressions
+A phase regresses when its time or the peak memory of the process after it (the phases of a challenge running in
+one process, in the same order) exceeds the baseline by more than 'tolerance' (ratio)
+Phases faster than 'min_seconds' in the baseline are too noisy to be compared on time
+"""
+def compare_with_baseline(results, baseline, tolerance=0.25, min_seconds=0.05):
+    if results['scale'] != baseline['scale']:
+        raise Exception("Baseline was recorded at scale '{}', not '{}'".format(baseline['scale'], results['scale']))
+
+    regressions = []
+    for challenge, result in results['results'].items():
+        if challenge not in baseline['results']:
+            continue
+        baseline_phases = baseline['results'][challenge]['phases']
+        for phase, measures in result['phases'].items():
+            if phase == 'error' or phase not in baseline_phases or 'seconds' not in baseline_phases[phase]:
+                continue
+            before = baseline_phases[phase]
+            if before['seconds'] >= min_seconds and measures['seconds'] > before['seconds'] * (1 + tolerance):
+                regressions.append('{} {}: {:.3f} s -> {:.3f} s'.format(challenge, phase, before['seconds'], measures['seconds']))
+            #baselines recorded before the rename of 'peak_rss_kb'
+            before_peak = before.get('process_peak_rss_kb', before.get('peak_rss_kb'))
+            if measures['process_peak_rss_kb'] > before_peak * (1 + tolerance):
+                regressions.append('{} {}: process peak {} KB -> {} KB'
+                    .format(challenge, phase, before_peak, measures['process_peak_rss_kb']))
+        if 'error' in result['phases'] and 'error' not in baseline_phases:
+            regressions.append('{}: {}'.format(challenge, result['phases']['error']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the evaluators on synthetic data")
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    parser.add_argument('--challenges', nargs='+', choices=sorted(EVALUATORS), default=sorted(EVALUATORS))
+    parser.add_argument('--data-dir', default=None, help="directory of the generated data (default: temporary directory)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="JSON file to write the results to (e.g. a new baseline)")
+    parser.add_argument('--baseline', default=None, help="JSON file of results to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown / memory increase ratio")
+    args = parser.parse_args(argv)
+
+    data_directory = args.data_dir or tempfile.mkdtemp(prefix='clef_benchmarks_')
+    try:
+        results = run_benchmarks(args.challenges, args.scale, data_directory, args.seed)
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_directory)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION {}'.format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
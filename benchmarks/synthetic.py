@@ -0,0 +1,257 @@
+"""
+Synthetic ground truth and runfiles for every challenge
+The files follow the formats expected by the evaluators and are valid, so that a whole evaluation can be timed
+Sizes are given by a scale: 'small' (smoke test), 'medium' and 'production' (size of the real test sets)
+"""
+
+import os
+import random
+
+
+#scale => sizes of the generated data
+SCALES = {
+    'small': {
+        'soundscape_medias': 3, 'soundscape_chunks': 24, 'soundscape_predictions_per_chunk': 10,
+        'classes': 200, 'queries': 50, 'ranks': 100,
+        'images': 100, 'concepts': 500,
+        'lifelog_images': 3000, 'lifelog_images_per_topic': 300,
+        'patients': 40, 'questions': 50,
+    },
+    'medium': {
+        'soundscape_medias': 10, 'soundscape_chunks': 120, 'soundscape_predictions_per_chunk': 50,
+        'classes': 1500, 'queries': 1000, 'ranks': 100,
+        'images': 1000, 'concepts': 5000,
+        'lifelog_images': 20000, 'lifelog_images_per_topic': 2000,
+        'patients': 200, 'questions': 500,
+    },
+    'production': {
+        'soundscape_medias': 40, 'soundscape_chunks': 720, 'soundscape_predictions_per_chunk': 100,
+        'classes': 1500, 'queries': 12000, 'ranks': 100,
+        'images': 10000, 'concepts': 20000,
+        'lifelog_images': 80000, 'lifelog_images_per_topic': 8000,
+        'patients': 1000, 'questions': 5000,
+    },
+}
+
+_WORDS = ['lesion', 'left', 'right', 'lobe', 'lung', 'mass', 'contrast', 'enhanced', 'axial', 'image', 'shows',
+          'liver', 'kidney', 'cyst', 'fracture', 'bone', 'ct', 'mri', 'scan', 'arrow', 'large', 'small', 'tumor',
+          'patient', 'with', 'of', 'the', 'in', 'and', 'a', 'chest', 'abdomen', 'brain', 'normal', 'showing']
+
+
+def _write_lines(file_path, lines):
+    with open(file_path, 'w') as f:
+        for line in lines:
+            f.write(line)
+            f.write('\n')
+    return file_path
+
+
+def _timecode(seconds):
+    return '{:02d}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def _sentence(rng, min_words, max_words):
+    return ' '.join(rng.choice(_WORDS) for i in range(rng.randint(min_words, max_words)))
+
+
+def _class_ids(sizes):
+    return ['{}'.format(100000 + i) for i in range(sizes['classes'])]
+
+
+def _generate_bird_soundscape(rng, sizes, directory):
+    classes = _class_ids(sizes)
+    medias = ['{}'.format(49880 + i) for i in range(sizes['soundscape_medias'])]
+    duration = sizes['soundscape_chunks'] * 5
+
+    gt = []
+    for media in medias:
+        for i in range(max(1, sizes['soundscape_chunks'] // 4)):
+            start = rng.randint(0, duration - 5)
+            end = min(duration, start + rng.randint(1, 60))
+            gt.append('{};{};{}-{};{}'.format(media, rng.choice(classes), _timecode(start), _timecode(end),
+                                              rng.choice(['FR', 'CO', 'PE'])))
+
+    def run():
+        for media in medias:
+            for chunk in range(sizes['soundscape_chunks']):
+                time_interval = '{}-{}'.format(_timecode(chunk * 5), _timecode(chunk * 5 + 5))
+                for classid in rng.sample(classes, sizes['soundscape_predictions_per_chunk']):
+                    yield '{};{};{};{}'.format(media, time_interval, classid, round(rng.random(), 4))
+
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'), gt),
+        'allowed_classes_file_path': _write_lines(os.path.join(directory, 'allowed_classes.txt'), classes),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'), run()),
+    }
+
+
+def _ranked_run(rng, sizes, queries, classes):
+    for query in queries:
+        for rank, classid in enumerate(rng.sample(classes, sizes['ranks'])):
+            yield '{};{};{};{}'.format(query, classid, round(1.0 - rank / float(sizes['ranks']), 4), rank + 1)
+
+
+def _generate_bird_monophone(rng, sizes, directory):
+    classes = _class_ids(sizes)
+    queries = ['{}'.format(i + 1) for i in range(sizes['queries'])] + ['8794', '28335']
+
+    gt = []
+    for query in queries:
+        background = rng.sample(classes, rng.randint(0, 3)) + ['unknown']
+        gt.append('{};{};{}'.format(query, rng.choice(classes), ','.join(background)))
+
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'), gt),
+        'allowed_classes_file_path': _write_lines(os.path.join(directory, 'allowed_classes.txt'), classes),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'), _ranked_run(rng, sizes, queries, classes)),
+    }
+
+
+def _generate_expert(rng, sizes, directory):
+    classes = _class_ids(sizes)
+    queries = ['{}'.format(i + 1) for i in range(sizes['queries'])]
+    gt = ['{};{};{}'.format(query, rng.choice(classes), rng.choice(['ManVsMachine2017', 'LifeCLEF2017']))
+          for query in queries]
+
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'), gt),
+        'allowed_classes_file_path': _write_lines(os.path.join(directory, 'allowed_classes.txt'), classes),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'), _ranked_run(rng, sizes, queries, classes)),
+    }
+
+
+def _generate_caption_prediction(rng, sizes, directory):
+    images = ['ROCO_{:05d}'.format(i) for i in range(sizes['images'])]
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'),
+            ('{}\t{}'.format(image, _sentence(rng, 5, 30)) for image in images)),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'),
+            ('{}\t{}'.format(image, _sentence(rng, 3, 25)) for image in images)),
+    }
+
+
+def _generate_concept_detection(rng, sizes, directory):
+    images = ['ROCO_{:05d}'.format(i) for i in range(sizes['images'])]
+    concepts = ['C{:07d}'.format(i) for i in range(sizes['concepts'])]
+
+    def pairs():
+        for image in images:
+            yield '{}\t{}'.format(image, ';'.join(rng.sample(concepts, rng.randint(0, 10))))
+
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'), pairs()),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'), pairs()),
+    }
+
+
+def _lifelog_image_ids(sizes):
+    return ['u1_{:07d}'.format(i) for i in range(sizes['lifelog_images'])]
+
+
+def _generate_lifelog_adlt(rng, sizes, directory):
+    topics = range(1, 11)
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'),
+            ('{},{},{}'.format(topic, rng.randint(1, 20), rng.randint(1, 600)) for topic in topics)),
+        'allowed_image_ids_file_path': _write_lines(os.path.join(directory, 'allowed_image_ids.txt'), _lifelog_image_ids(sizes)),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'),
+            ['{},{},{}'.format(topic, rng.randint(1, 20), rng.randint(1, 600)) for topic in topics] + ['*****']),
+    }
+
+
+def _generate_lifelog_lmrt(rng, sizes, directory):
+    image_ids = _lifelog_image_ids(sizes)
+    topics = range(1, 11)
+
+    #the cluster of the greatest image ID of a topic is its number of clusters
+    gt = []
+    for topic in topics:
+        relevant = sorted(rng.sample(image_ids, 50))
+        for i, image_id in enumerate(relevant):
+            gt.append('{}, {}, {}'.format(topic, image_id, 1 + i * 10 // len(relevant)))
+
+    def run():
+        for topic in topics:
+            for rank, image_id in enumerate(rng.sample(image_ids, sizes['lifelog_images_per_topic'])):
+                yield '{},{},{}'.format(topic, image_id, round(1.0 - rank / float(sizes['lifelog_images_per_topic']), 4))
+
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'), gt),
+        'clusters_gt_file_path': None,
+        'allowed_image_ids_file_path': _write_lines(os.path.join(directory, 'allowed_image_ids.txt'), image_ids),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'), run()),
+    }
+
+
+def _patient_ids(sizes):
+    return ['TST_{:04d}'.format(i) for i in range(sizes['patients'])]
+
+
+def _generate_tuberculosis_mdr_detection(rng, sizes, directory):
+    patients = _patient_ids(sizes)
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'),
+            ('{},{}'.format(patient, i % 2) for i, patient in enumerate(patients))),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'),
+            ('{},{}'.format(patient, round(rng.random(), 4)) for patient in patients)),
+    }
+
+
+def _generate_tuberculosis_severity_scoring(rng, sizes, directory):
+    patients = _patient_ids(sizes)
+    #every severity score appears in the ground truth (they are the allowed values)
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'),
+            ('{},{},{}'.format(patient, 1 + i % 5, 1 if i % 5 < 3 else 0) for i, patient in enumerate(patients))),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'),
+            ('{},{},{}'.format(patient, rng.randint(1, 5), round(rng.random(), 4)) for patient in patients)),
+    }
+
+
+def _generate_tuberculosis_tb_type(rng, sizes, directory):
+    patients = _patient_ids(sizes)
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'),
+            ('{},{}'.format(patient, 1 + i % 5) for i, patient in enumerate(patients))),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'),
+            ('{},{}'.format(patient, rng.randint(1, 5)) for patient in patients)),
+    }
+
+
+def _generate_vqa_med(rng, sizes, directory):
+    questions = [('{}'.format(i + 1), 'synpic{:05d}'.format(i)) for i in range(sizes['questions'])]
+    return {
+        'answer_file_path': _write_lines(os.path.join(directory, 'gt.csv'),
+            ('{}\t{}\t{}'.format(qa_id, image_id, _sentence(rng, 1, 6)) for qa_id, image_id in questions)),
+        'submission_file_path': _write_lines(os.path.join(directory, 'run.csv'),
+            ('{}\t{}\t{}'.format(qa_id, image_id, _sentence(rng, 1, 6)) for qa_id, image_id in questions)),
+    }
+
+
+#challenge name => generator
+GENERATORS = {
+    'bird_monophone': _generate_bird_monophone,
+    'bird_soundscape': _generate_bird_soundscape,
+    'caption_prediction': _generate_caption_prediction,
+    'concept_detection': _generate_concept_detection,
+    'expert': _generate_expert,
+    'geo': _generate_expert,
+    'lifelog_adlt': _generate_lifelog_adlt,
+    'lifelog_lmrt': _generate_lifelog_lmrt,
+    'tuberculosis_mdr_detection': _generate_tuberculosis_mdr_detection,
+    'tuberculosis_severity_scoring': _generate_tuberculosis_severity_scoring,
+    'tuberculosis_tb_type': _generate_tuberculosis_tb_type,
+    'vqa_med': _generate_vqa_med,
+}
+
+
+"""
+Generates the ground truth and a valid runfile of a challenge in the given directory
+Returns a dict with the constructor parameters of the evaluator ('answer_file_path', ...) and 'submission_file_path'
+"""
+def generate(challenge, scale, directory, seed=0):
+    if scale not in SCALES:
+        raise Exception("Unknown scale '{}'. Possible values are: {}".format(scale, ', '.join(SCALES)))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return GENERATORS[challenge](random.Random(seed), SCALES[scale], directory)
@@ -1 +1,6 @@
-from .bird_monophone_evaluator import BirdMonophoneEvaluator
+#The evaluator module is only imported when BirdMonophoneEvaluator is accessed
+def __getattr__(name):
+    if name == 'BirdMonophoneEvaluator':
+        from .bird_monophone_evaluator import BirdMonophoneEvaluator
+        return BirdMonophoneEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
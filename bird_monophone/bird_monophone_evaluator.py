@@ -7,6 +7,18 @@ _evaluate method is called by the CrowdAI framework and returns an object holdin
 import csv
 import datetime
 
+from ..common.average_precision import sum_rank_precisions, rank_metrics, parse_rank_metric
+from ..common.class_table import ClassTable, bit_count
+from ..common.snapshot import Snapshot, is_snapshot
+from ..common.ranked_run import load_ranked_run
+from ..common.submission_reader import Column, SubmissionSchema
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
+
+
+#queries of the ground truth left out of the mAP
+EXCLUDED_QUERIES = frozenset(["8794", "28335"])
+
 
 class BirdMonophoneEvaluator:
 
@@ -19,12 +31,18 @@ class BirdMonophoneEvaluator:
                         debug_mode=False):
         #Ground truth file
         self.answer_file_path = answer_file_path
+        #Measures of the phases returned with the result (see common/telemetry.py)
+        self.debug_mode = debug_mode
 
         #allowed ids in the predictions files
         self.allowed_classes_file_path = allowed_classes_file_path
 
+        #Ground truth snapshot (if answer_file_path is a compiled snapshot)
+        self.snapshot = None
+
         #Ground truth data
-        self.gt = self.load_gt()
+        with measure_phase() as self.load_gt_measures:
+            self.gt = self.load_gt()
 
 
 
@@ -34,16 +52,27 @@ class BirdMonophoneEvaluator:
     Parameter 'submission_file_path': Path of the submitted runfile
     returns a _result_object that can contain up to 2 different scores
     """
+    @score_cached
     def _evaluate(self, client_payload, context={}):
         submission_file_path = client_payload['submission_file_path']
+        telemetry = Telemetry(self, context)
+
+        #Rank metrics computed from the correct ranks of the scores, e.g. ['top_1', 'top_5', 'mrr', 'map@10']
+        #(see common/average_precision.py)
+        rank_metric_names = context.get('rank_metrics', [])
+        for metric_name in rank_metric_names:
+            parse_rank_metric(metric_name)
+
         #Load predictions
-        predictions = self.load_predictions(submission_file_path)
+        with telemetry.phase('load_predictions'):
+            predictions = self.load_predictions(submission_file_path, context.get('parse_workers', 1))
 
         if predictions != None:
-            #Compute first score
-            rmap_foreground = self.retrieval_mean_average_precision_foreground(predictions)
-            #Compute second score
-            rmap_background = self.retrieval_mean_average_precision_background(predictions)
+            #Compute both scores in one pass
+            with telemetry.phase('retrieval_mean_average_precision'):
+                maps = self.compute_map_scores(['foreground', 'with_background'], predictions)
+            rmap_foreground = maps['foreground']
+            rmap_background = maps['with_background']
 
             #Create object that is returned to the CrowdAI framework
             # _result_object = {
@@ -54,46 +83,114 @@ class BirdMonophoneEvaluator:
                 "score": rmap_foreground,
                 "score_secondary" : rmap_background
             }
+            if rank_metric_names:
+                #e.g. {'foreground': {'top_1': ..., 'mrr': ...}, 'with_background': {...}}
+                with telemetry.phase('rank_metrics'):
+                    _result_object['rank_metrics'] = {
+                        by_type: rank_metrics(predictions[by_type]['ranks'], predictions[by_type]['gt_counts'],
+                                              rank_metric_names)
+                        for by_type in ['foreground', 'with_background']
+                    }
 
-            return _result_object
+            return telemetry.result(_result_object)
 
 
     """
     Load and return groundtruth data
     """
     def load_gt(self):
+        if is_snapshot(self.answer_file_path):
+            return self.load_gt_snapshot()
+
         gt = {}
         gt['foreground'] = {}
         gt['with_background'] = {}
 
-        allowed_classes = self.load_allowed_classes()
+        self.build_class_table()
+        allowed_classes = self.allowed_classes
+        class_table = self.class_table
 
         with open(self.answer_file_path) as csvfile:
             reader = csv.reader(csvfile, delimiter=';', quoting=csv.QUOTE_NONE)
             for row in reader:
                 query = row[0]
 
+                #bitsets of the classes (see common/class_table.py)
                 classid_foreground = row[1]
-                gt['foreground'][query] = set() #more convenient for having one score function
-                gt['foreground'][query].add(classid_foreground)
-
-                classids_all = set()
-                classids_all.add(classid_foreground)
+                gt['foreground'][query] = class_table.bits([classid_foreground]) #more convenient for having one score function
 
+                classids_all = [classid_foreground]
                 for classid_background in row[2].split(','):
                     if classid_background in allowed_classes:
-                        classids_all.add(classid_background)
-                gt['with_background'][query] = classids_all
+                        classids_all.append(classid_background)
+                gt['with_background'][query] = class_table.bits(classids_all)
 
         return gt
 
 
+    """
+    Load and return groundtruth data from a compiled snapshot (see common/snapshot.py)
+    """
+    def load_gt_snapshot(self):
+        self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+        self.build_class_table()
+        queries = self.snapshot.strings('queries').tolist()
+        classes = self.snapshot.strings('classes').tolist()
+        foreground = self.snapshot.array('foreground').tolist()
+        offsets = self.snapshot.array('with_background_offsets').tolist()
+        with_background = self.snapshot.array('with_background').tolist()
+
+        #bit of each class of the snapshot in the class table
+        class_bits = [1 << self.class_table.index(classid) for classid in classes]
+        gt = {}
+        gt['foreground'] = {}
+        gt['with_background'] = {}
+        for i, query in enumerate(queries):
+            gt['foreground'][query] = class_bits[foreground[i]]
+            bits = 0
+            for j in with_background[offsets[i]:offsets[i + 1]]:
+                bits |= class_bits[j]
+            gt['with_background'][query] = bits
+
+        return gt
+
+
+    """
+    Return the sections of the groundtruth snapshot (see common/snapshot.py)
+    """
+    def gt_snapshot_sections(self):
+        queries = list(self.gt['foreground'])
+        classes = []
+        class_indexes = {}
+        def class_index(classid):
+            if classid not in class_indexes:
+                class_indexes[classid] = len(classes)
+                classes.append(classid)
+            return class_indexes[classid]
+
+        foreground = []
+        offsets = [0]
+        with_background = []
+        class_ids = self.class_table.ids
+        for query in queries:
+            foreground.append(class_index(class_ids(self.gt['foreground'][query])[0]))
+            with_background.extend([class_index(classid) for classid in class_ids(self.gt['with_background'][query])])
+            offsets.append(len(with_background))
+
+        return {
+            'arrays': {'foreground': foreground, 'with_background_offsets': offsets, 'with_background': with_background},
+            'strings': {'queries': queries, 'classes': classes,
+                        'allowed_classes': sorted(self.allowed_classes)}
+        }
+
+
     """
     Load and return allowed class ids in the predictions files
     """
     def load_allowed_classes(self):
-        #...
-        #return gt
+        if self.snapshot is not None:
+            return self.snapshot.strings('allowed_classes').as_set()
+
         allowed_classes = set()
         with open(self.allowed_classes_file_path) as f:
             for classid in f.readlines():
@@ -101,6 +198,16 @@ class BirdMonophoneEvaluator:
         return allowed_classes
 
 
+    """
+    Loads the allowed class ids once and interns them (see common/class_table.py):
+    'allowed_classes': frozenset of the class ids allowed in the runfiles
+    'class_table': ClassTable of the allowed classes, the other classes of the ground truth being appended
+    """
+    def build_class_table(self):
+        self.allowed_classes = frozenset(self.load_allowed_classes())
+        self.class_table = ClassTable(self.allowed_classes)
+
+
     """
     Loads and returns a predictions object (dictionary) that contains the submitted data that will be used in the _evaluate method
     Parameter 'submission_file_path': Path of the submitted runfile
@@ -108,95 +215,62 @@ class BirdMonophoneEvaluator:
     THE VALIDATION PART CAN BE IMPLEMENTED BY IVAN IF YOU WISH (ivan.eggel@hevs.ch)
     """
 
-    def load_predictions(self, submission_file_path):
+    def load_predictions(self, submission_file_path, parse_workers=1):
         #...
         #returns predictions
-        query_to_correct_classid_ranks = {}
-        query_to_correct_classid_ranks['foreground'] = {}
-        query_to_correct_classid_ranks['with_background'] = {}
-
         allowed_query_ids = self.gt['foreground'].keys()
-        allowed_classes = self.load_allowed_classes()
 
         max_rank = 100 #max nbr of classes for query_tc
 
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter=';', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
-            occured_observations = {}
-
-            for row in reader:
-                lineCnt += 1
-                if lineCnt % 100000 == 0:
-                    print(lineCnt)
-
-                if len(row) != 4:
-                    raise Exception("Wrong format: Each line must consist of a Media ID, Class ID, score and rank separated by semicolons ({}) {}"
-                        .format("<MediaId>;<ClassId>;<Score>;<Rank>", self.line_nbr_string(lineCnt)))
-
-                query_id = row[0]
-
-                if query_id not in allowed_query_ids:
-                    raise Exception("MediaID '{}' in submission file does not exist in testset {}"
-                        .format(query_id, self.line_nbr_string(lineCnt)))
-
-                class_id = row[1]
+        schema = SubmissionSchema([
+                # Media ID not in testset => Error
+                Column(0, allowed=allowed_query_ids,
+                    error="MediaID '{value}' in submission file does not exist in testset {line}"),
                 # Class ID not in testset => Error
-                if class_id not in allowed_classes:
-                    raise Exception("'{}' is not a valid class ID {}"
-                        .format(class_id, self.line_nbr_string(lineCnt)))
-
-
+                self.class_table.column(1,
+                    error="'{value}' is not a valid class ID {line}"),
                 # 3rd value in line is not a number  => Error
-                try:
-                    probability = float(row[2])
-                    if probability < 0 or probability > 1:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("Score must be a probability between 0 and 1 {}"
-                        .format(self.line_nbr_string(lineCnt)))
-
+                Column(2, parse=float, min_value=0, max_value=1,
+                    error="Score must be a probability between 0 and 1 {line}"),
                 # Rank not an int between 1 and 100 => Error
-                try:
-                    rank = int(row[3])
-                    if rank < 1 or rank > max_rank:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("Rank 'must be an integer between 1 and {}. {}"
-                        .format(max_rank, self.line_nbr_string(lineCnt)))
-
-
-                values_for_observation = occured_observations.get(query_id,list())
-                class_ids_for_observation = [tup[0] for tup in values_for_observation]
+                Column(3, parse=int, min_value=1, max_value=max_rank,
+                    error="Rank 'must be an integer between 1 and " + str(max_rank) + ". {line}")
+            ],
+            delimiter=';',
+            min_fields=4,
+            arity_error="Wrong format: Each line must consist of a Media ID, Class ID, score and rank separated by semicolons (<MediaId>;<ClassId>;<Score>;<Rank>) {line}")
 
-                # Same query_id combined with class_id present more than once => Error
-                if class_id in class_ids_for_observation:
-                    raise Exception("Same prediction (query_id;class_id) present more than once ({};{}) {}"
-                        .format(query_id, class_id, self.line_nbr_string(lineCnt)))
+        #The ranks of a query are checked in rank order, then in the order of the runfile
+        correct_classes = {'foreground': self.gt['foreground'], 'with_background': self.gt['with_background']}
+        index = load_ranked_run(submission_file_path, schema, correct_classes, self.class_table,
+                                sort_key=lambda tup: (tup[2]), workers=parse_workers)
+        return self.correct_rank_arrays(index['correct_ranks'])
 
-                #add tuple to observations
-                values_for_observation.append((class_id, probability, rank, lineCnt))
-                occured_observations[query_id] = values_for_observation
 
-                #add to dict. this dict will be returned by the function later
-                for focus in ['foreground','with_background']:
-                    if class_id in self.gt[focus][query_id]:
-                        if not query_id in query_to_correct_classid_ranks[focus]:
-                            query_to_correct_classid_ranks[focus][query_id] = set()
-                        query_to_correct_classid_ranks[focus][query_id].add(rank)
-
-            for q_id in occured_observations:
-                # Sort by rank (tup[2])
-                values_sorted = sorted(occured_observations[q_id], key=lambda tup: (tup[2]))
-                last_rank = 0
-                for curr_class_id, curr_probability, curr_rank, curr_line in values_sorted:
-                    #Ranking for media_id not consecutive => Error
-                    if curr_rank != (last_rank+1):
-                        raise Exception("Ranking must be consecutive {}"
-                            .format(self.line_nbr_string(curr_line)))
-                    last_rank = curr_rank
-
-        return query_to_correct_classid_ranks
+    """
+    Returns the predictions object: for each type of ground truth ('foreground', 'with_background'),
+    'ranks': padded array of the correct ranks of each query of the ground truth in increasing order (see
+             common/average_precision.py), the first column being the first correct rank (0 => no correct rank)
+    'gt_counts': nbr of ground truth classes of each query
+    The excluded queries are left out
+    Parameter 'correct_ranks': type of ground truth => query id => set of the correct ranks
+    """
+    def correct_rank_arrays(self, correct_ranks):
+        import numpy as np
+        predictions = {}
+        for by_type in ['foreground', 'with_background']:
+            queries = [query for query in self.gt[by_type] if query not in EXCLUDED_QUERIES]
+            ranks_of_queries = correct_ranks[by_type]
+            width = max([len(ranks_of_queries.get(query, ())) for query in queries] or [0])
+            #ranks <= 100
+            padded_ranks = np.zeros((len(queries), width), dtype=np.int16)
+            for i, query in enumerate(queries):
+                ranks = ranks_of_queries.get(query)
+                if ranks:
+                    padded_ranks[i, :len(ranks)] = sorted(ranks)
+            gt_counts = np.array([bit_count(self.gt[by_type][query]) for query in queries], dtype=np.float64)
+            predictions[by_type] = {'ranks': padded_ranks, 'gt_counts': gt_counts}
+        return predictions
 
 
 
@@ -212,8 +286,8 @@ class BirdMonophoneEvaluator:
     We assume that the predictions in the parameter are valid
     Valiation should be handled in the load_predictions method
     """
-    def retrieval_mean_average_precision_foreground(self, query_to_correct_classid_ranks):
-        return self.compute_map_score('foreground', query_to_correct_classid_ranks)
+    def retrieval_mean_average_precision_foreground(self, predictions):
+        return self.compute_map_score('foreground', predictions)
 
 
     """
@@ -223,32 +297,35 @@ class BirdMonophoneEvaluator:
     We assume that the predictions in the parameter are valid
     Valiation should be handled in the load_predictions method
     """
-    def retrieval_mean_average_precision_background(self, query_to_correct_classid_ranks):
-        return self.compute_map_score('with_background', query_to_correct_classid_ranks)
-
-
-    def compute_map_score(self, by_type, query_to_correct_classid_ranks):
-        
-        excluded = set(["8794","28335"])
-        map = 0.0
+    def retrieval_mean_average_precision_background(self, predictions):
+        return self.compute_map_score('with_background', predictions)
 
-        for query in self.gt[by_type]:
-            if query not in excluded:
-                ap = 0.0
-                count_relevant = 0
 
-                if query in query_to_correct_classid_ranks[by_type]:
-                    correct_ranks = query_to_correct_classid_ranks[by_type][query]
-                    for rank in correct_ranks:
-                        count_relevant += 1
-                        ap +=  float(count_relevant) / float(rank)
+    def compute_map_score(self, by_type, predictions):
+        return self.compute_map_scores([by_type], predictions)[by_type]
 
-                ap = ap / float(len(self.gt[by_type][query]))
-                map += ap
 
-        map =  map / float (len(self.gt[by_type]) - len(excluded))
-
-        return map
+    """
+    Returns the mAP of each type of ground truth ('foreground', 'with_background'), the correct ranks of all the
+    types being scored in one single array
+    """
+    def compute_map_scores(self, by_types, predictions):
+        import numpy as np
+        arrays = [(predictions[by_type]['ranks'], predictions[by_type]['gt_counts']) for by_type in by_types]
+        width = max([padded_ranks.shape[1] for padded_ranks, gt_counts in arrays] or [0])
+        sums = sum_rank_precisions(np.concatenate(
+            [np.pad(padded_ranks, ((0, 0), (0, width - padded_ranks.shape[1])), 'constant')
+             for padded_ranks, gt_counts in arrays]))
+
+        maps = {}
+        start = 0
+        for by_type, (padded_ranks, gt_counts) in zip(by_types, arrays):
+            average_precisions = sums[start:start + len(gt_counts)] / gt_counts
+            start += len(gt_counts)
+            #added in ground truth order, as in a Python loop
+            total = float(np.cumsum(average_precisions)[-1]) if len(gt_counts) > 0 else 0.0
+            maps[by_type] = total / float(len(self.gt[by_type]) - len(EXCLUDED_QUERIES))
+        return maps
 
 """
 Test evaluation a runfile
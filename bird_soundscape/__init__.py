@@ -1 +1,6 @@
-from .bird_soundscape_evaluator import BirdSoundscapeEvaluator
+#The evaluator module is only imported when BirdSoundscapeEvaluator is accessed
+def __getattr__(name):
+    if name == 'BirdSoundscapeEvaluator':
+        from .bird_soundscape_evaluator import BirdSoundscapeEvaluator
+        return BirdSoundscapeEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
@@ -4,10 +4,22 @@ Evaluates one single runfile
 _evaluate method is called by the CrowdAI framework and returns an object holding up to 2 different scores
 """
 
+import array
+import bisect
 import csv
 import datetime
+import functools
+import re
 from operator import itemgetter
 
+from ..common.snapshot import Snapshot, is_snapshot
+from ..common.external_sort import ExternalSorter, DEFAULT_RUN_RECORDS
+from ..common.parallel_parse import parse_ranges, raise_first_error
+from ..common.average_precision import sum_precisions, mean_average_precision, subset_mean_average_precisions
+from ..common.submission_reader import Column, SubmissionSchema, SubmissionReader
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
+
 
 #query and time-code to remove from the ground truth because there are some mistake (long duration)
 timecoded_soundscape_segment_to_remove = {}
@@ -19,6 +31,48 @@ timecoded_soundscape_segment_to_remove['49878'] = ['00:00:55-00:15:10']
 
 chunk_duration = 5 #seconds
 
+max_propositions = 100 #max nbr of classes for query_tc
+
+seconds_per_day = 24 * 60 * 60
+
+#A chunk (query_tc) is one int packing the index of its media (gt['media_indexes']), the format of its timecodes
+#and its index in the day (start time // chunk_duration)
+#The format is 0 for 'hh:mm:ss-hh:mm:ss', other formats accepted by the validation (one digit numbers, other digits)
+#are kept apart because they never match the ground truth
+chunk_index_bits = 15
+chunk_format_bits = 7
+
+#'hh:mm:ss-hh:mm:ss' with ASCII digits, the time intervals of most runfiles
+_fixed_width_time_interval = re.compile(r'([0-9]{2}):([0-9]{2}):([0-9]{2})-([0-9]{2}):([0-9]{2}):([0-9]{2})\Z')
+
+
+#Raised by predictions_by_media when a media comes back after the lines of other medias
+class _MediaNotGrouped(Exception):
+    pass
+
+
+#time interval 'hh:mm:ss-hh:mm:ss' => chunk, built at the first call of day_time_interval_chunks
+_day_time_interval_chunks = None
+
+
+"""
+Returns the dict time interval 'hh:mm:ss-hh:mm:ss' => chunk, for all the time intervals of the day
+The dict is built once and shared by all the evaluators: it must be copied before being modified
+"""
+def day_time_interval_chunks():
+    global _day_time_interval_chunks
+    if _day_time_interval_chunks is None:
+        time_interval_chunks = {}
+        for chunk in range(seconds_per_day // chunk_duration - 1):
+            start_seconds = chunk * chunk_duration
+            end_seconds = start_seconds + chunk_duration
+            time_interval = '{:02d}:{:02d}:{:02d}-{:02d}:{:02d}:{:02d}'.format(
+                start_seconds // 3600, start_seconds // 60 % 60, start_seconds % 60,
+                end_seconds // 3600, end_seconds // 60 % 60, end_seconds % 60)
+            time_interval_chunks[time_interval] = chunk
+        _day_time_interval_chunks = time_interval_chunks
+    return _day_time_interval_chunks
+
 
 
 class BirdSoundscapeEvaluator:
@@ -32,13 +86,25 @@ class BirdSoundscapeEvaluator:
                         debug_mode=False):
         #Ground truth file
         self.answer_file_path = answer_file_path
-
-        #Ground truth data
-        self.gt = self.load_gt()
+        #Measures of the phases returned with the result (see common/telemetry.py)
+        self.debug_mode = debug_mode
 
         #allowed ids in the predictions files
         self.allowed_classes_file_path = allowed_classes_file_path
 
+        #Ground truth snapshot (if answer_file_path is a compiled snapshot)
+        self.snapshot = None
+
+        #Ground truth data
+        with measure_phase() as self.load_gt_measures:
+            self.gt = self.load_gt()
+
+        #resolution => ground truth windows (see gt_windows)
+        self.gt_windows_cache = {}
+
+        #Lookup tables of the validation of the runfiles, built once for all the evaluations
+        self.build_validation_tables()
+
 
 
     """
@@ -46,17 +112,51 @@ class BirdSoundscapeEvaluator:
     Parameter 'submission_file_path': Path of the submitted runfile
     returns a _result_object that can contain up to 2 different scores
     """
+    @score_cached
     def _evaluate(self, client_payload, context={}):
         print("Processing in side evaluator....")
         submission_file_path = client_payload['submission_file_path']
+        telemetry = Telemetry(self, context)
+
+        #Scores per country and per media, computed with the scores (see compute_map_breakdowns)
+        breakdowns = context.get('breakdowns', False)
+        #Scores at other resolutions than chunk_duration, in seconds (see compute_resolution_map_scores)
+        resolutions = context.get('resolutions', [])
+        #Nbr of processes sharing the classes and the chunks of the mAPs
+        score_workers = context.get('score_workers', 1)
+
+        #Scores computed with the predictions of one media at a time in memory (see streaming_statistics),
+        #the breakdowns and the other resolutions need all the predictions
+        if context.get('streaming', False) and not breakdowns and not resolutions:
+            with telemetry.phase('streaming_statistics'):
+                statistics = self.streaming_statistics(submission_file_path, context.get('streaming_sort_dir'),
+                                                       context.get('streaming_run_records', DEFAULT_RUN_RECORDS))
+            with telemetry.phase('classification_mean_average_precision'):
+                cmap = self.streaming_classification_map(submission_file_path, statistics)
+            with telemetry.phase('retrieval_mean_average_precision'):
+                rmap = self.streaming_retrieval_map(statistics)
+            return telemetry.result({
+                "score": cmap,
+                "score_secondary" : rmap
+            })
+
         #Load predictions
-        predictions = self.load_predictions(submission_file_path)
+        with telemetry.phase('load_predictions'):
+            predictions = self.load_predictions(submission_file_path, context.get('parse_workers', 1))
 
         if predictions != None:
             #Compute first score
-            cmap = self.classification_mean_average_precision(predictions)
+            with telemetry.phase('classification_mean_average_precision'):
+                if breakdowns:
+                    cmap, cmap_breakdowns = self.compute_map_breakdowns('by_class', predictions, score_workers)
+                else:
+                    cmap = self.classification_mean_average_precision(predictions, score_workers)
             #Compute second score
-            rmap = self.retrieval_mean_average_precision(predictions)
+            with telemetry.phase('retrieval_mean_average_precision'):
+                if breakdowns:
+                    rmap, rmap_breakdowns = self.compute_map_breakdowns('by_query', predictions, score_workers)
+                else:
+                    rmap = self.retrieval_mean_average_precision(predictions, score_workers)
 
             #Create object that is returned to the CrowdAI framework
             # _result_object = {
@@ -67,17 +167,45 @@ class BirdSoundscapeEvaluator:
                 "score": cmap,
                 "score_secondary" : rmap
             }
-
-            return _result_object
+            if breakdowns:
+                #e.g. {'country': {'FR': {'classification_map': ..., 'retrieval_map': ...}, ...}, 'media': {...}}
+                _result_object['breakdowns'] = {
+                    name: {subset: {'classification_map': cmap_breakdowns[name][subset],
+                                    'retrieval_map': rmap_breakdowns[name][subset]}
+                           for subset in cmap_breakdowns[name]}
+                    for name in cmap_breakdowns
+                }
+            if resolutions:
+                #e.g. {'30': {'classification_map': ..., 'retrieval_map': ...}}
+                _result_object['resolutions'] = {}
+                for resolution in resolutions:
+                    with telemetry.phase('resolution_{}_mean_average_precision'.format(resolution)):
+                        if resolution == chunk_duration:
+                            resolution_cmap, resolution_rmap = cmap, rmap
+                        else:
+                            resolution_cmap, resolution_rmap = self.compute_resolution_map_scores(predictions, resolution)
+                    _result_object['resolutions'][str(resolution)] = {'classification_map': resolution_cmap,
+                                                                      'retrieval_map': resolution_rmap}
+
+            return telemetry.result(_result_object)
 
 
     """
     Load and return groundtruth data
     """
     def load_gt(self):
+        if is_snapshot(self.answer_file_path):
+            return self.load_gt_snapshot()
+
         gt = {}
         gt['by_class'] = {}
         gt['by_query'] = {}
+        #media id => index of the media in the chunks
+        gt['media_indexes'] = {}
+        #media id => country of the recording
+        gt['media_countries'] = {}
+        #media id => sorted (start second, end second, class id) of its segments in the day (see gt_windows)
+        gt['segments'] = {}
 
         with open(self.answer_file_path) as csvfile:
             reader = csv.reader(csvfile, delimiter=';', quoting=csv.QUOTE_NONE)
@@ -85,7 +213,8 @@ class BirdSoundscapeEvaluator:
                 query = row[0]
                 classid = row[1]
                 timecodes = row[2]
-                #country = row[3]
+                if len(row) > 3:
+                    gt['media_countries'].setdefault(query, row[3])
 
                 timecoded_query_split_into_chunks = []
                 timecode_not_excluded = True
@@ -94,10 +223,17 @@ class BirdSoundscapeEvaluator:
                         timecode_not_excluded = False
 
                 if timecode_not_excluded:
-                    chunks = self.timecodes_to_chunks(timecodes, chunk_duration)
+                    chunks = self.timecodes_to_chunk_indexes(timecodes, chunk_duration)
+
+                    #The segments without chunks (duration 0 at a chunk boundary) are not in the ground truth
+                    if chunks:
+                        for segment in self.day_segments(*self.timecodes_to_seconds(timecodes)):
+                            gt['segments'].setdefault(query, []).append(segment + (classid,))
 
                     for chunk in chunks:
-                        query_tc = query + '_' + chunk
+                        if not query in gt['media_indexes']:
+                            gt['media_indexes'][query] = len(gt['media_indexes'])
+                        query_tc = self.chunk_key(gt['media_indexes'][query], chunk)
 
                         if not classid in gt['by_class']:
                             gt['by_class'][classid] = set()
@@ -107,54 +243,185 @@ class BirdSoundscapeEvaluator:
                             gt['by_query'][query_tc] = set()
                         gt['by_query'][query_tc].add(classid)
 
+        for segments in gt['segments'].values():
+            segments.sort()
         return gt
 
 
-    def timecodes_to_chunks(self, tcs, second_base):
-        resolution=datetime.timedelta(seconds=second_base)
-        chunk_duration=datetime.timedelta(hours=0,minutes=0,seconds=second_base)
+    """
+    Load and return groundtruth data from a compiled snapshot (see common/snapshot.py)
+    """
+    def load_gt_snapshot(self):
+        self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+        classes = self.snapshot.strings('classes').tolist()
+
+        gt = {}
+        #The chunks are stored as their int keys (see chunk_key), snapshots compiled before store them as
+        #'mediaId_hh:mm:ss-hh:mm:ss' strings
+        if 'query_tc_keys' in self.snapshot:
+            gt['media_indexes'] = {query: i for i, query in enumerate(self.snapshot.strings('medias'))}
+            query_tcs = self.snapshot.array('query_tc_keys').tolist()
+        else:
+            gt['media_indexes'] = {}
+            query_tcs = []
+            for query_tc in self.snapshot.strings('query_tcs'):
+                query, timecodes = query_tc.split('_', 1)
+                if not query in gt['media_indexes']:
+                    gt['media_indexes'][query] = len(gt['media_indexes'])
+                query_tcs.append(self.chunk_key(gt['media_indexes'][query], self.time_interval_chunk(timecodes)))
+
+        #Snapshots compiled without the countries have no breakdown by country
+        gt['media_countries'] = {}
+        if 'media_countries' in self.snapshot:
+            for query, country in zip(gt['media_indexes'], self.snapshot.strings('media_countries')):
+                if country:
+                    gt['media_countries'][query] = country
+
+        gt['by_class'] = {classid: set() for classid in classes}
+        gt['by_query'] = {query_tc: set() for query_tc in query_tcs}
+
+        pair_classes = self.snapshot.array('pair_class').tolist()
+        pair_query_tcs = self.snapshot.array('pair_query_tc').tolist()
+        for class_index, query_tc_index in zip(pair_classes, pair_query_tcs):
+            gt['by_class'][classes[class_index]].add(query_tcs[query_tc_index])
+            gt['by_query'][query_tcs[query_tc_index]].add(classes[class_index])
+
+        #Snapshots compiled without the segments => segments of the chunks (same windows at resolutions multiple of
+        #chunk_duration)
+        gt['segments'] = {}
+        if 'segment_queries' in self.snapshot:
+            segments = zip(self.snapshot.strings('segment_queries'), self.snapshot.array('segment_starts').tolist(),
+                           self.snapshot.array('segment_ends').tolist(), self.snapshot.strings('segment_classes'))
+            for query, start, end, classid in segments:
+                gt['segments'].setdefault(query, []).append((int(start), int(end), classid))
+        else:
+            medias = list(gt['media_indexes'])
+            for classid, query_tcs_of_class in gt['by_class'].items():
+                for query_tc in query_tcs_of_class:
+                    start = (query_tc & ((1 << chunk_index_bits) - 1)) * chunk_duration
+                    query = medias[query_tc >> (chunk_format_bits + chunk_index_bits)]
+                    gt['segments'].setdefault(query, []).append((start, start + chunk_duration, classid))
+            for segments in gt['segments'].values():
+                segments.sort()
+
+        return gt
 
-        tcstart = tcs.split('-')[0]
-        tcend = tcs.split('-')[1]
 
-        hs = int(tcstart.split(':')[0])
-        ms = int(tcstart.split(':')[1])
-        ss = int(tcstart.split(':')[2])
-        hmss=datetime.timedelta(hours=hs,minutes=ms,seconds=ss)
-        modulos = datetime.timedelta(seconds=hmss.seconds%resolution.seconds)
-        tcstartrounded= hmss - modulos
-
-        he = int(tcend.split(':')[0])
-        me = int(tcend.split(':')[1])
-        se = int(tcend.split(':')[2])
-        hmse=datetime.timedelta(hours=he,minutes=me,seconds=(se))
-        hmse_extended = hmse + chunk_duration
-        moduloe = datetime.timedelta(seconds=hmse_extended.seconds%resolution.seconds)
-        tcendrounded = hmse_extended - moduloe
+    """
+    Return the sections of the groundtruth snapshot (see common/snapshot.py)
+    """
+    def gt_snapshot_sections(self):
+        #Keep the order of the ground truth dicts (order of the mAP sums)
+        classes = list(self.gt['by_class'])
+        query_tcs = list(self.gt['by_query'])
+        query_tc_indexes = {query_tc: i for i, query_tc in enumerate(query_tcs)}
+
+        pair_classes = []
+        pair_query_tcs = []
+        for class_index, classid in enumerate(classes):
+            for query_tc in self.gt['by_class'][classid]:
+                pair_classes.append(class_index)
+                pair_query_tcs.append(query_tc_indexes[query_tc])
+
+        segments = [(query,) + segment for query, segments_of_query in self.gt['segments'].items() for segment in segments_of_query]
+
+        return {
+            'arrays': {'pair_class': pair_classes, 'pair_query_tc': pair_query_tcs, 'query_tc_keys': query_tcs,
+                       'segment_starts': [segment[1] for segment in segments],
+                       'segment_ends': [segment[2] for segment in segments]},
+            'strings': {'classes': classes, 'medias': list(self.gt['media_indexes']),
+                        'allowed_classes': sorted(self.allowed_classes),
+                        'media_countries': [self.gt['media_countries'].get(query, '') for query in self.gt['media_indexes']],
+                        'segment_queries': [segment[0] for segment in segments],
+                        'segment_classes': [segment[3] for segment in segments]}
+        }
+
+
+    """
+    Returns the indexes in the day of the chunks overlapping a ground truth segment 'hh:mm:ss-hh:mm:ss'
+    The chunks of a segment going over midnight continue at the start of the day
+    """
+    def timecodes_to_chunk_indexes(self, tcs, second_base):
+        hmss, hmse = self.timecodes_to_seconds(tcs)
+        tcstartrounded = hmss - hmss % second_base
+        tcendrounded = hmse + second_base - hmse % second_base
 
         chunks = []
         current_s = tcstartrounded
-        current_e = current_s + chunk_duration
-        while(current_e  <= tcendrounded and current_s < hmse):
-            start_seconds = current_s.total_seconds()
-            formated_start = datetime.datetime.utcfromtimestamp(start_seconds).strftime("%H:%M:%S")
-
-            end_seconds = current_e.total_seconds()
-            formated_end = datetime.datetime.utcfromtimestamp(end_seconds).strftime("%H:%M:%S")
-            chunk = formated_start+'-'+formated_end
-            chunks.append(chunk)
-            current_e += chunk_duration
-            current_s += chunk_duration
+        while(current_s + second_base <= tcendrounded and current_s < hmse):
+            chunks.append(current_s % seconds_per_day // second_base)
+            current_s += second_base
 
         return chunks
 
 
+    """
+    Returns the (start, end) seconds of a ground truth segment 'hh:mm:ss-hh:mm:ss'
+    """
+    def timecodes_to_seconds(self, tcs):
+        tcstart = tcs.split('-')[0]
+        tcend = tcs.split('-')[1]
+
+        hs, ms, ss = [int(token) for token in tcstart.split(':')]
+        he, me, se = [int(token) for token in tcend.split(':')]
+        return hs * 3600 + ms * 60 + ss, he * 3600 + me * 60 + se
+
+
+    """
+    Returns the list of (start, end) seconds in the day of a segment, a segment going over midnight is split in 2
+    """
+    def day_segments(self, start, end):
+        shift = start - start % seconds_per_day
+        start -= shift
+        end -= shift
+        segments = []
+        while end > seconds_per_day:
+            segments.append((start, seconds_per_day))
+            start, end = 0, end - seconds_per_day
+        segments.append((start, end))
+        return segments
+
+
+    """
+    Returns the chunk (format and index in the day) of a valid time interval of a runfile
+    """
+    def time_interval_chunk(self, time_interval):
+        tokens = time_interval.replace('-', ':').split(':')
+        chunk_format = 0
+        for i, token in enumerate(tokens):
+            if len(token) == 1:
+                chunk_format |= 1 << i
+        if not all(['0' <= character <= '9' for character in time_interval if character not in ':-']):
+            chunk_format |= 1 << len(tokens)
+        start_seconds = int(tokens[0]) * 3600 + int(tokens[1]) * 60 + int(tokens[2])
+        return (chunk_format << chunk_index_bits) | (start_seconds // chunk_duration)
+
+
+    def chunk_key(self, media_index, chunk):
+        return (media_index << (chunk_format_bits + chunk_index_bits)) | chunk
+
+
+    """
+    Returns the string 'mediaId_hh:mm:ss-hh:mm:ss' of a chunk, used in the error messages
+    """
+    def chunk_string(self, query_tc):
+        medias = list(self.gt['media_indexes'])
+        chunk_format = (query_tc >> chunk_index_bits) & ((1 << chunk_format_bits) - 1)
+        start_seconds = (query_tc & ((1 << chunk_index_bits) - 1)) * chunk_duration
+        end_seconds = (start_seconds + chunk_duration) % seconds_per_day
+        numbers = [start_seconds // 3600, start_seconds // 60 % 60, start_seconds % 60,
+                   end_seconds // 3600, end_seconds // 60 % 60, end_seconds % 60]
+        tokens = [('{}' if chunk_format & (1 << i) else '{:02d}').format(number) for i, number in enumerate(numbers)]
+        return '{}_{}:{}:{}-{}:{}:{}'.format(medias[query_tc >> (chunk_format_bits + chunk_index_bits)], *tokens)
+
+
     """
     Load and return allowed class ids in the predictions files
     """
     def load_allowed_classes(self):
-        #...
-        #return gt
+        if self.snapshot is not None:
+            return self.snapshot.strings('allowed_classes').as_set()
+
         allowed_classes = set()
         with open(self.allowed_classes_file_path) as f:
             for classid in f.readlines():
@@ -162,6 +429,28 @@ class BirdSoundscapeEvaluator:
         return allowed_classes
 
 
+    """
+    Builds the lookup tables of the validation of the runfiles:
+    'allowed_classes': frozenset of the class ids allowed in the runfiles
+    'class_ids': tuple of the class ids, the classes of the ground truth first (in ground truth order), 'class_indexes':
+                 class id => index of the class in the predictions
+    'gt_pairs': frozenset of the (chunk << class_index_bits | class index) of the ground truth, i.e. of the correct predictions
+    'day_time_interval_chunks': time interval 'hh:mm:ss-hh:mm:ss' => chunk, for all the time intervals of the day
+                                (shared by all the evaluators, see day_time_interval_chunks)
+    """
+    def build_validation_tables(self):
+        self.allowed_classes = frozenset(self.load_allowed_classes())
+        self.class_ids = tuple(list(self.gt['by_class']) + sorted(self.allowed_classes.difference(self.gt['by_class'])))
+        self.class_indexes = {class_id: i for i, class_id in enumerate(self.class_ids)}
+
+        self.class_index_bits = max(len(self.class_ids) - 1, 0).bit_length()
+        self.gt_pairs = frozenset([(query_tc << self.class_index_bits) | class_index
+                                   for class_index, query_tcs in enumerate(self.gt['by_class'].values())
+                                   for query_tc in query_tcs])
+
+        self.day_time_interval_chunks = day_time_interval_chunks()
+
+
     """
     Loads and returns a predictions object (dictionary) that contains the submitted data that will be used in the _evaluate method
     Parameter 'submission_file_path': Path of the submitted runfile
@@ -169,103 +458,360 @@ class BirdSoundscapeEvaluator:
     THE VALIDATION PART CAN BE IMPLEMENTED BY IVAN IF YOU WISH (ivan.eggel@hevs.ch)
     """
 
-    def load_predictions(self, submission_file_path):
+    def load_predictions(self, submission_file_path, parse_workers=1):
         #...
         #returns predictions
-        class_to_querytc_score_list = {}
-        querytc_to_classid_score_list = {}
-        predictions = {}
-        predictions['by_class'] = class_to_querytc_score_list
-        predictions['by_query'] = querytc_to_classid_score_list
-
-
-        allowed_query_tcs = self.gt['by_query'].keys()
+        #time interval => chunk, each distinct time interval is only checked once
+        time_interval_chunks = dict(self.day_time_interval_chunks)
+        schema = self.predictions_schema(time_interval_chunks)
+
+        #The line nbrs of the predictions are only needed to merge the ranges parsed in parallel
+        parse_range = functools.partial(self.parse_predictions_range, time_interval_chunks=time_interval_chunks,
+                                        keep_line_nbrs=parse_workers > 1)
+        ranges = parse_ranges(submission_file_path, schema, parse_range, parse_workers)
+        predictions = self.merge_predictions_ranges(ranges)
+        predictions['class_ids'] = self.class_ids
+        return predictions
 
-        allowed_query_ids = set([query_tc.split('_')[0] for query_tc in allowed_query_tcs])
 
-        allowed_classes = self.load_allowed_classes()
+    """
+    Returns the SubmissionSchema of the runfiles
+    Parameter 'time_interval_chunks': dict filled with time interval => chunk while the runfile is read
+    """
+    def predictions_schema(self, time_interval_chunks):
+        allowed_query_ids = self.gt['media_indexes']
 
-        max_propositions = 100 #max nbr of classes for query_tc
+        def check_time_interval(time_interval, lineCnt):
+            if not time_interval in time_interval_chunks:
+                time_interval_chunks[time_interval] = self.parse_time_interval(time_interval, lineCnt)
 
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter=';', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
+        schema = SubmissionSchema([
+                #Check time interval => Errors are thrown in check_time_interval method
+                Column(1, check=check_time_interval),
+                # Media ID not in testset => Error
+                Column(0, allowed=allowed_query_ids,
+                    error="MediaID '{value}' in submission file does not exist in testset {line}"),
+                # Class ID not in testset => Error
+                Column(2, allowed=self.allowed_classes,
+                    error="'{value}' is not a valid class ID {line}"),
+                # 4th value in line is not a number or not between 0 and 1 => Error
+                Column(3, parse=float, min_value=0, max_value=1,
+                    error="Score must be a probability between 0 and 1 {line}")
+            ],
+            delimiter=';',
+            min_fields=4,
+            arity_error="Wrong format: Each line must consist of a Media ID, TimeCodeStart-TimeCodeEnd, class ID, probability separated by semicolons (<MediaId>;<TimeCodeStart-TimeCodeEnd><ClassId><Probability>) {line}")
 
-            for row in reader:
-                lineCnt += 1
+        return schema
 
-                if len(row) != 4:
-                    raise Exception("Wrong format: Each line must consist of a Media ID, TimeCodeStart-TimeCodeEnd, class ID, probability separated by semicolons ({}) {}"
-                        .format("<MediaId>;<TimeCodeStart-TimeCodeEnd><ClassId><Probability>", self.line_nbr_string(lineCnt)))
 
-                query_id = row[0]
+    """
+    Fills 'partial' with the predictions of the lines yielded by 'reader', as typed columns (one item per line):
+    index of the class, chunk, score and correctness
+    A chunk with a class predicted twice or with more than 100 propositions in the lines => Error
+    """
+    def parse_predictions_range(self, reader, partial, time_interval_chunks, keep_line_nbrs=False):
+        classes = partial['classes'] = array.array('i')
+        query_tcs = partial['chunks'] = array.array('q')
+        scores = partial['scores'] = array.array('d')
+        correct = partial['correct'] = array.array('b')
+        #chunk => bitset of the indexes of its predicted classes, nbr of predictions
+        querytc_class_bits = partial['chunk_class_bits'] = {}
+        querytc_counts = partial['chunk_counts'] = {}
+        #chunk => (class index, line nbr) of its predictions
+        querytc_propositions = partial['chunk_propositions'] = {}
+        media_indexes = self.gt['media_indexes']
+        class_indexes = self.class_indexes
+        gt_pairs = self.gt_pairs
+        class_index_bits = self.class_index_bits
+
+        for lineCnt, (query_id, timecodes, class_id, probability) in reader:
+            query_tc = self.chunk_key(media_indexes[query_id], time_interval_chunks[timecodes])
+            class_index = class_indexes[class_id]
+
+            class_bits = querytc_class_bits.get(query_tc, 0)
+            if (class_bits >> class_index) & 1:
+                raise Exception("Prediction for chunk {} already exists, {}"
+                    .format(query_id + '_' + timecodes, self.line_nbr_string(lineCnt)))
+            querytc_class_bits[query_tc] = class_bits | (1 << class_index)
+            count = querytc_counts[query_tc] = querytc_counts.get(query_tc, 0) + 1
+
+            #for managing equiproba cases later
+            correct_prediction = 1 if ((query_tc << class_index_bits) | class_index) in gt_pairs else 0
+
+            classes.append(class_index)
+            query_tcs.append(query_tc)
+            scores.append(probability)
+            correct.append(correct_prediction)
+            if keep_line_nbrs:
+                querytc_propositions.setdefault(query_tc, []).append((class_index, lineCnt))
+
+            if count > max_propositions:
+                raise Exception("There are more than 100 propositions for chunck {}, {}"
+                    .format(query_id + '_' + timecodes, self.line_nbr_string(lineCnt)))
 
-                timecodes = row[1]
-                #Check time interval => Errors are thrown in check_time_interval method
-                self.check_time_interval(timecodes, lineCnt)
 
-                # Media ID not in testset => Error
-                if query_id not in allowed_query_ids:
-                    raise Exception("MediaID '{}' in submission file does not exist in testset {}"
-                        .format(query_id, self.line_nbr_string(lineCnt)))
+    """
+    Merges the predictions of the ranges of the runfile (see common/parallel_parse.py) in file order
+    The duplicates and the max nbr of propositions are checked again for the chunks predicted in several ranges
+    Returns the predictions object: numpy columns 'classes', 'chunks', 'scores' and 'correct', one item per line
+    """
+    def merge_predictions_ranges(self, ranges):
+        import numpy as np
+        querytc_class_bits = {}
+        querytc_counts = {}
+
+        errors = []
+        for partial, range_error in ranges:
+            for query_tc, count in partial['chunk_counts'].items():
+                if not query_tc in querytc_counts:
+                    querytc_class_bits[query_tc] = partial['chunk_class_bits'][query_tc]
+                    querytc_counts[query_tc] = count
+                    continue
+
+                class_bits = querytc_class_bits[query_tc]
+                count = querytc_counts[query_tc]
+                for class_index, lineCnt in partial['chunk_propositions'][query_tc]:
+                    if (class_bits >> class_index) & 1:
+                        errors.append((lineCnt, "Prediction for chunk {} already exists, {}"
+                            .format(self.chunk_string(query_tc), self.line_nbr_string(lineCnt))))
+                        break
+                    class_bits |= 1 << class_index
+                    count += 1
+                    if count > max_propositions:
+                        errors.append((lineCnt, "There are more than 100 propositions for chunck {}, {}"
+                            .format(self.chunk_string(query_tc), self.line_nbr_string(lineCnt))))
+                        break
+                querytc_class_bits[query_tc] = class_bits
+                querytc_counts[query_tc] = count
+
+            #The lines of the next ranges come after the errors of this range
+            if range_error is not None:
+                errors.append(range_error)
+            raise_first_error(errors)
 
-                query_tc = query_id + '_' + timecodes
+        predictions = {}
+        for column, dtype in [('classes', np.int32), ('chunks', np.int64), ('scores', np.float64), ('correct', bool)]:
+            #The columns of one single range are used without copy
+            arrays = [np.frombuffer(partial[column], dtype) if len(partial[column]) else np.zeros(0, dtype)
+                      for partial, range_error in ranges]
+            predictions[column] = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+        return predictions
 
-                class_id = row[2]
-                # Class ID not in testset => Error
-                if class_id not in allowed_classes:
-                    raise Exception("'{}' is not a valid class ID {}"
-                        .format(class_id, self.line_nbr_string(lineCnt)))
 
+    """
+    Streaming evaluation (context['streaming']): the scores are computed without keeping the whole runfile in memory,
+    only the predictions of one media at a time
+    1st pass (streaming_statistics): the predictions are read grouped by media and checked, the AP of the chunks of
+    each media is computed and only the correct predictions of each class are kept
+    2nd pass (streaming_classification_map): the runfile is read again to count the predictions ranked before each
+    correct prediction of its class
+    The scores are the same floats as the ones of classification_ and retrieval_mean_average_precision
+    Parameter 'sort_dir': directory of the temporary files of the external sort, used if the runfile is not grouped by media
+    Parameter 'run_records': nbr of predictions sorted in memory by the external sort
+    """
+    def streaming_statistics(self, submission_file_path, sort_dir=None, run_records=DEFAULT_RUN_RECORDS):
+        try:
+            return self.media_block_statistics(submission_file_path)
+        except _MediaNotGrouped:
+            #(media index, line nbr, chunk, class index, score, correct) sorted by media then by line
+            with ExternalSorter('<qqqqdb', itemgetter(0, 1), run_records, sort_dir) as sorter:
+                return self.media_block_statistics(submission_file_path, sorter)
 
-                # 4th value in line is not a number or not between 0 and 1 => Error
-                try:
-                    probability = float(row[3])
-                    if probability < 0 or probability > 1:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("Score must be a probability between 0 and 1 {}"
-                        .format(self.line_nbr_string(lineCnt)))
 
+    """
+    1st pass of the streaming evaluation, the runfile is read in its order if sorter is None, else sorted by media with 'sorter'
+    Returns the statistics: 'chunk_sums' (sum of the precisions of each chunk of the ground truth, as in
+    sum_precisions) and 'correct_keys' (sorted (score, 1, line nbr) of the correct predictions of each class of the
+    ground truth), or 'predictions' (load_predictions) if a score is NaN
+    """
+    def media_block_statistics(self, submission_file_path, sorter=None):
+        import numpy as np
+        time_interval_chunks = dict(self.day_time_interval_chunks)
+        schema = self.predictions_schema(time_interval_chunks)
+        gt_query_positions = {query_tc: i for i, query_tc in enumerate(self.gt['by_query'])}
+
+        statistics = {
+            'time_interval_chunks': time_interval_chunks,
+            'schema': schema,
+            'chunk_sums': np.zeros(len(gt_query_positions)),
+            'correct_keys': [[] for class_id in self.gt['by_class']]
+        }
+        correct_keys = statistics['correct_keys']
+        nbr_gt_classes = len(correct_keys)
+
+        errors = []
+        predictions = self.predictions_by_media(submission_file_path, schema, time_interval_chunks, errors, sorter)
+        for media_index, block in predictions:
+            #The duplicates and the max nbr of propositions of the chunks of a media are checked on the lines of the media
+            if not self.check_media_block(block, errors):
+                #In the order of the runfile, the next lines come after the error
+                if sorter is None:
+                    break
+                continue
+
+            groups = []
+            for lineCnt, query_tc, class_index, probability, correct_prediction in block:
+                #NaN scores pass the validation but are not ranked like sorted(), see compute_map_score
+                if probability != probability:
+                    return {'predictions': self.load_predictions(submission_file_path)}
+                groups.append(gt_query_positions.get(query_tc, -1))
+                if correct_prediction and class_index < nbr_gt_classes:
+                    correct_keys[class_index].append((probability, 1, lineCnt))
+
+            #AP of the chunks of the media, the groups are renumbered among the chunks of the media
+            groups = np.array(groups, dtype=np.int64)
+            in_gt = groups >= 0
+            positions, media_groups = np.unique(groups[in_gt], return_inverse=True)
+            scores = np.array([prediction[3] for prediction in block], dtype=np.float64)[in_gt]
+            correct = np.array([prediction[4] for prediction in block], dtype=bool)[in_gt]
+            statistics['chunk_sums'][positions] = sum_precisions(media_groups, scores, correct, len(positions))
+
+        raise_first_error(errors)
+        for keys in correct_keys:
+            keys.sort()
+        return statistics
 
 
-                querytc_score_list = []
-                if not class_id in class_to_querytc_score_list:
-                    class_to_querytc_score_list[class_id] = querytc_score_list
-                else:
-                    querytc_score_list = class_to_querytc_score_list[class_id]
+    """
+    Yields the predictions of each media: (media index, list of (line nbr, chunk, class index, score, correct)
+    in line order)
+    Parameter 'sorter': None => the predictions are yielded in the order of the runfile, _MediaNotGrouped is raised
+                        when a media comes back, else ExternalSorter sorting the predictions by media
+    The error of an invalid line is appended to 'errors' as (line nbr, message) and ends the predictions
+    """
+    def predictions_by_media(self, submission_file_path, schema, time_interval_chunks, errors, sorter=None):
+        media_indexes = self.gt['media_indexes']
+        class_indexes = self.class_indexes
+        gt_pairs = self.gt_pairs
+        class_index_bits = self.class_index_bits
+        reader = SubmissionReader(submission_file_path, schema)
+
+        def read_predictions():
+            try:
+                for lineCnt, (query_id, timecodes, class_id, probability) in reader:
+                    media_index = media_indexes[query_id]
+                    query_tc = self.chunk_key(media_index, time_interval_chunks[timecodes])
+                    class_index = class_indexes[class_id]
+                    correct_prediction = 1 if ((query_tc << class_index_bits) | class_index) in gt_pairs else 0
+                    yield media_index, lineCnt, query_tc, class_index, probability, correct_prediction
+            except Exception as e:
+                #the lines before the invalid one are still checked, one of them can hold the first error
+                errors.append((reader.line_count, str(e)))
+
+        ordered_predictions = read_predictions()
+        if sorter is not None:
+            for prediction in ordered_predictions:
+                sorter.add(prediction)
+            ordered_predictions = sorter.sorted()
+
+        finished_medias = set()
+        current_media = None
+        block = []
+        for prediction in ordered_predictions:
+            if prediction[0] != current_media:
+                if block:
+                    yield current_media, block
+                finished_medias.add(current_media)
+                current_media = prediction[0]
+                block = []
+                if current_media in finished_medias:
+                    raise _MediaNotGrouped()
+            block.append(prediction[1:])
+        if block:
+            yield current_media, block
 
-                #for managing equiproba cases later
-                correct_prediction = 0
-                if class_id in self.gt['by_class']:
-                    if query_tc in self.gt['by_class'][class_id]:
-                        correct_prediction = 1
 
-                querytc_score_list.append([query_tc, probability, correct_prediction])
+    """
+    Checks the chunks of the predictions of one media (see predictions_by_media)
+    A chunk with a class predicted twice or with more than 100 propositions => its error is appended to 'errors'
+    Returns False if a chunk is invalid
+    """
+    def check_media_block(self, block, errors):
+        querytc_class_bits = {}
+        querytc_counts = {}
+        for lineCnt, query_tc, class_index, probability, correct_prediction in block:
+            class_bits = querytc_class_bits.get(query_tc, 0)
+            if (class_bits >> class_index) & 1:
+                errors.append((lineCnt, "Prediction for chunk {} already exists, {}"
+                    .format(self.chunk_string(query_tc), self.line_nbr_string(lineCnt))))
+                return False
+            querytc_class_bits[query_tc] = class_bits | (1 << class_index)
+            count = querytc_counts[query_tc] = querytc_counts.get(query_tc, 0) + 1
+            if count > max_propositions:
+                errors.append((lineCnt, "There are more than 100 propositions for chunck {}, {}"
+                    .format(self.chunk_string(query_tc), self.line_nbr_string(lineCnt))))
+                return False
+        return True
 
 
-                classid_score_list = querytc_to_classid_score_list.get(query_tc, list())
-                occured_class_ids = [item[0] for item in classid_score_list]
-                if class_id in occured_class_ids:
-                    raise Exception("Prediction for chunk {} already exists, {}"
-                        .format(query_tc, self.line_nbr_string(lineCnt)))
+    """
+    2nd pass of the streaming evaluation: returns the classification mAP
+    The rank of a correct prediction in its class is 1 + the nbr of predictions of the class ranked before it,
+    i.e. with a greater (score, correct, line nbr) as in compute_map_score_reference
+    """
+    def streaming_classification_map(self, submission_file_path, statistics):
+        import numpy as np
+        if 'predictions' in statistics:
+            return self.classification_mean_average_precision(statistics['predictions'])
+
+        media_indexes = self.gt['media_indexes']
+        class_indexes = self.class_indexes
+        gt_pairs = self.gt_pairs
+        class_index_bits = self.class_index_bits
+        time_interval_chunks = statistics['time_interval_chunks']
+        correct_keys = statistics['correct_keys']
+        #before_counts[class index][i]: nbr of predictions ranked just before the correct predictions 0..i-1 of
+        #the class (in increasing order of key)
+        before_counts = [[0] * (len(keys) + 1) for keys in correct_keys]
+        nbr_gt_classes = len(correct_keys)
+
+        for lineCnt, (query_id, timecodes, class_id, probability) in SubmissionReader(submission_file_path, statistics['schema']):
+            class_index = class_indexes[class_id]
+            if class_index >= nbr_gt_classes or not correct_keys[class_index]:
+                continue
+            query_tc = self.chunk_key(media_indexes[query_id], time_interval_chunks[timecodes])
+            correct_prediction = 1 if ((query_tc << class_index_bits) | class_index) in gt_pairs else 0
+            before_counts[class_index][bisect.bisect_left(correct_keys[class_index], (probability, correct_prediction, lineCnt))] += 1
+
+        sums = np.zeros(nbr_gt_classes)
+        for class_index, counts in enumerate(before_counts):
+            #The correct predictions in rank order, the precisions are added in rank order
+            ranked_before = 0
+            ap = 0.0
+            for i in reversed(range(len(counts) - 1)):
+                ranked_before += counts[i + 1]
+                ap += (len(counts) - 1 - i) / (ranked_before + 1)
+            sums[class_index] = ap
+        return mean_average_precision(sums, [len(items) for items in self.gt['by_class'].values()])
 
-                #for managing equiproba cases later
-                correct_prediction = 0
-                if query_tc in self.gt['by_query']:
-                    if class_id in self.gt['by_query'][query_tc]:
-                        correct_prediction = 1
 
-                classid_score_list.append([class_id, probability, correct_prediction])
+    """
+    Returns the retrieval mAP of the statistics of the 1st pass of the streaming evaluation
+    """
+    def streaming_retrieval_map(self, statistics):
+        if 'predictions' in statistics:
+            return self.retrieval_mean_average_precision(statistics['predictions'])
+        return mean_average_precision(statistics['chunk_sums'], [len(items) for items in self.gt['by_query'].values()])
 
-                querytc_to_classid_score_list[query_tc] = classid_score_list
 
-                if len(querytc_to_classid_score_list[query_tc]) > max_propositions:
-                    raise Exception("There are more than 100 propositions for chunck {}, {}"
-                        .format(query_tc, self.line_nbr_string(lineCnt)))
 
-        return predictions
+    """
+    Checks a time interval of a runfile and returns its chunk
+    The intervals 'hh:mm:ss-hh:mm:ss' are checked with integers, the other ones (and the invalid ones) by check_time_interval
+    """
+    def parse_time_interval(self, time_interval, lineCnt):
+        match = _fixed_width_time_interval.match(time_interval)
+        if match is not None:
+            hs, ms, ss, he, me, se = [int(token) for token in match.groups()]
+            if hs < 24 and ms < 60 and ss < 60 and he < 24 and me < 60 and se < 60:
+                seconds_1 = hs * 3600 + ms * 60 + ss
+                seconds_2 = he * 3600 + me * 60 + se
+                if seconds_1 % chunk_duration == 0 and seconds_2 == seconds_1 + chunk_duration:
+                    return seconds_1 // chunk_duration
 
+        self.check_time_interval(time_interval, lineCnt)
+        return self.time_interval_chunk(time_interval)
 
 
     def check_time_interval(self, time_interval, lineCnt):
@@ -312,9 +858,10 @@ class BirdSoundscapeEvaluator:
     NO VALIDATION OF THE RUNFILE SHOULD BE IMPLEMENTED HERE
     We assume that the predictions in the parameter are valid
     Valiation should be handled in the load_predictions method
+    Parameter 'workers': nbr of processes sharing the classes (see common/average_precision.py)
     """
-    def classification_mean_average_precision(self, predictions):
-        return self.compute_map_score('by_class', predictions)
+    def classification_mean_average_precision(self, predictions, workers=1):
+        return self.compute_map_score('by_class', predictions, workers)
 
 
     """
@@ -323,15 +870,309 @@ class BirdSoundscapeEvaluator:
     NO VALIDATION OF THE RUNFILE SHOULD BE IMPLEMENTED HERE
     We assume that the predictions in the parameter are valid
     Valiation should be handled in the load_predictions method
+    Parameter 'workers': nbr of processes sharing the chunks (see common/average_precision.py)
     """
-    def retrieval_mean_average_precision(self, predictions):
-        return self.compute_map_score('by_query', predictions)
+    def retrieval_mean_average_precision(self, predictions, workers=1):
+        return self.compute_map_score('by_query', predictions, workers)
 
 
 
-    def compute_map_score(self, by_type, predictions):
+    """
+    Returns the group of each prediction in the mAP of by_type: index of its class ('by_class') or of its chunk
+    ('by_query') in the ground truth, -1 if it is not in the ground truth
+    """
+    def prediction_groups(self, by_type, predictions):
+        import numpy as np
+        if by_type == 'by_class':
+            classes = predictions['classes']
+            return np.where(classes < len(self.gt['by_class']), classes, -1)
+
+        query_tcs = predictions['chunks']
+        gt_query_tcs = np.fromiter(self.gt['by_query'], np.int64, len(self.gt['by_query']))
+        if len(gt_query_tcs) == 0:
+            return np.full(len(query_tcs), -1)
+        sorter = np.argsort(gt_query_tcs)
+        groups = sorter[np.minimum(np.searchsorted(gt_query_tcs, query_tcs, sorter=sorter), len(gt_query_tcs) - 1)]
+        return np.where(gt_query_tcs[groups] == query_tcs, groups, -1)
+
+
+    """
+    Returns the predictions as dicts of lists ('by_class': class id => [chunk, score, correct] and
+    'by_query': chunk => [class id, score, correct]), in the order of the runfile
+    """
+    def prediction_lists(self, predictions):
+        class_to_querytc_score_list = {}
+        querytc_to_classid_score_list = {}
+        columns = zip(predictions['classes'].tolist(), predictions['chunks'].tolist(),
+                      predictions['scores'].tolist(), predictions['correct'].tolist())
+        for class_index, query_tc, probability, correct_prediction in columns:
+            class_id = predictions['class_ids'][class_index]
+            class_to_querytc_score_list.setdefault(class_id, []).append([query_tc, probability, int(correct_prediction)])
+            querytc_to_classid_score_list.setdefault(query_tc, []).append([class_id, probability, int(correct_prediction)])
+        return {'by_class': class_to_querytc_score_list, 'by_query': querytc_to_classid_score_list}
+
+
+    """
+    Compute the mean average precision of the classes (by_type 'by_class') or of the chunks ('by_query')
+    The predictions are ranked and the precisions added with numpy (see common/average_precision.py)
+    """
+    def compute_map_score(self, by_type, predictions, workers=1):
+        import numpy as np
+        #NaN scores pass the validation but numpy does not rank them like sorted()
+        if np.isnan(predictions['scores']).any():
+            return self.compute_map_score_reference(by_type, self.prediction_lists(predictions))
+
+        groups = self.prediction_groups(by_type, predictions)
+        in_gt = groups >= 0
+        sums = sum_precisions(groups[in_gt], predictions['scores'][in_gt], predictions['correct'][in_gt], len(self.gt[by_type]),
+                              workers=workers)
+        return mean_average_precision(sums, [len(items) for items in self.gt[by_type].values()])
+
+
+    """
+    Returns the subsets of the breakdowns: 'country' and 'media' => (names of the subsets, subset of each media index)
+    """
+    def breakdown_subsets(self):
+        medias = list(self.gt['media_indexes'])
+        countries = []
+        country_indexes = {}
+        media_countries = []
+        for query in medias:
+            country = self.gt['media_countries'].get(query)
+            if country is not None and not country in country_indexes:
+                country_indexes[country] = len(countries)
+                countries.append(country)
+            media_countries.append(country_indexes.get(country, -1))
+        return {'country': (countries, media_countries), 'media': (medias, list(range(len(medias))))}
+
+
+    """
+    Returns the nbr of ground truth items of each group of by_type in each media, as an array [media index, group]
+    """
+    def gt_media_counts(self, by_type):
+        import numpy as np
+        media_shift = chunk_format_bits + chunk_index_bits
+        counts = np.zeros((len(self.gt['media_indexes']), len(self.gt[by_type])), dtype=np.int64)
+        for group, (sample, items) in enumerate(self.gt[by_type].items()):
+            if by_type == 'by_class':
+                for query_tc in items:
+                    counts[query_tc >> media_shift, group] += 1
+            else:
+                counts[sample >> media_shift, group] = len(items)
+        return counts
+
+
+    """
+    Compute the mean average precision of by_type and its breakdowns by country and by media
+    The predictions of a country or of a media are ranked within the ranking of all predictions, without other sort,
+    and their mAP is the mean over the classes or chunks having ground truth in the country or media
+    Returns (map, {'country': {country: map}, 'media': {media id: map}})
+    """
+    def compute_map_breakdowns(self, by_type, predictions, workers=1):
+        import numpy as np
+        subsets = self.breakdown_subsets()
+        media_counts = self.gt_media_counts(by_type)
+        media_shift = chunk_format_bits + chunk_index_bits
+
+        #subset of each media => nbr of ground truth items of each group in each subset
+        subset_gt_counts = {}
+        for name, (subset_names, media_subsets) in subsets.items():
+            counts = np.zeros((len(subset_names), media_counts.shape[1]), dtype=np.int64)
+            for media_index, subset in enumerate(media_subsets):
+                if subset >= 0:
+                    counts[subset] += media_counts[media_index]
+            subset_gt_counts[name] = counts
+
+        #NaN scores pass the validation but numpy does not rank them like sorted()
+        if np.isnan(predictions['scores']).any():
+            prediction_lists = self.prediction_lists(predictions)
+            breakdowns = {}
+            for name, (subset_names, media_subsets) in subsets.items():
+                breakdowns[name] = {}
+                for subset, subset_name in enumerate(subset_names):
+                    medias = set([media_index for media_index, media_subset in enumerate(media_subsets) if media_subset == subset])
+                    breakdowns[name][subset_name] = self.compute_subset_map_score_reference(by_type, prediction_lists, medias)
+            return self.compute_map_score_reference(by_type, prediction_lists), breakdowns
+
+        groups = self.prediction_groups(by_type, predictions)
+        in_gt = groups >= 0
+        prediction_medias = predictions['chunks'][in_gt] >> media_shift
+        names = list(subsets)
+        partitions = [(np.asarray(subsets[name][1], dtype=np.int64)[prediction_medias], len(subsets[name][0])) for name in names]
+        sums, partition_sums = sum_precisions(groups[in_gt], predictions['scores'][in_gt], predictions['correct'][in_gt],
+                                              len(self.gt[by_type]), partitions, workers)
+
+        breakdowns = {}
+        for name, subset_sums in zip(names, partition_sums):
+            maps = subset_mean_average_precisions(subset_sums, subset_gt_counts[name])
+            breakdowns[name] = {subset_name: subset_map for subset_name, subset_map in zip(subsets[name][0], maps)
+                                if subset_map is not None}
+        return mean_average_precision(sums, media_counts.sum(axis=0)), breakdowns
+
+
+    """
+    Returns the ground truth at a resolution of 'resolution' seconds (windows [k * resolution, (k + 1) * resolution[
+    in the day), computed from the segments of the ground truth (gt['segments']) without expanding them into windows
+    A window overlaps a segment [start, end] if k * resolution < end and (k + 1) * resolution > start, i.e. the windows
+    start // resolution to ceil(end / resolution) - 1, as the chunks of timecodes_to_chunk_indexes
+    Returns a dict:
+    'range_starts', 'range_ends': sorted int keys ((media index * nbr of gt classes + class index) << chunk_index_bits | k)
+                                  of the first and after the last window of the merged windows of each media and class
+    'coverage_keys', 'coverage': nbr of classes of the windows from each key (media index << chunk_index_bits | k)
+                                 to the next one
+    'class_counts': nbr of windows of each class of the ground truth, 'nbr_windows': nbr of windows with a class
+    """
+    def gt_windows(self, resolution):
+        import numpy as np
+        if resolution in self.gt_windows_cache:
+            return self.gt_windows_cache[resolution]
+        if resolution % chunk_duration != 0 or seconds_per_day % resolution != 0:
+            raise Exception("Resolution must be a multiple of {} seconds dividing a day".format(chunk_duration))
+
+        class_indexes = {classid: i for i, classid in enumerate(self.gt['by_class'])}
+        nbr_gt_classes = len(class_indexes)
+        windows = []
+        for query, segments in self.gt['segments'].items():
+            if not query in self.gt['media_indexes']:
+                continue
+            media_index = self.gt['media_indexes'][query]
+            for start, end, classid in segments:
+                first, last = start // resolution, -(-end // resolution)
+                if classid in class_indexes and first < last:
+                    windows.append([media_index, class_indexes[classid], first, last])
+
+        #Overlapping segments of the same media and class are merged
+        windows.sort()
+        merged = []
+        for window in windows:
+            if merged and merged[-1][:2] == window[:2] and window[2] <= merged[-1][3]:
+                merged[-1][3] = max(merged[-1][3], window[3])
+            else:
+                merged.append(window)
+        merged = np.array(merged, dtype=np.int64).reshape(-1, 4)
+        media_indexes, classes, firsts, lasts = merged.T
+
+        range_prefixes = (media_indexes * nbr_gt_classes + classes) << chunk_index_bits
+        first_keys = (media_indexes << chunk_index_bits) | firsts
+        last_keys = (media_indexes << chunk_index_bits) | lasts
+        coverage_keys = np.unique(np.concatenate([first_keys, last_keys]))
+        #+1 at the first window of a range, -1 after its last window
+        deltas = np.zeros(len(coverage_keys), dtype=np.int64)
+        np.add.at(deltas, np.searchsorted(coverage_keys, first_keys), 1)
+        np.add.at(deltas, np.searchsorted(coverage_keys, last_keys), -1)
+        coverage = np.cumsum(deltas)
+
+        self.gt_windows_cache[resolution] = {
+            'range_starts': range_prefixes | firsts,
+            'range_ends': range_prefixes | lasts,
+            'coverage_keys': coverage_keys,
+            'coverage': coverage,
+            'class_counts': np.bincount(classes, weights=lasts - firsts, minlength=nbr_gt_classes),
+            'nbr_windows': int(np.sum(np.diff(coverage_keys)[coverage[:-1] > 0]))
+        }
+        return self.gt_windows_cache[resolution]
+
+
+    """
+    Returns the predictions at a resolution of 'resolution' seconds: the predictions of a class in the chunks of a window
+    are one prediction with their max score, in the order of the first one in the runfile
+    Returns (windows, classes, scores), windows being chunk keys (see chunk_key) with the index of the window
+    """
+    def resolution_predictions(self, predictions, resolution):
+        import numpy as np
+        nbr_classes = len(predictions['class_ids'])
+        chunks = predictions['chunks']
+        index_mask = (1 << chunk_index_bits) - 1
+        windows = (chunks & ~index_mask) | ((chunks & index_mask) * chunk_duration // resolution)
+
+        pairs, first_rows, inverse = np.unique(windows * nbr_classes + predictions['classes'],
+                                               return_index=True, return_inverse=True)
+        scores = np.full(len(pairs), -np.inf)
+        np.maximum.at(scores, inverse.reshape(-1), predictions['scores'])
+        order = np.argsort(first_rows, kind='stable')
+        pairs = pairs[order]
+        return pairs // nbr_classes, pairs % nbr_classes, scores[order]
+
+
+    """
+    Compute the classification and retrieval mean average precisions at a resolution of 'resolution' seconds
+    (see gt_windows and resolution_predictions), returns (cmap, rmap)
+    """
+    def compute_resolution_map_scores(self, predictions, resolution):
+        import numpy as np
+        gt_windows = self.gt_windows(resolution)
+        nbr_gt_classes = len(self.gt['by_class'])
+        windows, classes, scores = self.resolution_predictions(predictions, resolution)
+
+        #Windows of time intervals not formatted 'hh:mm:ss-hh:mm:ss' never match the ground truth
+        in_day = ((windows >> chunk_index_bits) & ((1 << chunk_format_bits) - 1)) == 0
+        media_indexes = windows >> (chunk_format_bits + chunk_index_bits)
+        day_windows = (media_indexes << chunk_index_bits) | (windows & ((1 << chunk_index_bits) - 1))
+
+        in_gt_classes = in_day & (classes < nbr_gt_classes)
+        range_keys = (((media_indexes * nbr_gt_classes + classes) << chunk_index_bits)
+                      | (windows & ((1 << chunk_index_bits) - 1)))
+        #The keys before the first range get the last item of the arrays, 0
+        ranges = np.searchsorted(gt_windows['range_starts'], range_keys, side='right') - 1
+        correct = in_gt_classes & (range_keys < np.append(gt_windows['range_ends'], 0)[ranges])
+
+        class_sums = sum_precisions(classes[in_gt_classes], scores[in_gt_classes], correct[in_gt_classes], nbr_gt_classes)
+        cmap = mean_average_precision(class_sums, gt_windows['class_counts'])
+
+        in_gt_windows = in_day & (self.window_coverage(gt_windows, day_windows) > 0)
+        gt_window_keys, groups = np.unique(day_windows[in_gt_windows], return_inverse=True)
+        window_sums = sum_precisions(groups.reshape(-1), scores[in_gt_windows], correct[in_gt_windows], len(gt_window_keys))
+        #The windows of the ground truth without predictions have an average precision of 0.0
+        total = 0.0
+        if len(window_sums) > 0:
+            total = float(np.cumsum(window_sums / self.window_coverage(gt_windows, gt_window_keys))[-1])
+        rmap = total / float(gt_windows['nbr_windows'])
+        return cmap, rmap
+
+
+    """
+    Returns the nbr of classes of the ground truth of windows (media index << chunk_index_bits | index of the window)
+    """
+    def window_coverage(self, gt_windows, day_windows):
+        import numpy as np
+        coverage_ranges = np.searchsorted(gt_windows['coverage_keys'], day_windows, side='right') - 1
+        return np.append(gt_windows['coverage'], 0)[coverage_ranges]
+
+
+    """
+    Compute with compute_map_score_reference the mean average precision of the predictions and ground truth of a set
+    of media indexes, None if they have no ground truth
+    """
+    def compute_subset_map_score_reference(self, by_type, predictions, medias):
+        media_shift = chunk_format_bits + chunk_index_bits
+        gt_items = {}
+        subset_predictions = {}
+        if by_type == 'by_class':
+            for classid, query_tcs in self.gt[by_type].items():
+                subset_query_tcs = set([query_tc for query_tc in query_tcs if query_tc >> media_shift in medias])
+                if subset_query_tcs:
+                    gt_items[classid] = subset_query_tcs
+            for classid, score_list in predictions[by_type].items():
+                subset_predictions[classid] = [proposition for proposition in score_list if proposition[0] >> media_shift in medias]
+        else:
+            gt_items = {query_tc: classids for query_tc, classids in self.gt[by_type].items() if query_tc >> media_shift in medias}
+            subset_predictions = {query_tc: score_list for query_tc, score_list in predictions[by_type].items()
+                                  if query_tc >> media_shift in medias}
+        if not gt_items:
+            return None
+        return self.compute_map_score_reference(by_type, {by_type: subset_predictions}, gt_items)
+
+
+    """
+    Compute the mean average precision with one Python sort per class or chunk
+    Parameter 'predictions': predictions as dicts of lists (see prediction_lists)
+    Parameter 'gt_items': ground truth of by_type (self.gt[by_type] by default)
+    """
+    def compute_map_score_reference(self, by_type, predictions, gt_items=None):
+        if gt_items is None:
+            gt_items = self.gt[by_type]
         map = 0.0
-        for sample in self.gt[by_type]:
+        for sample in gt_items:
             ap = 0.0
             count_relevant = 0
             rank = 0
@@ -342,14 +1183,14 @@ class BirdSoundscapeEvaluator:
                 for proposition in score_list_sorted_reversed:
                     rank += 1
                     label= proposition[0]
-                    if label in self.gt[by_type][sample]:
+                    if label in gt_items[sample]:
                         count_relevant += 1
                         ap +=  float(count_relevant) / float(rank)
-                ap = ap / float(len(self.gt[by_type][sample]))
+                ap = ap / float(len(gt_items[sample]))
 
             map += ap
 
-        map =  map / float (len(self.gt[by_type]))
+        map =  map / float (len(gt_items))
 
         return map
 
@@ -1 +1,6 @@
-from .caption_prediction_evaluator import CaptionPredictionEvaluator
+#The evaluator module is only imported when CaptionPredictionEvaluator is accessed
+def __getattr__(name):
+    if name == 'CaptionPredictionEvaluator':
+        from .caption_prediction_evaluator import CaptionPredictionEvaluator
+        return CaptionPredictionEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
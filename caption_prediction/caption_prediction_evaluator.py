@@ -1,10 +1,11 @@
 import csv
 import string
-import nltk
 import warnings
-from nltk.translate.bleu_score import SmoothingFunction
-from nltk.corpus import stopwords
-from nltk.stem.snowball import SnowballStemmer
+
+from ..common.snapshot import Snapshot, is_snapshot
+from ..common.submission_reader import Column, SubmissionSchema, SubmissionReader
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
 """
 Evaluator class
 Evaluates one single runfile
@@ -23,19 +24,28 @@ class CaptionPredictionEvaluator:
     """
     def __init__(self, answer_file_path, debug_mode=False):
         self.answer_file_path = answer_file_path
+        #Measures of the phases returned with the result (see common/telemetry.py)
+        self.debug_mode = debug_mode
+        #Ground truth snapshot (if answer_file_path is a compiled snapshot)
+        self.snapshot = None
         #Ground truth pairs {image_id:concepts}
-        self.gt_pairs = self.load_gt()
+        with measure_phase() as self.load_gt_measures:
+            self.gt_pairs = self.load_gt()
 
     """
     This is the only method that will be called by the framework
     Parameter 'submission_file_path': Path of the submitted runfile
     returns a _result_object that can contain up to 2 different scores
     """
+    @score_cached
     def _evaluate(self, client_payload, context={}):
         submission_file_path = client_payload['submission_file_path']
+        telemetry = Telemetry(self, context)
 
-        candidate_pairs = self.load_predictions(submission_file_path)
-        bleu_score = self.compute_bleu(candidate_pairs)
+        with telemetry.phase('load_predictions'):
+            candidate_pairs = self.load_predictions(submission_file_path)
+        with telemetry.phase('compute_bleu'):
+            bleu_score = self.compute_bleu(candidate_pairs)
 
         #_result_object = {
         #  "score": bleu_score,
@@ -46,7 +56,7 @@ class CaptionPredictionEvaluator:
           "score": bleu_score,
           "score_secondary" : 0
         }
-        return _result_object
+        return telemetry.result(_result_object)
 
     """
     Loads and returns a predictions object (dictionary) that contains the submitted data that will be used in the _evaluate method
@@ -56,42 +66,38 @@ class CaptionPredictionEvaluator:
     """
     def load_predictions(self, submission_file_path):
         pairs = {}
-        image_ids_gt = set(self.gt_pairs.keys())
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter='\t', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
-            occured_images = []
-            for row in reader:
-                lineCnt += 1
-
-                # less than two tab separated tokens on line => Error
-                if(len(row) < 2):
-                    raise Exception("Wrong format: Each line must consist of an image ID followed by a tab and a caption ({}) {}"
-                        .format("<imageID><TAB><caption>", self.line_nbr_string(lineCnt)))
-
-                image_id = row[0]
-
+        image_ids_gt = self.gt_pairs.keys()
+        schema = SubmissionSchema([
                 # Image ID does not exist in testset => Error
-                if image_id not in image_ids_gt:
-                    raise Exception("Image ID '{}' in submission file does not exist in testset {}"
-                        .format(image_id,self.line_nbr_string(lineCnt)))
-
-                # image id occured at least twice in file => Error
-                if image_id in occured_images:
-                    raise Exception("Image ID '{}' was specified more than once in submission file {}"
-                        .format(image_id, self.line_nbr_string(lineCnt)))
-
-                occured_images.append(image_id)
-
-                pairs[row[0]] = row[1]
-
-            # In case not all images from the testset are contained in the file => Error
-            if(len(occured_images) != len (image_ids_gt)):
-                raise Exception("Number of image IDs in submission file not equal to number of image IDs in testset")
+                Column(0, allowed=image_ids_gt,
+                    error="Image ID '{value}' in submission file does not exist in testset {line}")
+            ],
+            delimiter='\t',
+            # less than two tab separated tokens on line => Error
+            min_fields=2,
+            max_fields=None,
+            arity_error="Wrong format: Each line must consist of an image ID followed by a tab and a caption (<imageID><TAB><caption>) {line}",
+            # image id occured at least twice in file => Error
+            unique=[0],
+            unique_error="Image ID '{0}' was specified more than once in submission file {line}")
+
+        reader = SubmissionReader(submission_file_path, schema)
+        for lineCnt, row in reader:
+            pairs[row[0]] = row[1]
+
+        # In case not all images from the testset are contained in the file => Error
+        if(len(reader.seen) != len (image_ids_gt)):
+            raise Exception("Number of image IDs in submission file not equal to number of image IDs in testset")
 
         return pairs
 
     def compute_bleu(self, candidate_pairs):
+        # NLTK is slow to import, it is only loaded when the score is computed
+        import nltk
+        from nltk.translate.bleu_score import SmoothingFunction
+        from nltk.corpus import stopwords
+        from nltk.stem.snowball import SnowballStemmer
+
         # Hide warnings
         warnings.filterwarnings('ignore')
 
@@ -164,6 +170,9 @@ class CaptionPredictionEvaluator:
     Load and return groundtruth data
     """
     def load_gt(self):
+        if is_snapshot(self.answer_file_path):
+            return self.load_gt_snapshot()
+
         pairs = {}
         with open(self.answer_file_path) as csvfile:
             reader = csv.reader(csvfile, delimiter='\t', quoting=csv.QUOTE_NONE)
@@ -171,6 +180,23 @@ class CaptionPredictionEvaluator:
                 pairs[row[0]] = row[1]
         return pairs
 
+    """
+    Load and return groundtruth data from a compiled snapshot (see common/snapshot.py)
+    """
+    def load_gt_snapshot(self):
+        self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+        image_ids = self.snapshot.strings('image_ids').tolist()
+        captions = self.snapshot.strings('captions').tolist()
+        return dict(zip(image_ids, captions))
+
+    """
+    Return the sections of the groundtruth snapshot (see common/snapshot.py)
+    """
+    def gt_snapshot_sections(self):
+        return {
+            'strings': {'image_ids': list(self.gt_pairs), 'captions': list(self.gt_pairs.values())}
+        }
+
     def line_nbr_string(self, line_nbr):
         return "(Line nbr {})".format(line_nbr)
 
@@ -0,0 +1 @@
+from .submission_reader import Column, SubmissionSchema, SubmissionReader, line_nbr_string
\ No newline at end of file
@@ -0,0 +1,258 @@
+"""
+Average precision engine
+Average precisions of predictions grouped by class or by query, computed with numpy from parallel arrays
+The predictions of a group are ranked by decreasing score, then decreasing correctness, then from the last submitted
+to the first one, i.e. the order of reversed(sorted(predictions, key=(score, correct)))
+The precisions of a group are added in rank order, so that the sums are the same floats as the ones of a Python loop
+The predictions can also be split into subsets (e.g. countries): the ranking of a group restricted to a subset is the
+ranking of the predictions of the group in the subset, so the subsets are scored from the same sorted pass
+numpy is only imported when the scores are computed, so that evaluators start faster
+The groups can be shared among processes (parameter 'workers'): each process ranks the predictions of a contiguous range
+of groups in the arrays inherited from the parent when it is forked, no prediction is pickled. Each group is scored
+by one single process, so that the sums are the same as in one single process
+"""
+
+import multiprocessing
+
+
+#smallest nbr of predictions given to a process, less predictions are scored with less processes
+MIN_SHARD_ROWS = 1 << 20
+
+
+"""
+Returns the ranking order of the predictions: indexes sorted by group, then by rank in the group
+Parameter 'groups': int array, group index of each prediction, the predictions being in submission order
+Parameter 'scores': float array, score of each prediction
+Parameter 'correct': bool array, True if the prediction is in the ground truth of its group
+"""
+def ranking_order(groups, scores, correct):
+    import numpy as np
+    submission_order = np.arange(len(groups))
+    return np.lexsort((-submission_order, -correct.astype(np.int8), -scores, groups))
+
+
+"""
+Returns the rank of each prediction of a ranking order in its group (1 for the first one) and the nbr of
+correct predictions up to it in its group, both as int arrays in ranking order
+"""
+def group_ranks(sorted_groups, sorted_correct):
+    import numpy as np
+    positions = np.arange(len(sorted_groups))
+    group_start = np.ones(len(sorted_groups), dtype=bool)
+    group_start[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    group_starts = np.maximum.accumulate(np.where(group_start, positions, 0))
+
+    correct_counts = np.cumsum(sorted_correct, dtype=np.int64)
+    correct_counts -= (correct_counts - sorted_correct)[group_starts]
+    return positions - group_starts + 1, correct_counts
+
+
+def _add_precisions(sums, sorted_groups, sorted_correct):
+    import numpy as np
+    ranks, correct_counts = group_ranks(sorted_groups, sorted_correct)
+    #ufunc.at adds the precisions one after the other, in rank order within each group
+    np.add.at(sums, sorted_groups[sorted_correct], correct_counts[sorted_correct] / ranks[sorted_correct])
+
+
+"""
+Returns for each group the sum of the precisions at the ranks of its correct predictions
+(the average precision before the division by the nbr of ground truth items of the group)
+Parameter 'nbr_groups': nbr of groups, the groups without predictions have a sum of 0.0
+Parameter 'partitions': optional list of (subsets, nbr_subsets), 'subsets' being the int array of the subset of
+                         each prediction (-1 => no subset)
+Parameter 'workers': nbr of processes
+With partitions, returns (sums, list of subset_sums), subset_sums[subset][group] being the sum of the group restricted
+to the subset
+"""
+def sum_precisions(groups, scores, correct, nbr_groups, partitions=None, workers=1):
+    import numpy as np
+    groups = np.asarray(groups, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+    correct = np.asarray(correct, dtype=bool)
+
+    nbr_shards = 1
+    if workers is not None and workers > 1:
+        nbr_shards = min(workers, nbr_groups, len(groups) // max(MIN_SHARD_ROWS, 1))
+    if nbr_shards > 1:
+        return _sum_precisions_in_pool(groups, scores, correct, nbr_groups, partitions, workers, nbr_shards)
+
+    sums = np.zeros(nbr_groups)
+    partition_sums = [np.zeros((nbr_subsets, nbr_groups)) for subsets, nbr_subsets in partitions or []]
+    if len(groups) > 0:
+        order = ranking_order(groups, scores, correct)
+        sorted_groups = groups[order]
+        sorted_correct = correct[order]
+        _add_precisions(sums, sorted_groups, sorted_correct)
+
+        for (subsets, nbr_subsets), subset_sums in zip(partitions or [], partition_sums):
+            sorted_subsets = np.asarray(subsets)[order]
+            for subset in range(nbr_subsets):
+                in_subset = sorted_subsets == subset
+                _add_precisions(subset_sums[subset], sorted_groups[in_subset], sorted_correct[in_subset])
+
+    if partitions is None:
+        return sums
+    return sums, partition_sums
+
+
+#Set in the parent process before the pool is forked
+_shard_arrays = None
+
+
+def _sum_precisions_in_child(group_range):
+    groups, scores, correct, partitions = _shard_arrays
+    first_group, end_group = group_range
+    in_shard = (groups >= first_group) & (groups < end_group)
+    shard_partitions = None
+    if partitions is not None:
+        shard_partitions = [(subsets[in_shard], nbr_subsets) for subsets, nbr_subsets in partitions]
+    result = sum_precisions(groups[in_shard] - first_group, scores[in_shard], correct[in_shard],
+                            end_group - first_group, shard_partitions)
+    return result if partitions is not None else (result, [])
+
+
+"""
+Scores contiguous ranges of groups having about the same nbr of predictions in a pool of 'workers' processes
+and gathers their sums
+"""
+def _sum_precisions_in_pool(groups, scores, correct, nbr_groups, partitions, workers, nbr_shards):
+    import numpy as np
+    global _shard_arrays
+    group_ends = np.cumsum(np.bincount(groups, minlength=nbr_groups))
+    boundaries = np.searchsorted(group_ends, [len(groups) * i // nbr_shards for i in range(1, nbr_shards)], side='right')
+    boundaries = [0] + sorted(set(boundaries.tolist()) - set([0, nbr_groups])) + [nbr_groups]
+    group_ranges = list(zip(boundaries[:-1], boundaries[1:]))
+
+    if partitions is not None:
+        partitions = [(np.asarray(subsets), nbr_subsets) for subsets, nbr_subsets in partitions]
+    _shard_arrays = (groups, scores, correct, partitions)
+    try:
+        with multiprocessing.get_context('fork').Pool(min(workers, len(group_ranges))) as pool:
+            results = pool.map(_sum_precisions_in_child, group_ranges)
+    finally:
+        _shard_arrays = None
+
+    sums = np.concatenate([shard_sums for shard_sums, shard_partition_sums in results])
+    if partitions is None:
+        return sums
+    partition_sums = [np.concatenate([shard_partition_sums[i] for shard_sums, shard_partition_sums in results], axis=1)
+                      for i in range(len(partitions))]
+    return sums, partition_sums
+
+
+"""
+Returns for each query the sum of the precisions at the ranks of its correct predictions, for runfiles giving the rank
+of each prediction (the average precision before the division by the nbr of ground truth items of the query)
+The precisions of a query are added in increasing rank order, so that the sums are the same floats as the ones of a
+Python loop over the sorted ranks
+Parameter 'padded_ranks': int array (queries x max nbr of correct ranks), the distinct correct ranks of each query
+                          in any order, padded with 0
+"""
+def sum_rank_precisions(padded_ranks):
+    import numpy as np
+    ranks, has_rank = _sorted_ranks(padded_ranks)
+    if ranks.shape[1] == 0:
+        return np.zeros(ranks.shape[0])
+    return np.cumsum(_rank_precisions(ranks, has_rank), axis=1)[:, -1]
+
+
+"""
+Returns the correct ranks of each query sorted in increasing order, the padding after them (int64 array), and the mask
+of the ranks
+"""
+def _sorted_ranks(padded_ranks):
+    import numpy as np
+    padded_ranks = np.asarray(padded_ranks, dtype=np.int64)
+    no_rank = np.iinfo(np.int64).max
+    ranks = np.sort(np.where(padded_ranks > 0, padded_ranks, no_rank), axis=1)
+    return ranks, ranks != no_rank
+
+
+"""
+Returns the precision at each sorted correct rank (0.0 for the padding)
+"""
+def _rank_precisions(ranks, has_rank):
+    import numpy as np
+    correct_counts = np.arange(1, ranks.shape[1] + 1, dtype=np.float64)
+    return np.where(has_rank, correct_counts / ranks, 0.0)
+
+
+"""
+Returns the rank metrics of a runfile giving the rank of each prediction, averaged over the queries, from the same
+sorted array of correct ranks
+Parameter 'padded_ranks': see sum_rank_precisions
+Parameter 'gt_counts': nbr of ground truth items of each query
+Parameter 'metric_names': list of metrics among
+                          'top_<k>': part of the queries with a correct prediction at rank <= k
+                          'mrr': mean of 1 / rank of the first correct prediction (0 without correct prediction)
+                          'map@<k>': mean of the sums of the precisions at the correct ranks <= k,
+                                     divided by min(nbr of ground truth items, k)
+Returns dict metric name => value (0.0 without query)
+"""
+def rank_metrics(padded_ranks, gt_counts, metric_names):
+    import numpy as np
+    ranks, has_rank = _sorted_ranks(padded_ranks)
+    gt_counts = np.asarray(gt_counts, dtype=np.float64)
+    nbr_queries, width = ranks.shape
+    if width == 0:
+        #one column of padding
+        ranks, has_rank = _sorted_ranks(np.zeros((nbr_queries, 1), dtype=np.int64))
+    first_ranks = np.where(has_rank[:, 0], ranks[:, 0], 0)
+    precisions = _rank_precisions(ranks, has_rank)
+
+    def mean(values):
+        return float(np.mean(values)) if nbr_queries > 0 else 0.0
+
+    metrics = {}
+    for metric_name in metric_names:
+        metric, k = parse_rank_metric(metric_name)
+        if metric == 'mrr':
+            metrics[metric_name] = mean(np.where(first_ranks > 0, 1.0 / np.maximum(first_ranks, 1), 0.0))
+        elif metric == 'top':
+            metrics[metric_name] = mean((first_ranks > 0) & (first_ranks <= k))
+        else:
+            sums = np.where(ranks <= k, precisions, 0.0).sum(axis=1)
+            metrics[metric_name] = mean(sums / np.minimum(gt_counts, k))
+    return metrics
+
+
+"""
+Returns (metric, k) of the name of a rank metric (see rank_metrics): ('top', k), ('mrr', None) or ('map', k)
+Unknown metric => Error
+"""
+def parse_rank_metric(metric_name):
+    if metric_name == 'mrr':
+        return 'mrr', None
+    prefix, k = metric_name[:4], metric_name[4:]
+    if prefix in ('top_', 'map@') and k.isdigit() and int(k) > 0:
+        return prefix[:3], int(k)
+    raise Exception("Unknown rank metric '{}', the rank metrics are 'top_<k>', 'mrr' and 'map@<k>'"
+        .format(metric_name))
+
+
+"""
+Returns the mean of the average precisions (sum of precisions / nbr of ground truth items) of all the groups,
+added in group order
+"""
+def mean_average_precision(sums, gt_counts):
+    import numpy as np
+    total = 0.0
+    if len(sums) > 0:
+        average_precisions = sums / np.asarray(gt_counts, dtype=np.float64)
+        total = float(np.cumsum(average_precisions)[-1])
+    return total / float(len(sums))
+
+
+"""
+Returns the mean average precision of each subset, over the groups having ground truth items in the subset
+(None for a subset without ground truth)
+Parameter 'subset_gt_counts': nbr of ground truth items of each group in each subset, same shape as subset_sums
+"""
+def subset_mean_average_precisions(subset_sums, subset_gt_counts):
+    import numpy as np
+    subset_gt_counts = np.asarray(subset_gt_counts)
+    maps = []
+    for sums, gt_counts in zip(subset_sums, subset_gt_counts):
+        has_gt = gt_counts > 0
+        maps.append(mean_average_precision(sums[has_gt], gt_counts[has_gt]) if has_gt.any() else None)
+    return maps
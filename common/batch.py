@@ -0,0 +1,138 @@
+"""
+Batch evaluation
+Scores many runfiles of one challenge: the evaluator (and its ground truth) is built once, then each run is
+evaluated in a process forked from it, several runs in parallel
+One JSON line is written per run, as soon as it is scored: {"submission_file_path": ..., "result": ...} or
+{"submission_file_path": ..., "error": ...}. An invalid run, or a run whose process dies (crash, out of memory),
+does not stop the batch
+
+python -m CLEF_evaluators_2018.common.batch bird_soundscape gt_file.csv 'runs/*.csv' --output results.jsonl
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+
+from .compile_gt import parse_parameters
+from .registry import EVALUATORS, create_evaluator
+from .score_cache import json_default
+
+
+"""
+Returns the runfiles of a directory (all its files) or of a glob pattern, sorted by path
+"""
+def find_submission_files(runs):
+    if os.path.isdir(runs):
+        file_paths = [os.path.join(runs, name) for name in os.listdir(runs)]
+    else:
+        file_paths = glob.glob(runs)
+    return sorted(file_path for file_path in file_paths if os.path.isfile(file_path))
+
+
+def _evaluate_submission(evaluator, submission_file_path, context):
+    try:
+        #messages printed by the evaluators must not be mixed with the JSONL output
+        with contextlib.redirect_stdout(sys.stderr):
+            result = evaluator._evaluate({'submission_file_path': submission_file_path}, dict(context))
+        return {'submission_file_path': submission_file_path, 'result': result}
+    except Exception as e:
+        return {'submission_file_path': submission_file_path, 'error': str(e)}
+
+
+def _evaluate_in_child(evaluator, submission_file_path, context, connection):
+    try:
+        connection.send(_evaluate_submission(evaluator, submission_file_path, context))
+    finally:
+        connection.close()
+
+
+"""
+Evaluates the runfiles with the given evaluator, yields one record per runfile in completion order
+Parameter 'workers': max nbr of runs evaluated at the same time, each in its own forked process (default: nbr of
+                     CPUs), 1 evaluates the runs in the current process
+Parameter 'context': context given to _evaluate for every runfile
+"""
+def evaluate_batch(evaluator, submission_file_paths, workers=None, context={}):
+    if workers == 1:
+        for submission_file_path in submission_file_paths:
+            yield _evaluate_submission(evaluator, submission_file_path, context)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    process_context = multiprocessing.get_context('fork')
+    pending = iter(submission_file_paths)
+    #receiving end of the pipe of each running process => (runfile, process)
+    running = {}
+    try:
+        while True:
+            for submission_file_path in pending:
+                receiver, sender = process_context.Pipe(duplex=False)
+                process = process_context.Process(target=_evaluate_in_child,
+                                                  args=(evaluator, submission_file_path, context, sender))
+                process.start()
+                sender.close()
+                running[receiver] = (submission_file_path, process)
+                if len(running) >= workers:
+                    break
+            if not running:
+                return
+
+            for receiver in multiprocessing.connection.wait(list(running)):
+                submission_file_path, process = running.pop(receiver)
+                try:
+                    record = receiver.recv()
+                except EOFError:
+                    #the process died without sending its record
+                    process.join()
+                    record = {'submission_file_path': submission_file_path,
+                              'error': "Evaluation process died (exit code {})".format(process.exitcode)}
+                finally:
+                    receiver.close()
+                process.join()
+                yield record
+    finally:
+        for receiver, (submission_file_path, process) in running.items():
+            process.terminate()
+            process.join()
+            receiver.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate many runfiles of a challenge in parallel")
+    parser.add_argument('challenge', choices=sorted(EVALUATORS))
+    parser.add_argument('answer_file_path', help="ground truth file (or compiled snapshot)")
+    parser.add_argument('runs', help="directory of runfiles or glob pattern")
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                        help="other constructor parameter of the evaluator, e.g. allowed_classes_file_path=allowed_classes.txt")
+    parser.add_argument('--workers', type=int, default=None, help="nbr of worker processes (default: nbr of CPUs)")
+    parser.add_argument('--output', default=None, help="JSONL file to write (default: standard output)")
+    parser.add_argument('--score-cache-dir', default=None, help="directory of the score cache (see score_cache.py)")
+    args = parser.parse_args(argv)
+
+    submission_file_paths = find_submission_files(args.runs)
+    if not submission_file_paths:
+        raise Exception("No runfile found for '{}'".format(args.runs))
+
+    evaluator = create_evaluator(args.challenge, args.answer_file_path, **parse_parameters(args.param))
+
+    context = {}
+    if args.score_cache_dir:
+        context['score_cache_dir'] = args.score_cache_dir
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for record in evaluate_batch(evaluator, submission_file_paths, args.workers, context):
+            output.write(json.dumps(record, default=json_default) + '\n')
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
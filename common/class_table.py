@@ -0,0 +1,81 @@
+"""
+Class tables
+Interned class ids: each class id is mapped once to a dense int, so that the class of a line of a runfile is parsed
+into its int and the classes of a query of the ground truth are stored as a bitset (bit i for the class of index i)
+The classes allowed in the runfiles come first, the other classes of the ground truth are appended when they are
+interned
+"""
+
+from .submission_reader import Column
+
+
+class _AllowedIndexes(dict):
+
+    """
+    Index of each allowed class id, a class id not allowed raises a ValueError (invalid token, see submission_reader.py)
+    """
+    def __missing__(self, class_id):
+        raise ValueError(class_id)
+
+
+class ClassTable:
+
+    """
+    Parameter 'allowed_classes': class ids allowed in the runfiles
+    """
+    def __init__(self, allowed_classes):
+        self.class_ids = sorted(allowed_classes)
+        self.class_indexes = {class_id: i for i, class_id in enumerate(self.class_ids)}
+        self.allowed_indexes = _AllowedIndexes(self.class_indexes)
+
+
+    def __len__(self):
+        return len(self.class_ids)
+
+
+    """
+    Returns the index of a class id, a class id not in the table yet is appended
+    """
+    def index(self, class_id):
+        class_index = self.class_indexes.get(class_id)
+        if class_index is None:
+            class_index = self.class_indexes[class_id] = len(self.class_ids)
+            self.class_ids.append(class_id)
+        return class_index
+
+
+    """
+    Returns the bitset of class ids
+    """
+    def bits(self, class_ids):
+        bits = 0
+        for class_id in class_ids:
+            bits |= 1 << self.index(class_id)
+        return bits
+
+
+    """
+    Returns the class ids of a bitset, in index order
+    """
+    def ids(self, bits):
+        class_ids = []
+        while bits:
+            lowest_bit = bits & -bits
+            class_ids.append(self.class_ids[lowest_bit.bit_length() - 1])
+            bits ^= lowest_bit
+        return class_ids
+
+
+    """
+    Returns the Column of the class ids in a runfile (see submission_reader.py): the value of a token is the index of
+    its class, a class id not allowed raises 'error'
+    """
+    def column(self, index, error):
+        return Column(index, parse=self.allowed_indexes.__getitem__, error=error)
+
+
+"""
+Returns the nbr of classes of a bitset
+"""
+def bit_count(bits):
+    return bin(bits).count('1')
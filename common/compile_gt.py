@@ -0,0 +1,42 @@
+"""
+Compiles the ground truth of a challenge into a snapshot (see snapshot.py)
+The snapshot can then be given to the evaluator instead of the ground truth file
+
+python -m CLEF_evaluators_2018.common.compile_gt bird_soundscape gt_file.csv gt_file.snapshot
+"""
+
+import argparse
+
+from .registry import EVALUATORS, create_evaluator
+from .snapshot import compile_snapshot
+
+
+"""
+Parses 'name=value' constructor parameters given on the command line
+"""
+def parse_parameters(parameters):
+    result = {}
+    for parameter in parameters:
+        if '=' not in parameter:
+            raise Exception("Parameter '{}' must have the format name=value".format(parameter))
+        name, value = parameter.split('=', 1)
+        result[name] = value
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the ground truth of a challenge into a snapshot")
+    parser.add_argument('challenge', choices=sorted(EVALUATORS))
+    parser.add_argument('answer_file_path', help="ground truth file")
+    parser.add_argument('snapshot_file_path', help="snapshot file to write")
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                        help="other constructor parameter of the evaluator, e.g. allowed_classes_file_path=allowed_classes.txt")
+    args = parser.parse_args(argv)
+
+    evaluator = create_evaluator(args.challenge, args.answer_file_path, **parse_parameters(args.param))
+    compile_snapshot(evaluator, args.snapshot_file_path)
+    print("Snapshot written to {}".format(args.snapshot_file_path))
+
+
+if __name__ == "__main__":
+    main()
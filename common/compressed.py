@@ -0,0 +1,96 @@
+"""
+Compressed runfiles
+Runfiles can be uploaded compressed with gzip, bzip2, xz or zstandard, the compression is detected from
+the magic bytes at the start of the file (not from its name) and the file is decompressed while it is read
+zstandard needs the optional 'zstandard' package
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+
+
+#magic bytes => compression name
+COMPRESSION_MAGICS = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+
+_MAGIC_LENGTH = max(len(magic) for magic, compression in COMPRESSION_MAGICS)
+
+
+"""
+Returns the compression of a file ('gzip', 'bz2', 'xz' or 'zstd'), None if it is not compressed
+"""
+def detect_compression(file_path):
+    with open(file_path, 'rb') as f:
+        head = f.read(_MAGIC_LENGTH)
+    for magic, compression in COMPRESSION_MAGICS:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+"""
+Opens a possibly compressed file as a binary stream of its decompressed content
+"""
+def open_binary(file_path):
+    compression = detect_compression(file_path)
+    if compression is None:
+        return open(file_path, 'rb')
+    if compression == 'gzip':
+        return gzip.open(file_path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(file_path, 'rb')
+    if compression == 'xz':
+        return lzma.open(file_path, 'rb')
+
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception("The submission file is compressed with zstandard, which is not supported on this server. Please use gzip, bzip2 or xz")
+    raw = open(file_path, 'rb')
+    try:
+        return io.BufferedReader(_ClosingStream(zstandard.ZstdDecompressor().stream_reader(raw), raw))
+    except Exception:
+        raw.close()
+        raise
+
+
+"""
+Opens a possibly compressed file as a text stream, read like a file opened with open(file_path)
+"""
+def open_text(file_path):
+    if detect_compression(file_path) is None:
+        return open(file_path)
+    return io.TextIOWrapper(open_binary(file_path))
+
+
+class _ClosingStream(io.RawIOBase):
+
+    """
+    Decompressing stream that also closes the underlying file
+    """
+    def __init__(self, stream, raw):
+        self.stream = stream
+        self.raw = raw
+
+
+    def readable(self):
+        return True
+
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+    def close(self):
+        if not self.closed:
+            self.stream.close()
+            self.raw.close()
+        super().close()
@@ -0,0 +1,317 @@
+"""
+Evaluation daemon
+Long-running local service keeping one warm instance of each evaluator (imports and ground truth loaded once)
+
+Configuration: JSON file mapping challenge names to the constructor parameters of their evaluator, e.g.
+{
+    "bird_soundscape": {"answer_file_path": "gt_file.snapshot"},
+    "lifelog_lmrt": {"answer_file_path": "gt_file.csv", "clusters_gt_file_path": "clusters_gt_file.csv"}
+}
+
+Requests: POST /evaluate with {"challenge": ..., "submission_file_path": ..., "context": {...}}
+Response: {"result": _result_object} or {"error": message}
+Each request is evaluated in a process forked from the loaded ground truth, so it can be killed when it exceeds the
+timeout. The evaluation processes are forked by a single-threaded dispatcher process, itself forked before the threads
+of the HTTP server are started: forking from a multi-threaded process can copy locks held by other threads
+
+python -m CLEF_evaluators_2018.common.daemon --config evaluators.json --port 8700
+"""
+
+import argparse
+import atexit
+import itertools
+import json
+import multiprocessing
+import multiprocessing.connection
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .registry import create_evaluator
+from .score_cache import json_default
+
+
+def _evaluate_in_child(evaluator, client_payload, context, connection):
+    try:
+        connection.send(('result', evaluator._evaluate(client_payload, context)))
+    except Exception as e:
+        connection.send(('error', str(e)))
+    except BaseException:
+        connection.send(('error', traceback.format_exc()))
+    finally:
+        connection.close()
+
+
+"""
+Loop of the dispatcher process: forks one evaluation process per ('evaluate', job id, challenge, client_payload,
+context) received on 'requests', kills it on ('cancel', job id), and sends (job id, status, value) on 'results' when
+it ends, status 'died' => value is the exit code of the evaluation process
+Stops on None or when the daemon closes 'requests'
+Parameter 'parent_connections': ends of the pipes used by the daemon, closed in the dispatcher
+"""
+def _dispatch(evaluators, requests, results, parent_connections, process_context):
+    for connection in parent_connections:
+        connection.close()
+
+    #job id => (receiving end of the pipe of the evaluation process, process)
+    running = {}
+    try:
+        while True:
+            receivers = {receiver: job_id for job_id, (receiver, process) in running.items()}
+            for ready in multiprocessing.connection.wait([requests] + list(receivers)):
+                if ready is requests:
+                    try:
+                        message = requests.recv()
+                    except EOFError:
+                        message = None
+                    if message is None:
+                        return
+
+                    if message[0] == 'cancel':
+                        job = running.pop(message[1], None)
+                        if job is not None:
+                            receiver, process = job
+                            process.terminate()
+                            process.join()
+                            receiver.close()
+                    else:
+                        action, job_id, challenge, client_payload, context = message
+                        receiver, sender = process_context.Pipe(duplex=False)
+                        process = process_context.Process(target=_evaluate_in_child,
+                                                          args=(evaluators[challenge], client_payload, context, sender))
+                        process.start()
+                        sender.close()
+                        running[job_id] = (receiver, process)
+                    continue
+
+                #the job may have been cancelled by a message handled in this loop
+                job_id = receivers[ready]
+                if job_id not in running:
+                    continue
+                receiver, process = running.pop(job_id)
+                try:
+                    status, value = receiver.recv()
+                except EOFError:
+                    process.join()
+                    status, value = 'died', process.exitcode
+                finally:
+                    receiver.close()
+                process.join()
+                results.send((job_id, status, value))
+    finally:
+        for receiver, process in running.values():
+            process.terminate()
+            process.join()
+        results.close()
+
+
+class EvaluationDaemon:
+
+    """
+    Parameter 'evaluators': dict challenge name => evaluator instance
+    Parameter 'max_concurrent': max nbr of submissions evaluated at the same time
+    Parameter 'timeout': max nbr of seconds for one submission (waiting for a free slot included)
+    """
+    def __init__(self, evaluators, max_concurrent=4, timeout=600):
+        self.evaluators = evaluators
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.process_context = multiprocessing.get_context('fork')
+        self.dispatcher = None
+        #job id => {'done': Event set when 'outcome' (status, value) is received from the dispatcher}
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        self.job_ids = itertools.count()
+
+
+    """
+    Starts the dispatcher process forking the evaluation processes (see _dispatch)
+    Must be called before the process starts other threads (serve calls it), evaluate calls it otherwise
+    """
+    def start(self):
+        if self.dispatcher is not None:
+            return
+        requests_receiver, self.requests = self.process_context.Pipe(duplex=False)
+        self.results, results_sender = self.process_context.Pipe(duplex=False)
+        self.requests_lock = threading.Lock()
+        self.dispatcher = self.process_context.Process(target=_dispatch,
+                                                       args=(self.evaluators, requests_receiver, results_sender,
+                                                             [self.requests, self.results], self.process_context))
+        self.dispatcher.start()
+        requests_receiver.close()
+        results_sender.close()
+
+        self.router = threading.Thread(target=self.route_results, daemon=True)
+        self.router.start()
+        #the dispatcher is not a daemonic process (it has children): stop it before multiprocessing joins it at exit
+        atexit.register(self.close)
+
+
+    """
+    Stops the dispatcher process, the running evaluations are killed
+    """
+    def close(self):
+        if self.dispatcher is None:
+            return
+        with self.requests_lock:
+            try:
+                self.requests.send(None)
+            except OSError:
+                pass
+            self.requests.close()
+        self.dispatcher.join()
+        self.router.join()
+        self.results.close()
+        self.dispatcher = None
+        atexit.unregister(self.close)
+
+
+    """
+    Thread giving the outcome of each job sent by the dispatcher to the request waiting for it
+    The requests still waiting when the dispatcher stops get the outcome ('stopped', None)
+    """
+    def route_results(self):
+        while True:
+            try:
+                job_id, status, value = self.results.recv()
+            except (EOFError, OSError):
+                break
+            with self.jobs_lock:
+                job = self.jobs.get(job_id)
+            if job is not None:
+                job['outcome'] = (status, value)
+                job['done'].set()
+
+        with self.jobs_lock:
+            for job in self.jobs.values():
+                job['outcome'] = ('stopped', None)
+                job['done'].set()
+
+
+    def send_request(self, message):
+        with self.requests_lock:
+            self.requests.send(message)
+
+
+    """
+    Builds the evaluators listed in a configuration (dict challenge name => constructor parameters)
+    """
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        evaluators = {}
+        for challenge, parameters in config.items():
+            parameters = dict(parameters)
+            answer_file_path = parameters.pop('answer_file_path')
+            evaluators[challenge] = create_evaluator(challenge, answer_file_path, **parameters)
+        return cls(evaluators, **kwargs)
+
+
+    """
+    Evaluates one submission and returns (http status, response object)
+    """
+    def evaluate(self, request):
+        if not isinstance(request, dict):
+            return 400, {'error': "Request body must be a JSON object"}
+        challenge = request.get('challenge')
+        if challenge not in self.evaluators:
+            return 404, {'error': "Challenge '{}' is not loaded. Possible values are: {}"
+                .format(challenge, ', '.join(sorted(self.evaluators)))}
+        if 'submission_file_path' not in request:
+            return 400, {'error': "'submission_file_path' is missing"}
+
+        client_payload = {'submission_file_path': request['submission_file_path']}
+        context = request.get('context', {})
+        self.start()
+
+        #the wait for a slot counts in the timeout of the submission
+        deadline = time.monotonic() + self.timeout
+        if not self.slots.acquire(timeout=self.timeout):
+            return 503, {'error': "No evaluation slot available after {} seconds".format(self.timeout)}
+        try:
+            job_id = next(self.job_ids)
+            job = {'done': threading.Event()}
+            with self.jobs_lock:
+                self.jobs[job_id] = job
+            try:
+                self.send_request(('evaluate', job_id, challenge, client_payload, context))
+                if not job['done'].wait(max(0, deadline - time.monotonic())):
+                    self.send_request(('cancel', job_id))
+                    return 504, {'error': "Evaluation exceeded the timeout of {} seconds".format(self.timeout)}
+            finally:
+                with self.jobs_lock:
+                    del self.jobs[job_id]
+        finally:
+            self.slots.release()
+
+        status, value = job['outcome']
+        if status == 'died':
+            return 500, {'error': "Evaluation process died (exit code {})".format(value)}
+        if status == 'stopped':
+            return 500, {'error': "Evaluation dispatcher stopped"}
+        if status == 'error':
+            return 400, {'error': value}
+        return 200, {'result': value}
+
+
+    def serve(self, host='127.0.0.1', port=8700):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def send_json(self, status, response):
+                body = json.dumps(response, default=json_default).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/health':
+                    self.send_json(200, {'challenges': sorted(daemon.evaluators)})
+                else:
+                    self.send_json(404, {'error': "Unknown path '{}'".format(self.path)})
+
+            def do_POST(self):
+                if self.path != '/evaluate':
+                    self.send_json(404, {'error': "Unknown path '{}'".format(self.path)})
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    request = json.loads(self.rfile.read(length).decode('utf-8'))
+                except ValueError:
+                    self.send_json(400, {'error': "Request body must be a JSON object"})
+                    return
+                self.send_json(*daemon.evaluate(request))
+
+        #fork the dispatcher while the process has a single thread
+        self.start()
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        print("Evaluation daemon listening on http://{}:{} ({})".format(host, port, ', '.join(sorted(self.evaluators))))
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep evaluators warm and evaluate submissions over HTTP")
+    parser.add_argument('--config', required=True, help="JSON file: challenge name => constructor parameters")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--max-concurrent', type=int, default=4, help="max nbr of submissions evaluated at the same time")
+    parser.add_argument('--timeout', type=float, default=600, help="max nbr of seconds per submission")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    daemon = EvaluationDaemon.from_config(config, max_concurrent=args.max_concurrent, timeout=args.timeout)
+    daemon.serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+External sort
+Sorts more records than fit in memory: the records are packed with struct into fixed size binary records,
+sorted by runs of 'run_records' records written to temporary files, then the runs are merged with heapq.merge
+"""
+
+import heapq
+import shutil
+import struct
+import tempfile
+
+
+DEFAULT_RUN_RECORDS = 100000
+
+_READ_RECORDS = 4096
+
+
+class ExternalSorter:
+
+    """
+    Parameter 'record_format': struct format of the records (tuples)
+    Parameter 'key': key of the sort, as for sorted()
+    Parameter 'run_records': nbr of records sorted in memory
+    Parameter 'directory': directory of the temporary files (default temporary directory)
+    """
+    def __init__(self, record_format, key, run_records=DEFAULT_RUN_RECORDS, directory=None):
+        self.record_struct = struct.Struct(record_format)
+        self.key = key
+        self.run_records = run_records
+        self.directory = tempfile.mkdtemp(prefix='external_sort_', dir=directory)
+        self.run_file_paths = []
+        self.records = []
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def add(self, record):
+        self.records.append(record)
+        if len(self.records) >= self.run_records:
+            self._write_run()
+
+
+    def _write_run(self):
+        self.records.sort(key=self.key)
+        run_file_path = '{}/run_{}'.format(self.directory, len(self.run_file_paths))
+        pack = self.record_struct.pack
+        with open(run_file_path, 'wb') as f:
+            f.write(b''.join([pack(*record) for record in self.records]))
+        self.run_file_paths.append(run_file_path)
+        self.records = []
+
+
+    def _read_run(self, run_file_path):
+        with open(run_file_path, 'rb') as f:
+            for block in iter(lambda: f.read(self.record_struct.size * _READ_RECORDS), b''):
+                yield from self.record_struct.iter_unpack(block)
+
+
+    """
+    Returns an iterator over all the records added, sorted
+    """
+    def sorted(self):
+        if not self.run_file_paths:
+            return iter(sorted(self.records, key=self.key))
+        if self.records:
+            self._write_run()
+        return heapq.merge(*[self._read_run(run_file_path) for run_file_path in self.run_file_paths], key=self.key)
+
+
+    """
+    Removes the temporary files
+    """
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
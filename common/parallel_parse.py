@@ -0,0 +1,119 @@
+"""
+Parallel parsing of one single runfile
+The runfile is split into byte ranges aligned on line boundaries, the ranges are parsed and validated
+in a pool of processes and their partial indexes are merged in file order by the evaluator
+The cross-row checks (duplicates, max nbr of propositions, consecutive ranks) are run on the merged index,
+so that the error raised is the one of the first invalid line, as when the runfile is parsed in one single pass
+Enabled with context['parse_workers'] (nbr of processes), compressed runfiles are always parsed in one single pass
+"""
+
+import multiprocessing
+import os
+
+from .compressed import detect_compression
+from .submission_reader import SubmissionReader
+from .telemetry import record_rows
+
+
+#smallest range given to a process, smaller runfiles are parsed with less processes
+MIN_RANGE_BYTES = 4 * 1024 * 1024
+
+_BLOCK_BYTES = 1 << 20
+
+
+"""
+Splits a file into at most 'nbr_ranges' ranges starting at the beginning of a line
+Returns a list of (start offset, end offset, nbr of the first line of the range)
+"""
+def line_aligned_ranges(file_path, nbr_ranges):
+    size = os.path.getsize(file_path)
+    targets = [size * i // nbr_ranges for i in range(1, nbr_ranges)]
+    boundaries = [(0, 1)]
+
+    #The lines before each boundary are counted so that the errors give the line nbr in the whole file
+    position = 0
+    newlines = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(_BLOCK_BYTES), b''):
+            search_from = 0
+            while targets and targets[0] < position + len(block):
+                index = block.find(b'\n', max(targets[0] - position, search_from))
+                # No end of line after the target in this block => boundary in a next block
+                if index < 0:
+                    break
+                offset = position + index + 1
+                boundaries.append((offset, newlines + block.count(b'\n', 0, index + 1) + 1))
+                while targets and targets[0] < offset:
+                    targets.pop(0)
+                search_from = index + 1
+            newlines += block.count(b'\n')
+            position += len(block)
+
+    ranges = []
+    for i, (start, first_line_nbr) in enumerate(boundaries):
+        end = boundaries[i + 1][0] if i + 1 < len(boundaries) else size
+        if start < end:
+            ranges.append((start, end, first_line_nbr))
+    return ranges
+
+
+#Set in the parent process before the pool is forked
+_submission_file_path = None
+_schema = None
+_parse_range = None
+
+
+def _parse_range_in_child(byte_range):
+    start, end, first_line_nbr = byte_range
+    reader = SubmissionReader(_submission_file_path, _schema, byte_range=(start, end), first_line_nbr=first_line_nbr)
+    partial = {}
+    error = None
+    try:
+        _parse_range(reader, partial)
+    except Exception as e:
+        #the partial index holds the lines before the invalid one
+        error = (reader.line_count, str(e))
+    return partial, error, reader.line_count - first_line_nbr + 1
+
+
+"""
+Parses a runfile, possibly in parallel
+Parameter 'schema': SubmissionSchema of the runfile
+Parameter 'parse_range': callable(reader, partial) filling the dict 'partial' with the index of the lines
+                         yielded by the SubmissionReader 'reader', its errors are raised on the current line
+Parameter 'workers': nbr of processes
+Returns the list of (partial, error) of the ranges in file order,
+'error' is (line nbr, message) of the first invalid line of the range or None
+In one single pass, the first error is raised directly
+"""
+def parse_ranges(submission_file_path, schema, parse_range, workers=1, min_range_bytes=MIN_RANGE_BYTES):
+    nbr_ranges = 1
+    if workers is not None and workers > 1 and detect_compression(submission_file_path) is None:
+        nbr_ranges = min(workers, os.path.getsize(submission_file_path) // max(min_range_bytes, 1))
+
+    if nbr_ranges <= 1:
+        partial = {}
+        parse_range(SubmissionReader(submission_file_path, schema), partial)
+        return [(partial, None)]
+
+    global _submission_file_path, _schema, _parse_range
+    _submission_file_path, _schema, _parse_range = submission_file_path, schema, parse_range
+    try:
+        byte_ranges = line_aligned_ranges(submission_file_path, nbr_ranges)
+        with multiprocessing.get_context('fork').Pool(min(workers, len(byte_ranges))) as pool:
+            results = pool.map(_parse_range_in_child, byte_ranges)
+    finally:
+        _submission_file_path, _schema, _parse_range = None, None, None
+
+    record_rows(sum(nbr_lines for partial, error, nbr_lines in results))
+    return [(partial, error) for partial, error, nbr_lines in results]
+
+
+"""
+Raises the error of the first line among a list of (line nbr, message)
+On the same line, the error given first is raised
+"""
+def raise_first_error(errors):
+    if errors:
+        line_nbr, message = min(errors, key=lambda error: error[0])
+        raise Exception(message)
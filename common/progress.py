@@ -0,0 +1,115 @@
+"""
+Progress
+Opt-in progress reports of the runfiles being read, for long evaluations
+Enabled with context['progress_callback']: callable(report) called while a phase of the evaluation (see telemetry.py)
+reads a runfile with a SubmissionReader, at most once every context['progress_interval'] seconds (1 by default),
+and once when the runfile is read
+'report' is a dict:
+ 'phase': name of the phase
+ 'file_path': path of the runfile
+ 'byte_range': (start, end) offsets of the lines read by a process of the parallel parsing, None => whole runfile
+ 'bytes_read', 'total_bytes': bytes of the runfile (or of its byte range) read so far and in all,
+                              None for a compressed runfile
+ 'rows': nbr of lines parsed so far
+ 'seconds': since the reading started
+ 'rows_per_second'
+ 'eta_seconds': remaining seconds estimated from the bytes read, None if unknown
+ 'done': True for the last report of the runfile
+ 'pid': process reading the runfile, the processes of the parallel parsing report their own ranges
+"""
+
+import contextlib
+import contextvars
+import os
+import time
+
+
+DEFAULT_INTERVAL_SECONDS = 1.0
+
+#nbr of lines between two looks at the clock
+CHECK_ROWS = 1024
+
+#(callback, phase, interval) of the phase running in the current context
+_current_progress = contextvars.ContextVar('progress', default=None)
+
+
+"""
+Reports the progress of the runfiles read inside the 'with' block to 'callback' (nothing is reported if None)
+"""
+@contextlib.contextmanager
+def report_progress(callback, phase, interval=DEFAULT_INTERVAL_SECONDS):
+    if callback is None:
+        yield
+        return
+    token = _current_progress.set((callback, phase, interval))
+    try:
+        yield
+    finally:
+        _current_progress.reset(token)
+
+
+class ProgressMeter:
+
+    """
+    Progress of one runfile
+    Parameter 'bytes_read': callable returning the nbr of bytes read so far, None if unknown
+    Parameter 'total_bytes': size of the runfile (or of its byte range), None if unknown
+    """
+    def __init__(self, callback, phase, interval, file_path, byte_range, bytes_read, total_bytes):
+        self.callback = callback
+        self.phase = phase
+        self.interval = interval
+        self.file_path = file_path
+        self.byte_range = byte_range
+        self.bytes_read = bytes_read
+        self.total_bytes = total_bytes
+        self.start = time.perf_counter()
+        self.next_report = self.start + interval
+
+
+    """
+    Reports the progress if the interval elapsed since the last report
+    """
+    def update(self, rows):
+        now = time.perf_counter()
+        if now >= self.next_report:
+            self.report(rows, now)
+            self.next_report = now + self.interval
+
+
+    def report(self, rows, now=None, done=False):
+        now = time.perf_counter() if now is None else now
+        seconds = now - self.start
+        bytes_read = self.bytes_read() if self.bytes_read is not None else None
+        if done and self.total_bytes is not None:
+            bytes_read = self.total_bytes
+
+        eta_seconds = None
+        if bytes_read and self.total_bytes is not None:
+            eta_seconds = seconds * max(self.total_bytes - bytes_read, 0) / bytes_read
+
+        self.callback({
+            'phase': self.phase,
+            'file_path': self.file_path,
+            'byte_range': self.byte_range,
+            'bytes_read': bytes_read,
+            'total_bytes': self.total_bytes,
+            'rows': rows,
+            'seconds': seconds,
+            'rows_per_second': rows / max(seconds, 1e-9),
+            'eta_seconds': eta_seconds,
+            'done': done,
+            'pid': os.getpid(),
+        })
+
+
+"""
+Returns the ProgressMeter of a runfile, None if no progress is reported in the current context
+Parameter 'bytes_read', 'total_bytes': see ProgressMeter
+"""
+def progress_meter(file_path, byte_range, bytes_read, total_bytes):
+    progress = _current_progress.get()
+    if progress is None:
+        return None
+    callback, phase, interval = progress
+    return ProgressMeter(callback, phase, interval, file_path, byte_range, bytes_read, total_bytes)
@@ -0,0 +1,146 @@
+"""
+Ranked runs
+Parser of the runfiles '<query>;<class>;<score>;<rank>' of bird_monophone, expert and geo
+Each query keeps the set of its predicted classes (line nbr of each class) and the bitmap of its ranks (bit r for
+rank r), so that the duplicated classes and the consecutive ranks are checked in constant time per line,
+and the ranks of its correct classes, the only predictions the metrics need
+The classes are interned (see class_table.py): the class of a line is tested against the bitset of the correct classes
+of its query
+The ranks are checked once the whole runfile is read, in the order of the first line of the queries
+"""
+
+from .parallel_parse import parse_ranges, raise_first_error
+from .submission_reader import SubmissionReader, line_nbr_string
+
+
+"""
+Fills 'partial' with the index of the lines yielded by 'reader' (values: query id, class index, score, rank):
+'classes': query id => {class index: line nbr}
+'rank_bits': query id => bitmap of the ranks
+'duplicate_ranks': set of the query ids with a rank given twice
+'correct_ranks': focus => query id => set of the ranks of the correct classes
+Parameter 'correct_classes': focus => query id => bitset of the correct classes of the query
+Parameter 'class_ids': class id of each class index, for the errors
+A query with a class predicted twice => Error
+"""
+def parse_ranked_range(reader, partial, correct_classes, class_ids):
+    query_classes = partial['classes'] = {}
+    query_rank_bits = partial['rank_bits'] = {}
+    duplicate_ranks = partial['duplicate_ranks'] = set()
+    correct_ranks = partial['correct_ranks'] = {focus: {} for focus in correct_classes}
+    focuses = list(correct_classes.items())
+    #bitset of the classes correct for any focus, most lines being tested against it only
+    any_correct_classes = {}
+    for focus, focus_classes in focuses:
+        for query_id, bits in focus_classes.items():
+            any_correct_classes[query_id] = any_correct_classes.get(query_id, 0) | bits
+
+    for lineCnt, (query_id, class_id, probability, rank) in reader:
+        classes = query_classes.get(query_id)
+        if classes is None:
+            classes = query_classes[query_id] = {}
+            query_rank_bits[query_id] = 0
+
+        # Same query_id combined with class_id present more than once => Error
+        if class_id in classes:
+            raise Exception("Same prediction (query_id;class_id) present more than once ({};{}) {}"
+                .format(query_id, class_ids[class_id], line_nbr_string(lineCnt)))
+        classes[class_id] = lineCnt
+
+        rank_bits = query_rank_bits[query_id]
+        if (rank_bits >> rank) & 1:
+            duplicate_ranks.add(query_id)
+        query_rank_bits[query_id] = rank_bits | (1 << rank)
+
+        if (any_correct_classes[query_id] >> class_id) & 1:
+            for focus, focus_classes in focuses:
+                if (focus_classes[query_id] >> class_id) & 1:
+                    correct_ranks[focus].setdefault(query_id, set()).add(rank)
+
+
+"""
+Merges the index of the ranges of a runfile (see common/parallel_parse.py) in file order
+The duplicated classes of the queries predicted in several ranges are checked again
+Parameter 'class_ids': see parse_ranked_range
+"""
+def merge_ranked_ranges(ranges, class_ids):
+    if len(ranges) == 1 and ranges[0][1] is None:
+        return ranges[0][0]
+
+    merged = {'classes': {}, 'rank_bits': {}, 'duplicate_ranks': set(), 'correct_ranks': {}}
+    errors = []
+    for partial, range_error in ranges:
+        for query_id, classes in partial['classes'].items():
+            rank_bits = partial['rank_bits'][query_id]
+            if not query_id in merged['classes']:
+                merged['classes'][query_id] = classes
+                merged['rank_bits'][query_id] = rank_bits
+                continue
+
+            merged_classes = merged['classes'][query_id]
+            duplicates = [(lineCnt, class_id) for class_id, lineCnt in classes.items() if class_id in merged_classes]
+            if duplicates:
+                lineCnt, class_id = min(duplicates)
+                # Same query_id combined with class_id present more than once => Error
+                errors.append((lineCnt, "Same prediction (query_id;class_id) present more than once ({};{}) {}"
+                    .format(query_id, class_ids[class_id], line_nbr_string(lineCnt))))
+                continue
+            merged_classes.update(classes)
+            if merged['rank_bits'][query_id] & rank_bits:
+                merged['duplicate_ranks'].add(query_id)
+            merged['rank_bits'][query_id] |= rank_bits
+        merged['duplicate_ranks'].update(partial['duplicate_ranks'])
+
+        for focus, ranks_of_queries in partial['correct_ranks'].items():
+            merged_ranks = merged['correct_ranks'].setdefault(focus, {})
+            for query_id, ranks in ranks_of_queries.items():
+                merged_ranks.setdefault(query_id, set()).update(ranks)
+
+        #The lines of the next ranges come after the errors of this range
+        if range_error is not None:
+            errors.append(range_error)
+        raise_first_error(errors)
+    return merged
+
+
+"""
+Checks that the ranks of every query are 1, 2, ..., n, in the order of the first line of the queries
+The lines of the first query with other ranks are read again to raise the error on the line of the original check:
+the first line, in the order of 'sort_key' (on (class index, score, rank, line nbr)), that does not have the next rank
+"""
+def check_consecutive_ranks(index, submission_file_path, schema, sort_key):
+    for query_id, rank_bits in index['rank_bits'].items():
+        #bits 1 to n set and no other bit <=> ranks 1 to n
+        if rank_bits & (rank_bits + 2) == 0 and not query_id in index['duplicate_ranks']:
+            continue
+
+        values_of_query = [(class_id, probability, rank, lineCnt)
+                           for lineCnt, (line_query_id, class_id, probability, rank) in SubmissionReader(submission_file_path, schema)
+                           if line_query_id == query_id]
+        last_rank = 0
+        for curr_class_id, curr_score, curr_rank, curr_line in sorted(values_of_query, key=sort_key):
+            #Ranking for query_id not consecutive => Error
+            if curr_rank != (last_rank+1):
+                raise Exception("Ranking must be consecutive {}"
+                    .format(line_nbr_string(curr_line)))
+            last_rank = curr_rank
+
+
+"""
+Parses and checks a ranked run, possibly in parallel (see common/parallel_parse.py)
+Parameter 'schema': SubmissionSchema of the runfile, the values of a line being (query id, class index, score, rank),
+                    the class column being the column of a ClassTable (see class_table.py)
+Parameter 'correct_classes': see parse_ranked_range
+Parameter 'class_table': ClassTable of the class column
+Parameter 'sort_key': order of the lines of a query in the check of the ranks, see check_consecutive_ranks
+Returns the index of the runfile (see parse_ranked_range)
+"""
+def load_ranked_run(submission_file_path, schema, correct_classes, class_table, sort_key, workers=1):
+    class_ids = class_table.class_ids
+
+    def parse_range(reader, partial):
+        parse_ranked_range(reader, partial, correct_classes, class_ids)
+
+    index = merge_ranked_ranges(parse_ranges(submission_file_path, schema, parse_range, workers), class_ids)
+    check_consecutive_ranks(index, submission_file_path, schema, sort_key)
+    return index
@@ -0,0 +1,54 @@
+"""
+Registry of the evaluators
+Maps each challenge name to its evaluator class and to the files shipped with the challenge
+Evaluator modules are only imported when a challenge is requested
+"""
+
+import importlib
+import os
+
+
+_ROOT_PACKAGE = __package__.rpartition('.')[0]
+_ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#challenge name => (evaluator class name, constructor parameters defaulting to files shipped in the challenge directory)
+EVALUATORS = {
+    'bird_monophone': ('BirdMonophoneEvaluator', {'allowed_classes_file_path': 'allowed_classes.txt'}),
+    'bird_soundscape': ('BirdSoundscapeEvaluator', {'allowed_classes_file_path': 'allowed_classes.txt'}),
+    'caption_prediction': ('CaptionPredictionEvaluator', {}),
+    'concept_detection': ('ConceptDetectionEvaluator', {}),
+    'expert': ('ExpertEvaluator', {'allowed_classes_file_path': 'allowed_classes.txt'}),
+    'geo': ('GeoEvaluator', {'allowed_classes_file_path': 'allowed_classes.txt'}),
+    'lifelog_adlt': ('LifelogAdltEvaluator', {'allowed_image_ids_file_path': 'allowed_image_ids.txt'}),
+    'lifelog_lmrt': ('LifelogLmrtEvaluator', {'allowed_image_ids_file_path': 'allowed_image_ids.txt',
+                                              'clusters_gt_file_path': None}),
+    'tuberculosis_mdr_detection': ('TuberculosisMdrDetectionEvaluator', {}),
+    'tuberculosis_severity_scoring': ('TuberculosisSeverityScoringEvaluator', {}),
+    'tuberculosis_tb_type': ('TuberculosisTbTypeEvaluator', {}),
+    'vqa_med': ('VqaMedEvaluator', {}),
+}
+
+
+"""
+Returns the evaluator class of a challenge
+"""
+def get_evaluator_class(challenge):
+    if challenge not in EVALUATORS:
+        raise Exception("Unknown challenge '{}'. Possible values are: {}"
+            .format(challenge, ', '.join(sorted(EVALUATORS))))
+    class_name = EVALUATORS[challenge][0]
+    module = importlib.import_module('{}.{}.{}_evaluator'.format(_ROOT_PACKAGE, challenge, challenge))
+    return getattr(module, class_name)
+
+
+"""
+Builds the evaluator of a challenge
+Parameter 'answer_file_path': Path of the ground truth file (or of a compiled snapshot)
+Parameter 'parameters': other constructor parameters, the files shipped with the challenge are used by default
+"""
+def create_evaluator(challenge, answer_file_path, **parameters):
+    evaluator_class = get_evaluator_class(challenge)
+    for name, file_name in EVALUATORS[challenge][1].items():
+        if name not in parameters:
+            parameters[name] = os.path.join(_ROOT_DIRECTORY, challenge, file_name) if file_name is not None else None
+    return evaluator_class(answer_file_path, **parameters)
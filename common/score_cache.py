@@ -0,0 +1,244 @@
+"""
+Score cache
+Content-addressed on-disk cache of the result objects, identical resubmissions are not evaluated again
+Enabled with context['score_cache_dir'] (and optionally context['score_cache_max_bytes'])
+
+The key of an entry is the hash of
+ - the content of the runfile
+ - the ground truth version (of the snapshot, or hash of the ground truth and allowed ids files)
+ - the evaluator config: its public class attributes and module level tables (e.g. the soundscape exclusion table)
+   and the source of its module and of the modules of the package it uses (e.g. the scoring code in common/)
+ - the context entries that can change the scores
+Layout: <cache dir>/<evaluator>/<hash of the ground truth path>/<ground truth version>/<key>.json
+When the ground truth of a path changes, the entries of its previous versions are removed
+The least recently used entries are evicted when the cache exceeds its size
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import tempfile
+import weakref
+
+from .snapshot import files_version
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_ROOT_PACKAGE = __package__.rpartition('.')[0]
+
+#context entries that do not change the scores
+NON_SCORING_CONTEXT_KEYS = set(['score_cache_dir', 'score_cache_max_bytes', 'telemetry', 'parse_workers',
+                                'streaming', 'streaming_sort_dir', 'streaming_run_records', 'score_workers',
+                                'progress_callback', 'progress_interval'])
+
+_JSON_TYPES = (bool, int, float, str, list, tuple, dict, set, frozenset, type(None))
+
+
+"""
+Converts numpy scalars and arrays in results to JSON serializable values
+"""
+def json_default(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+
+def _file_hash(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _jsonable(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(_jsonable(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    return value
+
+
+def _public_values(namespace):
+    return {name: _jsonable(value) for name, value in namespace.items()
+            if not name.startswith('_') and isinstance(value, _JSON_TYPES)}
+
+
+"""
+Returns the modules of the package used by a module, directly or through other modules of the package,
+the module itself included, in name order
+"""
+def package_modules(module):
+    found = {}
+    pending = [module]
+    while pending:
+        current = pending.pop()
+        if current.__name__ in found:
+            continue
+        found[current.__name__] = current
+        for value in vars(current).values():
+            name = value.__name__ if inspect.ismodule(value) else getattr(value, '__module__', None)
+            if isinstance(name, str) and name.startswith(_ROOT_PACKAGE + '.') and name in sys.modules:
+                pending.append(sys.modules[name])
+    return [found[name] for name in sorted(found)]
+
+
+"""
+Returns the config of an evaluator that can change its scores
+"""
+def evaluator_config(evaluator):
+    evaluator_class = type(evaluator)
+    module = sys.modules[evaluator_class.__module__]
+    return {
+        'evaluator': evaluator_class.__name__,
+        'class_attributes': _public_values(vars(evaluator_class)),
+        'module_tables': _public_values(vars(module)),
+        'module_sources': {package_module.__name__: _file_hash(inspect.getsourcefile(package_module))
+                           for package_module in package_modules(module)},
+    }
+
+
+"""
+Returns the version of the ground truth loaded by an evaluator
+"""
+def gt_version(evaluator):
+    if getattr(evaluator, 'snapshot', None) is not None:
+        return evaluator.snapshot.gt_version
+    source_file_paths = [vars(evaluator)[name] for name in sorted(vars(evaluator)) if name.endswith('_file_path')]
+    return files_version(source_file_paths)
+
+
+class ScoreCache:
+
+    """
+    Parameter 'cache_directory': directory of the cache (created if needed)
+    Parameter 'max_bytes': size of the cache, least recently used entries are evicted above it
+    """
+    def __init__(self, cache_directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_directory = cache_directory
+        self.max_bytes = max_bytes
+        #evaluator => (ground truth directory of its entries, ground truth version, config), computed once per evaluator
+        self._evaluator_keys = weakref.WeakKeyDictionary()
+
+
+    def _evaluator_key(self, evaluator):
+        if evaluator not in self._evaluator_keys:
+            answer_file_path = os.path.abspath(evaluator.answer_file_path)
+            gt_directory = os.path.join(self.cache_directory, type(evaluator).__name__,
+                                        hashlib.sha1(answer_file_path.encode('utf-8')).hexdigest())
+            config = json.dumps(evaluator_config(evaluator), sort_keys=True)
+            self._evaluator_keys[evaluator] = (gt_directory, gt_version(evaluator), config)
+        return self._evaluator_keys[evaluator]
+
+
+    """
+    Returns the path of the entry of a runfile evaluated with the given evaluator and context
+    """
+    def entry_path(self, evaluator, submission_file_path, context={}):
+        gt_directory, version, config = self._evaluator_key(evaluator)
+        scoring_context = {name: _jsonable(value) for name, value in context.items()
+                           if name not in NON_SCORING_CONTEXT_KEYS and isinstance(value, _JSON_TYPES)}
+        key = hashlib.sha256(json.dumps({
+            'submission': _file_hash(submission_file_path),
+            'gt_version': version,
+            'config': config,
+            'context': scoring_context,
+        }, sort_keys=True).encode('utf-8')).hexdigest()
+        return os.path.join(gt_directory, version, key + '.json')
+
+
+    """
+    Returns the cached result object of an entry, None if it is not in the cache
+    """
+    def get(self, entry_path):
+        try:
+            with open(entry_path) as f:
+                result_object = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        #last use of the entry, for the LRU eviction
+        os.utime(entry_path, None)
+        return result_object
+
+
+    """
+    Stores the result object of an entry, removes the entries of other versions of the same ground truth
+    and evicts the least recently used entries above the size of the cache
+    """
+    def put(self, entry_path, result_object):
+        version_directory = os.path.dirname(entry_path)
+        gt_directory = os.path.dirname(version_directory)
+        if not os.path.isdir(version_directory):
+            os.makedirs(version_directory)
+        for name in os.listdir(gt_directory):
+            if name != os.path.basename(version_directory):
+                shutil.rmtree(os.path.join(gt_directory, name), ignore_errors=True)
+
+        result_object = {name: value for name, value in result_object.items() if name != 'meta'}
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=version_directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w') as f:
+            json.dump(result_object, f, default=json_default)
+        os.replace(temporary_path, entry_path)
+        self.evict()
+
+
+    def evict(self):
+        entries = []
+        total_bytes = 0
+        for directory, subdirectories, file_names in os.walk(self.cache_directory):
+            for file_name in file_names:
+                if file_name.endswith('.json'):
+                    file_path = os.path.join(directory, file_name)
+                    try:
+                        status = os.stat(file_path)
+                    except OSError:
+                        continue
+                    entries.append((status.st_mtime, status.st_size, file_path))
+                    total_bytes += status.st_size
+
+        for mtime, size, file_path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            total_bytes -= size
+
+
+#cache directory => ScoreCache, so that the config and ground truth version of an evaluator are computed once
+_caches = {}
+
+
+"""
+Decorator of the _evaluate methods: returns the cached result object when context['score_cache_dir'] is set
+and the same runfile was already evaluated with the same ground truth and config
+"""
+def score_cached(evaluate):
+    @functools.wraps(evaluate)
+    def cached_evaluate(self, client_payload, context={}):
+        cache_directory = context.get('score_cache_dir')
+        if cache_directory is None:
+            return evaluate(self, client_payload, context)
+
+        if cache_directory not in _caches:
+            _caches[cache_directory] = ScoreCache(cache_directory)
+        cache = _caches[cache_directory]
+        cache.max_bytes = context.get('score_cache_max_bytes', DEFAULT_MAX_BYTES)
+
+        entry_path = cache.entry_path(self, client_payload['submission_file_path'], context)
+        result_object = cache.get(entry_path)
+        if result_object is None:
+            result_object = evaluate(self, client_payload, context)
+            if result_object is not None:
+                cache.put(entry_path, result_object)
+        return result_object
+
+    return cached_evaluate
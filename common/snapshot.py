@@ -0,0 +1,272 @@
+"""
+Ground truth snapshots
+A snapshot is a versioned binary file holding the ground truth (and allowed ids) of one challenge,
+compiled once from the text files (see compile_gt.py)
+Evaluators open it with mmap: construction does not parse any text and worker processes share the pages
+
+Layout: magic, format version, header length, JSON header, then 8-byte aligned sections
+ - array sections: raw numpy arrays
+ - string sections: interned ID tables, utf-8 strings separated by NUL bytes + int64 byte offsets
+numpy is only imported when a snapshot is written or read, so that evaluators using text files start faster
+"""
+
+import hashlib
+import json
+import mmap
+import struct
+
+
+SNAPSHOT_MAGIC = b'CLEFGT'
+SNAPSHOT_FORMAT_VERSION = 1
+
+#magic, format version, header length
+_PREAMBLE = struct.Struct('<6sHQ')
+_ALIGNMENT = 8
+
+
+"""
+Returns True if the file is a ground truth snapshot (and not a text ground truth file)
+"""
+def is_snapshot(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+    except (IOError, OSError, TypeError):
+        return False
+
+
+"""
+Returns a hash of the content of the given files, used as ground truth version
+"""
+def files_version(file_paths):
+    sha = hashlib.sha1()
+    for file_path in file_paths:
+        if file_path is None:
+            sha.update(b'\0')
+        else:
+            sha.update(b'\1')
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+    return sha.hexdigest()
+
+
+"""
+Writes a snapshot
+Parameter 'evaluator': name of the evaluator class the snapshot is made for
+Parameter 'gt_version': version (hash) of the ground truth the snapshot was compiled from
+Parameter 'arrays': dict name => numpy array (or list of numbers)
+Parameter 'strings': dict name => list of strings
+Parameter 'meta': dict of small JSON serializable values
+"""
+def write_snapshot(snapshot_file_path, evaluator, gt_version, arrays={}, strings={}, meta={}):
+    import numpy as np
+    sections = {}
+    blobs = []
+    offset = 0
+
+    def add_blob(data):
+        nonlocal offset
+        start = offset
+        padding = (-len(data)) % _ALIGNMENT
+        blobs.append(data + b'\0' * padding)
+        offset += len(data) + padding
+        return start
+
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        sections[name] = {
+            'kind': 'array',
+            'dtype': values.dtype.str,
+            'shape': list(values.shape),
+            'offset': add_blob(values.tobytes()),
+        }
+
+    for name, values in strings.items():
+        encoded = [value.encode('utf-8') for value in values]
+        if any(b'\0' in value for value in encoded):
+            raise Exception("String table '{}' contains a NUL character".format(name))
+        offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+        np.cumsum([len(value) + 1 for value in encoded], out=offsets[1:])
+        sections[name] = {
+            'kind': 'strings',
+            'count': len(encoded),
+            'offset': add_blob(b'\0'.join(encoded)),
+            'offsets_offset': add_blob(offsets.tobytes()),
+        }
+
+    header = json.dumps({
+        'evaluator': evaluator,
+        'gt_version': gt_version,
+        'meta': meta,
+        'sections': sections,
+    }).encode('utf-8')
+    header += b' ' * ((-(_PREAMBLE.size + len(header))) % _ALIGNMENT)
+
+    with open(snapshot_file_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+
+
+class StringTable:
+
+    """
+    Interned table of strings stored in a snapshot
+    table[i] returns the i-th string, table.index() maps each string to its position
+    """
+    def __init__(self, buffer, data_offset, offsets):
+        self.buffer = buffer
+        self.data_offset = data_offset
+        self.offsets = offsets
+        self._list = None
+        self._index = None
+        self._set = None
+
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+    def __getitem__(self, i):
+        if self._list is not None:
+            return self._list[i]
+        start = self.data_offset + int(self.offsets[i])
+        end = self.data_offset + int(self.offsets[i + 1]) - 1
+        return self.buffer[start:end].decode('utf-8')
+
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+
+    def tolist(self):
+        if self._list is None:
+            if len(self) == 0:
+                self._list = []
+            else:
+                end = self.data_offset + int(self.offsets[-1]) - 1
+                self._list = self.buffer[self.data_offset:end].decode('utf-8').split('\0')
+        return self._list
+
+
+    def index(self):
+        if self._index is None:
+            self._index = {value: i for i, value in enumerate(self.tolist())}
+        return self._index
+
+
+    def as_set(self):
+        if self._set is None:
+            self._set = frozenset(self.tolist())
+        return self._set
+
+
+class Snapshot:
+
+    """
+    Read-only view on a snapshot file
+    Parameter 'snapshot_file_path': Path of the snapshot
+    Parameter 'evaluator': name of the evaluator class opening the snapshot, checked against the snapshot
+    """
+    def __init__(self, snapshot_file_path, evaluator=None):
+        self.snapshot_file_path = snapshot_file_path
+        with open(snapshot_file_path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, format_version, header_length = _PREAMBLE.unpack_from(self.buffer, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise Exception("'{}' is not a ground truth snapshot".format(snapshot_file_path))
+        if format_version != SNAPSHOT_FORMAT_VERSION:
+            raise Exception("Snapshot '{}' has format version {} but version {} is expected, it must be compiled again"
+                .format(snapshot_file_path, format_version, SNAPSHOT_FORMAT_VERSION))
+
+        header = json.loads(self.buffer[_PREAMBLE.size:_PREAMBLE.size + header_length].decode('utf-8'))
+        if evaluator is not None and header['evaluator'] != evaluator:
+            raise Exception("Snapshot '{}' was compiled for {}, not for {}"
+                .format(snapshot_file_path, header['evaluator'], evaluator))
+
+        self.evaluator = header['evaluator']
+        self.gt_version = header['gt_version']
+        self.meta = header['meta']
+        self.sections = header['sections']
+        self.data_offset = _PREAMBLE.size + header_length
+        self._strings = {}
+
+
+    def __contains__(self, name):
+        return name in self.sections
+
+
+    """
+    Returns the numpy array of a section, backed by the mapped file (read-only, no copy)
+    """
+    def array(self, name):
+        import numpy as np
+        section = self.sections[name]
+        dtype = np.dtype(section['dtype'])
+        count = int(np.prod(section['shape']))
+        values = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=self.data_offset + section['offset'])
+        return values.reshape(section['shape'])
+
+
+    """
+    Returns the StringTable of a section
+    """
+    def strings(self, name):
+        if name not in self._strings:
+            import numpy as np
+            section = self.sections[name]
+            offsets = np.frombuffer(self.buffer, dtype='<i8', count=section['count'] + 1,
+                                    offset=self.data_offset + section['offsets_offset'])
+            self._strings[name] = StringTable(self.buffer, self.data_offset + section['offset'], offsets)
+        return self._strings[name]
+
+
+"""
+Compiles the ground truth loaded by an evaluator into a snapshot
+The evaluator must implement gt_snapshot_sections() returning a dict with 'arrays', 'strings' and 'meta'
+The version of the snapshot is the hash of all the '*_file_path' files the evaluator was built from
+"""
+def compile_snapshot(evaluator, snapshot_file_path):
+    source_file_paths = [vars(evaluator)[name] for name in sorted(vars(evaluator)) if name.endswith('_file_path')]
+    sections = evaluator.gt_snapshot_sections()
+    write_snapshot(snapshot_file_path,
+                   type(evaluator).__name__,
+                   files_version(source_file_paths),
+                   arrays=sections.get('arrays', {}),
+                   strings=sections.get('strings', {}),
+                   meta=sections.get('meta', {}))
+
+
+"""
+Sections of a pandas DataFrame loaded with header=None (one section per column)
+"""
+def dataframe_sections(dataframe):
+    from pandas.api.types import is_numeric_dtype
+    arrays = {}
+    strings = {}
+    for column in dataframe.columns:
+        values = dataframe[column]
+        if is_numeric_dtype(values.dtype):
+            arrays['column_{}'.format(column)] = values.values
+        else:
+            strings['column_{}'.format(column)] = [str(value) for value in values.tolist()]
+    return {'arrays': arrays, 'strings': strings, 'meta': {'columns': [int(column) for column in dataframe.columns]}}
+
+
+"""
+Rebuilds a pandas DataFrame stored with dataframe_sections
+"""
+def dataframe_from_snapshot(snapshot):
+    import numpy as np
+    import pandas as pd
+    data = {}
+    for column in snapshot.meta['columns']:
+        name = 'column_{}'.format(column)
+        if snapshot.sections[name]['kind'] == 'strings':
+            data[column] = snapshot.strings(name).tolist()
+        else:
+            data[column] = np.array(snapshot.array(name))
+    return pd.DataFrame(data, columns=snapshot.meta['columns'])
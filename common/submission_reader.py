@@ -0,0 +1,282 @@
+"""
+Submission reader
+Streams a runfile in one single pass and validates every line against a per-challenge schema
+Compressed runfiles (gzip, bzip2, xz, zstandard) are decompressed while they are read (see compressed.py)
+load_predictions of every evaluator is built on top of it
+"""
+
+import csv
+import io
+import os
+
+from .compressed import open_text
+from .progress import CHECK_ROWS, progress_meter
+from .telemetry import record_rows
+
+
+def line_nbr_string(line_nbr):
+    return "(Line nbr {})".format(line_nbr)
+
+
+class Column:
+
+    """
+    Describes one token of a line in a runfile
+    Parameter 'index': position of the token in the line
+    Parameter 'error': message raised if the token is invalid. Can use {value} (raw token), {line} and {allowed}
+    Parameter 'parse': turns the raw token into a typed value (str, int, float, ...), a ValueError means invalid
+    Parameter 'strip': strip whitespaces around the token before parsing
+    Parameter 'allowed': set (or dict) the typed value must be contained in
+    Parameter 'min_value', 'max_value': range (inclusive) of the typed value
+    Parameter 'check': callable(value, line_nbr) for checks that raise their own error
+    Parameter 'default': value used when the token is optional and missing in the line
+    """
+    def __init__(self, index, error=None,
+                        parse=str,
+                        strip=False,
+                        allowed=None,
+                        min_value=None,
+                        max_value=None,
+                        check=None,
+                        default=None):
+        self.index = index
+        self.error = error
+        self.parse = parse
+        self.strip = strip
+        self.allowed = allowed
+        self.min_value = min_value
+        self.max_value = max_value
+        self.check = check
+        self.default = default
+
+
+class SubmissionSchema:
+
+    """
+    Describes the format of a runfile
+    Parameter 'columns': list of Column objects, validated in the order of the list
+    Parameter 'delimiter': token delimiter of the runfile
+    Parameter 'min_fields', 'max_fields': allowed number of tokens per line (max_fields None => no upper bound)
+    Parameter 'arity_error': message raised if a line has a wrong number of tokens. Can use {line}
+    Parameter 'max_fields_error': message raised if a line has too many tokens (defaults to arity_error)
+    Parameter 'row_check': callable(values, line_nbr) for checks involving several tokens, run after the column checks
+    Parameter 'unique': indexes of the tokens forming a key that must not appear twice in the runfile
+    Parameter 'unique_error': message raised for a duplicated key. Can use {0}, {1}, ... (key tokens) and {line}
+    Parameter 'terminator': single token line ending the validated section of the runfile
+    Parameter 'terminator_error': message raised for a single token line that is not the terminator
+    """
+    def __init__(self, columns, delimiter,
+                        min_fields,
+                        max_fields=-1,
+                        arity_error=None,
+                        max_fields_error=None,
+                        row_check=None,
+                        unique=None,
+                        unique_error=None,
+                        terminator=None,
+                        terminator_error=None):
+        self.columns = columns
+        self.delimiter = delimiter
+        self.min_fields = min_fields
+        #Same number of tokens on each line by default
+        self.max_fields = min_fields if max_fields == -1 else max_fields
+        self.arity_error = arity_error
+        self.max_fields_error = max_fields_error if max_fields_error is not None else arity_error
+        self.row_check = row_check
+        self.unique = tuple(unique) if unique is not None else None
+        self.unique_error = unique_error
+        self.terminator = terminator
+        self.terminator_error = terminator_error
+
+        #Defaults for optional tokens missing at the end of a line
+        nbr_declared = max([column.index for column in columns] + [min_fields - 1]) + 1
+        self.defaults = [None] * nbr_declared
+        for column in columns:
+            self.defaults[column.index] = column.default
+
+
+class SubmissionReader:
+
+    """
+    Iterating over a reader yields (line_nbr, values) for every line of the runfile
+    'values' is the list of tokens of the line, typed and validated according to the schema
+    The first invalid line raises an Exception and stops the iteration
+    Parameter 'submission_file_path': Path of the submitted runfile
+    Parameter 'schema': SubmissionSchema of the runfile
+    Parameter 'byte_range': (start, end) offsets of the lines to read in an uncompressed runfile, None => whole runfile
+    Parameter 'first_line_nbr': nbr of the first line read, in the whole runfile
+    """
+    def __init__(self, submission_file_path, schema, byte_range=None, first_line_nbr=1):
+        self.submission_file_path = submission_file_path
+        self.schema = schema
+        self.byte_range = byte_range
+        #Nbr of the last line read so far
+        self.line_count = first_line_nbr - 1
+        self.first_line_nbr = first_line_nbr
+        #Keys (schema.unique) that occured so far
+        self.seen = set()
+        #True if the iteration stopped on the terminator line
+        self.terminated = False
+
+
+    def __iter__(self):
+        try:
+            yield from self._read()
+        finally:
+            record_rows(self.line_count - self.first_line_nbr + 1)
+
+
+    def _read(self):
+        with self._open() as csvfile:
+            reader = csv.reader(csvfile, delimiter=self.schema.delimiter, quoting=csv.QUOTE_NONE)
+            #Progress reports (see progress.py), None => not reported
+            meter = self._progress_meter(csvfile)
+            try:
+                yield from self._read_rows(reader, meter)
+            finally:
+                if meter is not None:
+                    meter.report(self.line_count - self.first_line_nbr + 1, done=True)
+
+
+    def _read_rows(self, reader, meter):
+        schema = self.schema
+        columns = [(column.index, column.error, column.parse, column.strip, column.allowed,
+                    column.min_value, column.max_value, column.check) for column in schema.columns]
+        defaults = schema.defaults
+        nbr_declared = len(defaults)
+        row_check = schema.row_check
+        unique = schema.unique
+        single_key = unique is not None and len(unique) == 1
+        seen = self.seen
+        first_line_nbr = self.first_line_nbr
+
+        for row in reader:
+            self.line_count += 1
+            line_nbr = self.line_count
+            nbr_fields = len(row)
+
+            if meter is not None and line_nbr % CHECK_ROWS == 0:
+                meter.update(line_nbr - first_line_nbr + 1)
+
+            # Single token line: end of the validated section or => Error
+            if schema.terminator is not None and nbr_fields == 1:
+                if row[0] == schema.terminator:
+                    self.terminated = True
+                    return
+                if schema.terminator_error is not None:
+                    raise Exception(schema.terminator_error.format(line=line_nbr_string(line_nbr)))
+
+            # Wrong nbr of tokens on line => Error
+            if nbr_fields < schema.min_fields:
+                raise Exception(schema.arity_error.format(line=line_nbr_string(line_nbr)))
+            if schema.max_fields is not None and nbr_fields > schema.max_fields:
+                raise Exception(schema.max_fields_error.format(line=line_nbr_string(line_nbr)))
+
+            if nbr_fields < nbr_declared:
+                row.extend(defaults[nbr_fields:])
+
+            for index, error, parse, strip, allowed, min_value, max_value, check in columns:
+                # Optional token missing => default value, no validation
+                if index >= nbr_fields:
+                    continue
+
+                token = row[index]
+                if strip:
+                    token = token.strip()
+
+                # Token cannot be parsed, is out of range or not allowed => Error
+                try:
+                    value = parse(token)
+                    if min_value is not None and value < min_value:
+                        raise ValueError
+                    if max_value is not None and value > max_value:
+                        raise ValueError
+                    if allowed is not None and value not in allowed:
+                        raise ValueError
+                except ValueError:
+                    raise Exception(error.format(value=token, allowed=allowed, line=line_nbr_string(line_nbr)))
+
+                if check is not None:
+                    check(value, line_nbr)
+
+                row[index] = value
+
+            if row_check is not None:
+                row_check(row, line_nbr)
+
+            # Key already occured in runfile => Error
+            if unique is not None:
+                key = row[unique[0]] if single_key else tuple([row[i] for i in unique])
+                if key in seen:
+                    key_tokens = (key,) if single_key else key
+                    raise Exception(schema.unique_error.format(*key_tokens, line=line_nbr_string(line_nbr)))
+                seen.add(key)
+
+            yield line_nbr, row
+
+
+    """
+    Returns the ProgressMeter of the runfile (see progress.py), the bytes read are unknown for a compressed runfile
+    """
+    def _progress_meter(self, csvfile):
+        raw = getattr(csvfile.buffer, 'raw', None)
+        bytes_read = total_bytes = None
+        if isinstance(raw, _ByteRange):
+            bytes_read, total_bytes = raw.tell, raw.size
+        elif isinstance(raw, io.FileIO):
+            bytes_read, total_bytes = raw.tell, os.fstat(raw.fileno()).st_size
+        return progress_meter(self.submission_file_path, self.byte_range, bytes_read, total_bytes)
+
+
+    def _open(self):
+        if self.byte_range is None:
+            return open_text(self.submission_file_path)
+        start, end = self.byte_range
+        return io.TextIOWrapper(io.BufferedReader(_ByteRange(self.submission_file_path, start, end)))
+
+
+    """
+    Reads the whole runfile and returns the typed tokens as columns (one list per token index)
+    """
+    def read_columns(self):
+        columns = [[] for i in range(len(self.schema.defaults))]
+        for line_nbr, values in self:
+            for index, column in enumerate(columns):
+                column.append(values[index])
+        return columns
+
+
+class _ByteRange(io.RawIOBase):
+
+    """
+    Binary stream of the bytes between two offsets of a file
+    """
+    def __init__(self, file_path, start, end):
+        self.file = open(file_path, 'rb')
+        self.file.seek(start)
+        self.size = end - start
+        self.remaining = self.size
+
+
+    def readable(self):
+        return True
+
+
+    """
+    Returns the nbr of bytes of the range read so far
+    """
+    def tell(self):
+        return self.size - self.remaining
+
+
+    def readinto(self, buffer):
+        data = self.file.read(min(len(buffer), self.remaining))
+        self.remaining -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        super().close()
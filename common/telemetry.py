@@ -0,0 +1,107 @@
+"""
+Telemetry
+Opt-in measures of the phases of an evaluation (load_gt, load_predictions, each metric):
+wall time, CPU time, peak resident memory of the process so far and its growth during the phase,
+and rows/second when rows were read
+Enabled with context['telemetry'] = True or with the debug_mode of the evaluator
+The measures are returned in the 'meta' block of the result object and logged as one JSON line per phase
+on the logger 'CLEF_evaluators_2018.telemetry'
+The phases also report the progress of the runfiles they read to context['progress_callback'] (see progress.py)
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import resource
+import time
+
+from .progress import DEFAULT_INTERVAL_SECONDS, report_progress
+
+
+logger = logging.getLogger(__package__.rpartition('.')[0] + '.telemetry')
+
+#measures of the phase running in the current context, receive the rows counted by record_rows
+_current_measures = contextvars.ContextVar('telemetry_measures', default=None)
+
+
+"""
+Adds rows read (e.g. lines of a runfile) to the measures of the running phase, if any
+"""
+def record_rows(nbr_rows):
+    measures = _current_measures.get()
+    if measures is not None:
+        measures['rows'] = measures.get('rows', 0) + nbr_rows
+
+
+"""
+Measures the code run inside the 'with' block, the dict of measures is filled when the block exits
+The peak resident memory is the one of the process since it started ('process_peak_rss_kb', it includes the
+previous phases), 'peak_rss_growth_kb' is its increase during the phase (0 when the phase stays below the
+previous peak)
+"""
+@contextlib.contextmanager
+def measure_phase():
+    measures = {}
+    token = _current_measures.set(measures)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    #kilobytes on Linux
+    peak_rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        yield measures
+    finally:
+        _current_measures.reset(token)
+        measures['seconds'] = time.perf_counter() - wall_start
+        measures['cpu_seconds'] = time.process_time() - cpu_start
+        measures['process_peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        measures['peak_rss_growth_kb'] = measures['process_peak_rss_kb'] - peak_rss_start
+        if 'rows' in measures:
+            measures['rows_per_second'] = measures['rows'] / max(measures['seconds'], 1e-9)
+
+
+class Telemetry:
+
+    """
+    Measures of one evaluation
+    Parameter 'evaluator': the evaluator, its measures of load_gt (load_gt_measures) are reported as first phase
+    Parameter 'context': context given to _evaluate, context['telemetry'] overrides the debug_mode of the evaluator,
+                         context['progress_callback'] and context['progress_interval'] see progress.py
+    """
+    def __init__(self, evaluator, context={}):
+        self.evaluator = type(evaluator).__name__
+        self.enabled = bool(context.get('telemetry', getattr(evaluator, 'debug_mode', False)))
+        self.progress_callback = context.get('progress_callback')
+        self.progress_interval = context.get('progress_interval', DEFAULT_INTERVAL_SECONDS)
+        self.phases = {}
+        if self.enabled and getattr(evaluator, 'load_gt_measures', None) is not None:
+            self.add_phase('load_gt', evaluator.load_gt_measures)
+
+
+    def add_phase(self, name, measures):
+        self.phases[name] = measures
+        logger.info(json.dumps(dict(measures, evaluator=self.evaluator, phase=name), sort_keys=True))
+
+
+    """
+    Measures the code run inside the 'with' block as phase 'name' (nothing is measured if disabled)
+    and reports the progress of the runfiles read in the block
+    """
+    @contextlib.contextmanager
+    def phase(self, name):
+        with report_progress(self.progress_callback, name, self.progress_interval):
+            if not self.enabled:
+                yield None
+                return
+            with measure_phase() as measures:
+                yield measures
+        self.add_phase(name, measures)
+
+
+    """
+    Adds the 'meta' block to the result object (if enabled) and returns it
+    """
+    def result(self, result_object):
+        if self.enabled and result_object is not None:
+            result_object['meta'] = {'phases': self.phases}
+        return result_object
@@ -1 +1,6 @@
-from .concept_detection_evaluator import ConceptDetectionEvaluator
+#The evaluator module is only imported when ConceptDetectionEvaluator is accessed
+def __getattr__(name):
+    if name == 'ConceptDetectionEvaluator':
+        from .concept_detection_evaluator import ConceptDetectionEvaluator
+        return ConceptDetectionEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
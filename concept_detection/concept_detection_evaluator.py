@@ -1,5 +1,9 @@
 import csv
-from sklearn.metrics import f1_score
+
+from ..common.snapshot import Snapshot, is_snapshot
+from ..common.submission_reader import Column, SubmissionSchema, SubmissionReader
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
 """
 Evaluator class
 Evaluates one single runfile
@@ -13,8 +17,13 @@ class ConceptDetectionEvaluator:
     """
     def __init__(self, answer_file_path, debug_mode=False):
       self.answer_file_path = answer_file_path
+      #Measures of the phases returned with the result (see common/telemetry.py)
+      self.debug_mode = debug_mode
+      #Ground truth snapshot (if answer_file_path is a compiled snapshot)
+      self.snapshot = None
       #Ground truth pairs {image_id:concepts}
-      self.gt_pairs = self.load_gt()
+      with measure_phase() as self.load_gt_measures:
+        self.gt_pairs = self.load_gt()
 
 
     """
@@ -22,11 +31,15 @@ class ConceptDetectionEvaluator:
     Parameter 'submission_file_path': Path of the submitted runfile
     returns a _result_object that can contain up to 2 different scores
     """
+    @score_cached
     def _evaluate(self, client_payload, context={}):
       submission_file_path = client_payload['submission_file_path']
+      telemetry = Telemetry(self, context)
 
-      candidate_pairs = self.load_predictions(submission_file_path)
-      f1_score = self.compute_f1(candidate_pairs)
+      with telemetry.phase('load_predictions'):
+          candidate_pairs = self.load_predictions(submission_file_path)
+      with telemetry.phase('compute_f1'):
+          f1_score = self.compute_f1(candidate_pairs)
 
     #  _result_object = {
     #      "f1": f1_score,
@@ -37,7 +50,7 @@ class ConceptDetectionEvaluator:
           "score": f1_score,
           "score_secondary" : 0
       }
-      return _result_object
+      return telemetry.result(_result_object)
 
 
 
@@ -49,68 +62,67 @@ class ConceptDetectionEvaluator:
     """
     def load_predictions(self, submission_file_path):
         pairs = {}
-        image_ids_gt = set(self.gt_pairs.keys())
-        max_num_concepts = 1286 # max num concepts for an image in gt file
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter='\t', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
-            occured_images = []
-            for row in reader:
-                lineCnt += 1
-
-                # empty line => Error
-                if(len(row) < 1):
-                    raise Exception("Wrong format: Each line must at least consist of an image ID {}"
-                        .format(self.line_nbr_string(lineCnt)))
-                #in case more than 2 tab separated tokens => Error
-                elif(len(row) > 2):
-                    raise Exception("Wrong format: Line consist of more than 2 tokens separated by a tab {}"
-                        .format(self.line_nbr_string(lineCnt)))
-
-                image_id = row[0]
+        image_ids_gt = self.gt_pairs.keys()
+        schema = SubmissionSchema([
                 # Image ID does not exist in testset => Error
-                if image_id not in image_ids_gt:
-                    raise Exception("Image ID '{}' in submission file does not exist in testset {}"
-                        .format(image_id,self.line_nbr_string(lineCnt)))
-
-                # more than max num concepts for image => Error
-                if len(row) > 1:
-                    concepts = row[1].split(";");
-                    if len(concepts) > max_num_concepts:
-                        raise Exception("There must be between 0 and {} concepts per image {}"
-                            .format(max_num_concepts,self.line_nbr_string(lineCnt)))
-
-                # concept(s) specified more than once for an image => Error
-                if len(concepts) != len(set(concepts)):
-                    raise Exception("Same concept was specified more than once for image ID '{}' {}"
-                        .format(image_id, self.line_nbr_string(lineCnt)))
-
-                # image id occured at least twice in file => Error
-                if image_id in occured_images:
-                    raise Exception("Image ID '{}' was specified more than once in submission file {}"
-                        .format(image_id, self.line_nbr_string(lineCnt)))
-
-                occured_images.append(image_id)
-
-                # Now add image with concepts to final dict
-                # We have an ID and a set of concepts (possibly empty) => OK
-                if len(row) == 2:
-                    pairs[image_id] = row[1]
-                # We only have an ID => OK
-                elif len(row) == 1:
-                    pairs[image_id] = ''
-
-            # In case not all images from the testset are contained in the file => Error
-            if(len(occured_images) != len (image_ids_gt)):
-                raise Exception("Number of image IDs in submission file not equal to number of image IDs in testset")
+                Column(0, allowed=image_ids_gt,
+                    error="Image ID '{value}' in submission file does not exist in testset {line}"),
+                # We only have an ID => empty set of concepts
+                Column(1, default='')
+            ],
+            delimiter='\t',
+            # empty line => Error
+            min_fields=1,
+            arity_error="Wrong format: Each line must at least consist of an image ID {line}",
+            #in case more than 2 tab separated tokens => Error
+            max_fields=2,
+            max_fields_error="Wrong format: Line consist of more than 2 tokens separated by a tab {line}",
+            row_check=self.check_concepts,
+            # image id occured at least twice in file => Error
+            unique=[0],
+            unique_error="Image ID '{0}' was specified more than once in submission file {line}")
+
+        reader = SubmissionReader(submission_file_path, schema)
+        for lineCnt, (image_id, concepts) in reader:
+            # Now add image with concepts to final dict
+            # We have an ID and a set of concepts (possibly empty) => OK
+            pairs[image_id] = concepts
+
+        # In case not all images from the testset are contained in the file => Error
+        if(len(reader.seen) != len (image_ids_gt)):
+            raise Exception("Number of image IDs in submission file not equal to number of image IDs in testset")
 
         return pairs
 
 
+    """
+    Checks the concepts of a line (row) of the runfile
+    """
+    def check_concepts(self, row, lineCnt):
+        max_num_concepts = 1286 # max num concepts for an image in gt file
+        image_id, concepts = row
+        if concepts == '':
+            return
+
+        # more than max num concepts for image => Error
+        concepts = concepts.split(";")
+        if len(concepts) > max_num_concepts:
+            raise Exception("There must be between 0 and {} concepts per image {}"
+                .format(max_num_concepts,self.line_nbr_string(lineCnt)))
+
+        # concept(s) specified more than once for an image => Error
+        if len(concepts) != len(set(concepts)):
+            raise Exception("Same concept was specified more than once for image ID '{}' {}"
+                .format(image_id, self.line_nbr_string(lineCnt)))
+
+
     """
     Load and return groundtruth data
     """
     def load_gt(self):
+        if is_snapshot(self.answer_file_path):
+            return self.load_gt_snapshot()
+
         pairs = {}
         with open(self.answer_file_path) as csvfile:
             reader = csv.reader(csvfile, delimiter='\t', quoting=csv.QUOTE_NONE)
@@ -126,6 +138,25 @@ class ConceptDetectionEvaluator:
         return pairs
 
 
+    """
+    Load and return groundtruth data from a compiled snapshot (see common/snapshot.py)
+    """
+    def load_gt_snapshot(self):
+        self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+        image_ids = self.snapshot.strings('image_ids').tolist()
+        concepts = self.snapshot.strings('concepts').tolist()
+        return dict(zip(image_ids, concepts))
+
+
+    """
+    Return the sections of the groundtruth snapshot (see common/snapshot.py)
+    """
+    def gt_snapshot_sections(self):
+        return {
+            'strings': {'image_ids': list(self.gt_pairs), 'concepts': list(self.gt_pairs.values())}
+        }
+
+
     """
     Compute and return the primary score
     Parameter 'predictions' : predictions object generated by the load_predictions method
@@ -134,6 +165,9 @@ class ConceptDetectionEvaluator:
     Valiation should be handled in the load_predictions method
     """
     def compute_f1(self,candidate_pairs):
+        # scikit-learn is slow to import, it is only loaded when the score is computed
+        from sklearn.metrics import f1_score
+
         # Define max score and current score
         max_score = len(self.gt_pairs) #nbr images
         current_score = 0
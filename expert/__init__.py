@@ -1 +1,6 @@
-from .expert_evaluator import ExpertEvaluator
+#The evaluator module is only imported when ExpertEvaluator is accessed
+def __getattr__(name):
+    if name == 'ExpertEvaluator':
+        from .expert_evaluator import ExpertEvaluator
+        return ExpertEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
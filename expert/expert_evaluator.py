@@ -1,4 +1,9 @@
-import csv
+from ..common.snapshot import Snapshot, is_snapshot
+from ..common.submission_reader import Column, SubmissionSchema
+from ..common.ranked_run import load_ranked_run
+from ..common.class_table import ClassTable
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
 """
 Evaluator class
 Evaluates one single runfile
@@ -13,13 +18,21 @@ class ExpertEvaluator:
     def __init__(self, answer_file_path, allowed_classes_file_path, debug_mode=False):
         #Ground truth file
         self.answer_file_path = answer_file_path
-
-        #Ground truth data
-        self.gt = self.load_gt()
+        #Measures of the phases returned with the result (see common/telemetry.py)
+        self.debug_mode = debug_mode
 
         #allowed ids files in the predictions files
         self.allowed_classes_file_path = allowed_classes_file_path
 
+        #Ground truth snapshot (if answer_file_path is a compiled snapshot)
+        self.snapshot = None
+
+        #Ground truth data
+        with measure_phase() as self.load_gt_measures:
+            self.gt = self.load_gt()
+            #Class ids of the runfiles interned once (see common/class_table.py)
+            self.class_table = ClassTable(self.load_allowed_classes())
+
 
 
     """
@@ -27,18 +40,23 @@ class ExpertEvaluator:
     Parameter 'submission_file_path': Path of the submitted runfile
     returns a _result_object that can contain up to 2 different scores
     """
+    @score_cached
     def _evaluate(self, client_payload, context={}):
         submission_file_path = client_payload['submission_file_path']
+        telemetry = Telemetry(self, context)
         #Load predictions
-        predictions = self.load_predictions(submission_file_path)
+        with telemetry.phase('load_predictions'):
+            predictions = self.load_predictions(submission_file_path)
 
         # First: Top-1 Accuracy (observations identified by experts)
         # Second: Top-1 Accuracy (all observations)
 
         #Compute first score
-        top_1_experts = self.compute_top_1_experts(predictions)
+        with telemetry.phase('compute_top_1_experts'):
+            top_1_experts = self.compute_top_1_experts(predictions)
         #Compute second score
-        top_1_all = self.compute_top_1_all(predictions)
+        with telemetry.phase('compute_top_1_all'):
+            top_1_all = self.compute_top_1_all(predictions)
 
         #Create object that is returned to the CrowdAI framework
         #_result_object = {
@@ -51,12 +69,15 @@ class ExpertEvaluator:
             "score_secondary" : top_1_all
         }
 
-        return _result_object
+        return telemetry.result(_result_object)
 
     """
     Load and return groundtruth data
     """
     def load_gt(self):
+        if is_snapshot(self.answer_file_path):
+            return self.load_gt_snapshot()
+
         gt = {}
         with open(self.answer_file_path) as f:
             for line in f.readlines():
@@ -67,12 +88,37 @@ class ExpertEvaluator:
                 gt[query] = [classid,source]
         return gt
 
+    """
+    Load and return groundtruth data from a compiled snapshot (see common/snapshot.py)
+    """
+    def load_gt_snapshot(self):
+        self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+        queries = self.snapshot.strings('queries').tolist()
+        classes = self.snapshot.strings('classes').tolist()
+        sources = self.snapshot.strings('sources').tolist()
+        gt = {}
+        for query, classid, source in zip(queries, classes, sources):
+            gt[query] = [classid,source]
+        return gt
+
+    """
+    Return the sections of the groundtruth snapshot (see common/snapshot.py)
+    """
+    def gt_snapshot_sections(self):
+        return {
+            'strings': {'queries': list(self.gt),
+                        'classes': [self.gt[query][0] for query in self.gt],
+                        'sources': [self.gt[query][1] for query in self.gt],
+                        'allowed_classes': sorted(self.load_allowed_classes())}
+        }
+
     """
     Load and return allowed class ids in the predictions files
     """
     def load_allowed_classes(self):
-        #...
-        #return gt
+        if self.snapshot is not None:
+            return self.snapshot.strings('allowed_classes').as_set()
+
         allowed_classes = set()
         with open(self.allowed_classes_file_path) as f:
             for classid in f.readlines():
@@ -92,104 +138,44 @@ class ExpertEvaluator:
         #is_valid = self.check_predictions(submission_file_path)
 
         allowed_queries = self.gt.keys()
-        allowed_classes = self.load_allowed_classes()
 
         max_rank = 100 #max nbr of classes for observation
         query_to_correct_classid_rank = {}
 
 
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter=';', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
-            occured_observations = {}
-
-            for row in reader:
-                lineCnt += 1
-                # Not 4 comma separated tokens on line => Error
-                if len(row) != 4:
-                    raise Exception("Wrong format: Each line must consist of a observation ID, class ID, score and a rank separated by semicolons ({}) {}"
-                        .format("<observation_id>;<class_id><score>;<rank>", self.line_nbr_string(lineCnt)))
-
-                query_id = row[0]
+        schema = SubmissionSchema([
                 # Query ID not in testset => Error
-                if query_id not in allowed_queries:
-                    raise Exception("Observation ID '{}' in submission file does not exist in testset {}"
-                        .format(query_id, self.line_nbr_string(lineCnt)))
-
-                class_id = row[1]
-                # Query ID not in testset => Error
-                if class_id not in allowed_classes:
-                    raise Exception("'{}' is not a valid class ID {}"
-                        .format(class_id, self.line_nbr_string(lineCnt)))
-
+                Column(0, allowed=allowed_queries,
+                    error="Observation ID '{value}' in submission file does not exist in testset {line}"),
+                # Class ID not in testset => Error
+                self.class_table.column(1,
+                    error="'{value}' is not a valid class ID {line}"),
                 #NOT NEEDED ACCORDING TO HERVÉ GEOAU
                 # # 3rd value in line is not a number or not between 0 and 1 => Error
-                # try:
-                #     probability = float(row[2])
-                #     if probability < 0 or probability > 1:
-                #         raise ValueError
-                # except ValueError:
-                #     raise Exception("Score must be a number between 0 and 1 {}"
-                #         .format(self.line_nbr_string(lineCnt)))
-
+                # Column(2, parse=float, min_value=0, max_value=1,
+                #     error="Score must be a number between 0 and 1 {line}"),
 
                 # 3rd value in line is not a number  => Error
-                try:
-                    probability = float(row[2])
-                except ValueError:
-                    raise Exception("Score must be a number {}"
-                        .format(self.line_nbr_string(lineCnt)))
-
+                Column(2, parse=float,
+                    error="Score must be a number {line}"),
                 # Rank not an int between 1 and 100 => Error
-                try:
-                    rank = int(row[3])
-                    if rank < 1 or rank > max_rank:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("Rank 'must be an integer between 1 and 100 {}"
-                        .format(self.line_nbr_string(lineCnt)))
-
-
-                values_for_observation = occured_observations.get(query_id,list())
-                class_ids_for_observation = [tup[0] for tup in values_for_observation]
-
-                # Same query_id combined with class_id present more than once => Error
-                if class_id in class_ids_for_observation:
-                    raise Exception("Same prediction (query_id;class_id) present more than once ({};{}) {}"
-                        .format(query_id, class_id, self.line_nbr_string(lineCnt)))
-
-                #add tuple to observations
-                values_for_observation.append((class_id, probability, rank, lineCnt))
-                occured_observations[query_id] = values_for_observation
-
-                #add to dict. this dict will be returned by the function later
-                if class_id == self.gt[query_id][0]:
-                    query_to_correct_classid_rank[query_id] = rank
-
-
-            for q_id in occured_observations:
-                observation_values_sorted = sorted(occured_observations[q_id], key=lambda tup: (tup[2],tup[1]) )
-                last_rank = 0
-                #NOT NEEDED ACCORDING TO HERVÉ GEOAU
-                #last_score = 1.1
-
-                for values in observation_values_sorted:
-                    curr_class_id, curr_score, curr_rank, curr_line = values
-
-                    #Ranking for query_id not consecutive => Error
-                    if curr_rank != (last_rank+1):
-                        raise Exception("Ranking must be consecutive {}"
-                            .format(self.line_nbr_string(curr_line)))
-
-                    #NOT NEEDED ACCORDING TO HERVÉ GEOAU
-                    # if curr_score > last_score:
-                    #     raise Exception("Score must be in descending order (curr_score <= previous score) with respect to the ranking {}"
-                    #         .format(self.line_nbr_string(curr_line)))
-
-                    last_rank, last_score = curr_rank, curr_score
-
-
-            #All queries included?
+                Column(3, parse=int, min_value=1, max_value=max_rank,
+                    error="Rank 'must be an integer between 1 and 100 {line}")
+            ],
+            delimiter=';',
+            min_fields=4,
+            # Not 4 comma separated tokens on line => Error
+            arity_error="Wrong format: Each line must consist of a observation ID, class ID, score and a rank separated by semicolons (<observation_id>;<class_id><score>;<rank>) {line}")
+
+        #The ranks of an observation are checked in rank order, then in score order
+        correct_classes = {'correct': {query: self.class_table.bits([self.gt[query][0]]) for query in self.gt}}
+        index = load_ranked_run(submission_file_path, schema, correct_classes, self.class_table,
+                                sort_key=lambda tup: (tup[2],tup[1]))
+        for query_id, ranks in index['correct_ranks']['correct'].items():
+            query_to_correct_classid_rank[query_id] = min(ranks)
+
+
+        #All queries included?
 
         return query_to_correct_classid_rank
 
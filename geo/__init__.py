@@ -1 +1,6 @@
-from .geo_evaluator import GeoEvaluator
+#The evaluator module is only imported when GeoEvaluator is accessed
+def __getattr__(name):
+    if name == 'GeoEvaluator':
+        from .geo_evaluator import GeoEvaluator
+        return GeoEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
@@ -1,4 +1,9 @@
-import csv
+from ..common.snapshot import Snapshot, is_snapshot
+from ..common.submission_reader import Column, SubmissionSchema
+from ..common.ranked_run import load_ranked_run
+from ..common.class_table import ClassTable
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
 """
 Evaluator class
 Evaluates one single runfile
@@ -13,21 +18,32 @@ class GeoEvaluator:
 	def __init__(self, answer_file_path, allowed_classes_file_path, debug_mode=False):
 		#Ground truth file
 		self.answer_file_path = answer_file_path
-		#Ground truth data
-		self.gt = self.load_gt()
+		#Measures of the phases returned with the result (see common/telemetry.py)
+		self.debug_mode = debug_mode
 		#allowed ids files in the predictions files
 		self.allowed_classes_file_path = allowed_classes_file_path
+		#Ground truth snapshot (if answer_file_path is a compiled snapshot)
+		self.snapshot = None
+		#Ground truth data
+		with measure_phase() as self.load_gt_measures:
+			self.gt = self.load_gt()
+			#Class ids of the runfiles interned once (see common/class_table.py)
+			self.class_table = ClassTable(self.load_allowed_classes())
 	"""
 	This is the only method that will be called by the framework
 	Parameter 'submission_file_path': Path of the submitted runfile
 	returns a _result_object that can contain up to 2 different scores
 	"""
+	@score_cached
 	def _evaluate(self, client_payload, context={}):
 		submission_file_path = client_payload['submission_file_path']
+		telemetry = Telemetry(self, context)
 		#Load predictions
-		predictions = self.load_predictions(submission_file_path)
+		with telemetry.phase('load_predictions'):
+			predictions = self.load_predictions(submission_file_path)
 		# Metric :MRR
-		mrr = self.compute_top_1_experts(predictions)
+		with telemetry.phase('compute_top_1_experts'):
+			mrr = self.compute_top_1_experts(predictions)
 		#Create object that is returned to the CrowdAI framework
 		#_result_object = { "MRR": mrr }
 
@@ -35,12 +51,14 @@ class GeoEvaluator:
             "score": mrr,
             "score_secondary" : 0
         }
-		return _result_object
+		return telemetry.result(_result_object)
 
 	"""
 	Load and return groundtruth data
 	"""
 	def load_gt(self):
+		if is_snapshot(self.answer_file_path):
+			return self.load_gt_snapshot()
 		gt = {}
 		with open(self.answer_file_path) as f:
 			for line in f.readlines():
@@ -52,10 +70,28 @@ class GeoEvaluator:
 				gt[query] = classid
 		return gt
 	"""
+	Load and return groundtruth data from a compiled snapshot (see common/snapshot.py)
+	"""
+	def load_gt_snapshot(self):
+		self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+		queries = self.snapshot.strings('queries').tolist()
+		classes = self.snapshot.strings('classes').tolist()
+		return dict(zip(queries, classes))
+	"""
+	Return the sections of the groundtruth snapshot (see common/snapshot.py)
+	"""
+	def gt_snapshot_sections(self):
+		return {
+			'strings': {'queries': list(self.gt),
+						'classes': list(self.gt.values()),
+						'allowed_classes': sorted(self.load_allowed_classes())}
+		}
+	"""
 	Load and return allowed class ids in the predictions files
 	"""
 	def load_allowed_classes(self):
-		#return gt
+		if self.snapshot is not None:
+			return self.snapshot.strings('allowed_classes').as_set()
 		allowed_classes = set()
 		with open(self.allowed_classes_file_path) as f:
 			for classid in f.readlines():
@@ -72,72 +108,37 @@ class GeoEvaluator:
 		#returns predictions
 		#is_valid = self.check_predictions(submission_file_path)
 		allowed_queries = self.gt.keys()
-		allowed_classes = self.load_allowed_classes()
 		max_rank = 100 #max nbr of classes for observation
 		query_to_correct_classid_rank = {}
 		#absent_queries=[]
-		with open(submission_file_path) as csvfile:
-			reader = csv.reader(csvfile, delimiter=';', quoting=csv.QUOTE_NONE)
-			lineCnt = 0
-			occured_observations = {}
-
-			for row in reader:
-				lineCnt += 1
-				if len(row) != 4:
-					raise Exception("Wrong format: Each line must consist of a query ID, class ID, score and a rank separated by semicolons ({}) {}"
-						.format("<query_id>;<class_id><score>;<rank>", self.line_nbr_string(lineCnt)))
-				query_id = row[0]
-				# Query ID not in testset => Error
-				if query_id not in allowed_queries:
-					raise Exception("Query ID '{}' in submission file does not exist in testset {}"
-						.format(query_id, self.line_nbr_string(lineCnt)))
-				class_id = row[1]
+		schema = SubmissionSchema([
 				# Query ID not in testset => Error
-				if class_id not in allowed_classes:
-					raise Exception("'{}' is not a valid class ID {}"
-						.format(class_id, self.line_nbr_string(lineCnt)))
+				Column(0, allowed=allowed_queries,
+					error="Query ID '{value}' in submission file does not exist in testset {line}"),
+				# Class ID not in testset => Error
+				self.class_table.column(1,
+					error="'{value}' is not a valid class ID {line}"),
 				# 3rd value in line is not a number  => Error
-				try:
-					probability = float(row[2])
-				except ValueError:
-					raise Exception("Score must be a number {}"
-						.format(self.line_nbr_string(lineCnt)))
+				Column(2, parse=float,
+					error="Score must be a number {line}"),
 				# Rank not an int between 1 and 100 => Error
-				try:
-					rank = int(row[3])
-					if rank < 1 or rank > max_rank:
-						raise ValueError
-				except ValueError:
-					raise Exception("Rank 'must be an integer between 1 and 100 {}"
-						.format(self.line_nbr_string(lineCnt)))
-				values_for_observation = occured_observations.get(query_id,list())
-				class_ids_for_observation = [tup[0] for tup in values_for_observation]
-				# Same query_id combined with class_id present more than once => Error
-				if class_id in class_ids_for_observation:
-					raise Exception("Same prediction (query_id;class_id) present more than once ({};{}) {}"
-						.format(query_id, class_id, self.line_nbr_string(lineCnt)))
-
-				#add tuple to observations
-				values_for_observation.append((class_id, probability, rank, lineCnt))
-				occured_observations[query_id] = values_for_observation
-				#add to dict. this dict will be returned by the function later
-
-				if class_id == self.gt[query_id]:
-					query_to_correct_classid_rank[query_id] = rank
-
-			for q_id in occured_observations:
-				if q_id not in query_to_correct_classid_rank.keys():
-					query_to_correct_classid_rank[q_id] = 0
+				Column(3, parse=int, min_value=1, max_value=max_rank,
+					error="Rank 'must be an integer between 1 and 100 {line}")
+			],
+			delimiter=';',
+			min_fields=4,
+			arity_error="Wrong format: Each line must consist of a query ID, class ID, score and a rank separated by semicolons (<query_id>;<class_id><score>;<rank>) {line}")
 
-				observation_values_sorted = sorted(occured_observations[q_id], key=lambda tup: (tup[2],tup[1]) )
-				last_rank = 0
-				for values in observation_values_sorted:
-					curr_class_id, curr_score, curr_rank, curr_line = values
-					#Ranking for query_id not consecutive => Error
-					if curr_rank != (last_rank+1):
-						raise Exception("Ranking must be consecutive {}"
-							.format(self.line_nbr_string(curr_line)))
-					last_rank, last_score = curr_rank, curr_score
+		#The ranks of a query are checked in rank order, then in score order
+		correct_classes = {'correct': {query: self.class_table.bits([self.gt[query]]) for query in self.gt}}
+		index = load_ranked_run(submission_file_path, schema, correct_classes, self.class_table,
+								sort_key=lambda tup: (tup[2],tup[1]))
+		for q_id, ranks in index['correct_ranks']['correct'].items():
+			query_to_correct_classid_rank[q_id] = min(ranks)
+		#Queries of the runfile without the correct class => rank 0
+		for q_id in index['rank_bits']:
+			if q_id not in query_to_correct_classid_rank:
+				query_to_correct_classid_rank[q_id] = 0
 
 		return query_to_correct_classid_rank
 
@@ -1 +1,6 @@
-from .lifelog_adlt_evaluator import LifelogAdltEvaluator
+#The evaluator module is only imported when LifelogAdltEvaluator is accessed
+def __getattr__(name):
+    if name == 'LifelogAdltEvaluator':
+        from .lifelog_adlt_evaluator import LifelogAdltEvaluator
+        return LifelogAdltEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
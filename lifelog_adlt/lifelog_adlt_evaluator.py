@@ -1,5 +1,10 @@
 import csv
 
+from ..common.snapshot import Snapshot, is_snapshot
+from ..common.submission_reader import Column, SubmissionSchema, SubmissionReader
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
+
 """
 Evaluator class
 Evaluates one single runfile
@@ -16,10 +21,15 @@ class LifelogAdltEvaluator:
     def __init__(self, answer_file_path, allowed_image_ids_file_path,debug_mode=False):
         # Ground truth file
         self.answer_file_path = answer_file_path
-        # Ground truth data
-        self.gt = self.load_gt()
-
+        # Measures of the phases returned with the result (see common/telemetry.py)
+        self.debug_mode = debug_mode
+        # Allowed image ids file
         self.allowed_image_ids_file_path = allowed_image_ids_file_path
+        # Ground truth snapshot (if answer_file_path is a compiled snapshot)
+        self.snapshot = None
+        # Ground truth data
+        with measure_phase() as self.load_gt_measures:
+            self.gt = self.load_gt()
         # ...
 
     """
@@ -27,12 +37,16 @@ class LifelogAdltEvaluator:
     Parameter 'submission_file_path': Path of the submitted runfile
     returns a _result_object that can contain up to 2 different scores
     """
+    @score_cached
     def _evaluate(self, client_payload, context={}):
         submission_file_path = client_payload['submission_file_path']
+        telemetry = Telemetry(self, context)
         # Load predictions
-        predictions = self.load_predictions(submission_file_path)
+        with telemetry.phase('load_predictions'):
+            predictions = self.load_predictions(submission_file_path)
         # Compute first score
-        percentage_dissimilarity = self.compute_percentage_dissimilarity(predictions)
+        with telemetry.phase('compute_percentage_dissimilarity'):
+            percentage_dissimilarity = self.compute_percentage_dissimilarity(predictions)
         # Compute second score
         #secondary_score = self.compute_secondary_score(predictions)
 
@@ -47,13 +61,16 @@ class LifelogAdltEvaluator:
             "score_secondary": 0
         }
 
-        return _result_object
+        return telemetry.result(_result_object)
 
     """
     Load and return groundtruth data
     """
 
     def load_gt(self):
+        if is_snapshot(self.answer_file_path):
+            return self.load_gt_snapshot()
+
         gt = {}
         with open(self.answer_file_path) as csvfile:
             reader = csv.reader(csvfile, delimiter=',', quoting=csv.QUOTE_NONE)
@@ -61,11 +78,37 @@ class LifelogAdltEvaluator:
                 gt[row[0]] = (row[1], row[2])
         return gt
 
+    """
+    Load and return groundtruth data from a compiled snapshot (see common/snapshot.py)
+    """
+
+    def load_gt_snapshot(self):
+        self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+        topic_ids = self.snapshot.strings('topic_ids').tolist()
+        nbr_times = self.snapshot.strings('nbr_times').tolist()
+        nbr_minutes = self.snapshot.strings('nbr_minutes').tolist()
+        return dict(zip(topic_ids, zip(nbr_times, nbr_minutes)))
+
+    """
+    Return the sections of the groundtruth snapshot (see common/snapshot.py)
+    """
+
+    def gt_snapshot_sections(self):
+        return {
+            'strings': {'topic_ids': list(self.gt),
+                        'nbr_times': [self.gt[topic_id][0] for topic_id in self.gt],
+                        'nbr_minutes': [self.gt[topic_id][1] for topic_id in self.gt],
+                        'allowed_image_ids': sorted(self.load_allowed_image_ids())}
+        }
+
     """
     Load and return allowed image ids
     """
 
     def load_allowed_image_ids(self):
+        if self.snapshot is not None:
+            return self.snapshot.strings('allowed_image_ids').as_set()
+
         image_ids = set()
         with open(self.allowed_image_ids_file_path) as f:
             for image_id in f.readlines():
@@ -82,64 +125,37 @@ class LifelogAdltEvaluator:
     # Format: topic_id, nbr_times, nbr_minutes
     def load_predictions(self, submission_file_path):
         predictions = {}
-        topic_ids_gt = list(self.gt.keys())
+        topic_ids_gt = self.gt.keys()
         allowed_image_ids = self.load_allowed_image_ids()
 
-        in_mandatory_section = True
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter=',', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
-
-            for row in reader:
-                lineCnt += 1
-
-                if (len(row) != 3) and (len(row) == 1 and not self.is_mandatory_section_separator(row)):
-                    raise Exception(
-                        "Wrong format: Line must consist of 3 comma-separated tokens or '*****' (separator after mandatory lines). {}"
-                        .format(self.line_nbr_string(lineCnt)))
-                elif len(row) == 1 and self.is_mandatory_section_separator(row):
-                    break;  # reached optional section, ignore validation for all following lines
-
-                # Not 3 comma separated tokens on line => Error
-                if len(row) != 3:
-                    raise Exception(
-                        "Wrong format: Each line in the mandatory section must consist of a topic ID followed by a comma, nbr of times, a comma, and the number of minutes ({}). {}"
-                        .format("<topic_id>,<nbr_of_times>,<nbr_of_minutes>", self.line_nbr_string(lineCnt)))
-
-                topic_id = row[0]
+        schema = SubmissionSchema([
                 # Topic ID does not exist in testset => Error
-                if topic_id not in topic_ids_gt:
-                    raise Exception("Topic ID '{}' in submission file does not exist in testset {}"
-                                    .format(topic_id, self.line_nbr_string(lineCnt)))
-
-                # Topic ID already specified in runfile => Error
-                if topic_id in predictions:
-                    raise Exception("Topic ID '{}' specified more than once in submission file {}"
-                                    .format(topic_id, self.line_nbr_string(lineCnt)))
-
+                Column(0, allowed=topic_ids_gt,
+                    error="Topic ID '{value}' in submission file does not exist in testset {line}"),
                 # nbr of times not a number or not >= 1 => Error
-                try:
-                    nbr_times = int(row[1])
-                    if nbr_times < 1:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("'Number of times' (2nd column) must be an integer > 0 {}"
-                                    .format(self.line_nbr_string(lineCnt)))
-
+                Column(1, parse=int, min_value=1,
+                    error="'Number of times' (2nd column) must be an integer > 0 {line}"),
                 # Nbr of minutes not a number or >= 1 => Error
-                try:
-                    nbr_minutes = int(row[2])
-                    if nbr_minutes < 1:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("'Number of minutes' (3rd column) must be an integer > 0 {}"
-                                    .format(self.line_nbr_string(lineCnt)))
-
-                predictions[topic_id] = (nbr_times, nbr_minutes)
-
-            # nbr topics in gt != nbr topics in submission file => Error
-            if len(topic_ids_gt) != len(predictions):
-                raise Exception("Not all topics from testset included in submission file")
+                Column(2, parse=int, min_value=1,
+                    error="'Number of minutes' (3rd column) must be an integer > 0 {line}")
+            ],
+            delimiter=',',
+            # Not 3 comma separated tokens on line => Error
+            min_fields=3,
+            arity_error="Wrong format: Each line in the mandatory section must consist of a topic ID followed by a comma, nbr of times, a comma, and the number of minutes (<topic_id>,<nbr_of_times>,<nbr_of_minutes>). {line}",
+            # Topic ID already specified in runfile => Error
+            unique=[0],
+            unique_error="Topic ID '{0}' specified more than once in submission file {line}",
+            # reached optional section, ignore validation for all following lines
+            terminator="*****",
+            terminator_error="Wrong format: Line must consist of 3 comma-separated tokens or '*****' (separator after mandatory lines). {line}")
+
+        for lineCnt, (topic_id, nbr_times, nbr_minutes) in SubmissionReader(submission_file_path, schema):
+            predictions[topic_id] = (nbr_times, nbr_minutes)
+
+        # nbr topics in gt != nbr topics in submission file => Error
+        if len(topic_ids_gt) != len(predictions):
+            raise Exception("Not all topics from testset included in submission file")
 
         return predictions
 
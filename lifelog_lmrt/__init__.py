@@ -1 +1,6 @@
-from .lifelog_lmrt_evaluator import LifelogLmrtEvaluator
+#The evaluator module is only imported when LifelogLmrtEvaluator is accessed
+def __getattr__(name):
+    if name == 'LifelogLmrtEvaluator':
+        from .lifelog_lmrt_evaluator import LifelogLmrtEvaluator
+        return LifelogLmrtEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
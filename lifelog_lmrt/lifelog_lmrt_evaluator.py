@@ -1,5 +1,10 @@
 import csv
 
+from ..common.snapshot import Snapshot, is_snapshot
+from ..common.submission_reader import Column, SubmissionSchema, SubmissionReader
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
+
 """
 Evaluator class
 Evaluates one single runfile
@@ -17,12 +22,17 @@ class LifelogLmrtEvaluator:
                         debug_mode=False):
         # Ground truth file
         self.answer_file_path = answer_file_path
+        # Measures of the phases returned with the result (see common/telemetry.py)
+        self.debug_mode = debug_mode
         # Clusters ground truth file
         self.clusters_gt_file_path = clusters_gt_file_path
         # Allowed image ids file
         self.allowed_image_ids_file_path = allowed_image_ids_file_path
+        # Ground truth snapshot (if answer_file_path is a compiled snapshot)
+        self.snapshot = None
         # Ground truth data
-        self.gt, self.gt_topic, self.gt_image_id, self.gt_cluster_id = self.load_gt()
+        with measure_phase() as self.load_gt_measures:
+            self.gt, self.gt_topic, self.gt_image_id, self.gt_cluster_id = self.load_gt()
         # ...
 
     """
@@ -31,12 +41,16 @@ class LifelogLmrtEvaluator:
     returns a _result_object that can contain up to 2 different scores
     """
 
+    @score_cached
     def _evaluate(self, client_payload, context={}):
         submission_file_path = client_payload['submission_file_path']
+        telemetry = Telemetry(self, context)
         # Load predictions
-        predictions = self.load_predictions(submission_file_path)
+        with telemetry.phase('load_predictions'):
+            predictions = self.load_predictions(submission_file_path)
         # Compute first score
-        f1_10 = self.compute_f1_at_10(predictions)
+        with telemetry.phase('compute_f1_at_10'):
+            f1_10 = self.compute_f1_at_10(predictions)
         # Compute second score
         #secondary_score = self.compute_secondary_score(predictions)
 
@@ -51,7 +65,7 @@ class LifelogLmrtEvaluator:
             "score_secondary": 0
         }
 
-        return _result_object
+        return telemetry.result(_result_object)
 
     """
     Load and return groundtruth data
@@ -60,6 +74,9 @@ class LifelogLmrtEvaluator:
     # @Duc-Tien, just load your gt as you wish, i only included the loading of the gt file here
     # The loading of the clusters_gt_file must be implemented somehow as well
     def load_gt(self):
+        if is_snapshot(self.answer_file_path):
+            return self.load_gt_snapshot()
+
         gt = {}
         gt_topic = []
         gt_image_id = []
@@ -74,11 +91,46 @@ class LifelogLmrtEvaluator:
 
         return gt, gt_topic, gt_image_id, gt_cluster_id
 
+    """
+    Load and return groundtruth data from a compiled snapshot (see common/snapshot.py)
+    """
+
+    def load_gt_snapshot(self):
+        self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+        topics = self.snapshot.strings('topics').tolist()
+        image_ids = self.snapshot.strings('image_ids').tolist()
+        cluster_ids = self.snapshot.strings('cluster_ids').tolist()
+
+        gt = {}
+        for topic, image_id, cluster_id in zip(topics, image_ids, cluster_ids):
+            gt[topic] = (image_id, cluster_id)
+        gt_topic = [int(topic) for topic in topics]
+        gt_cluster_id = [int(cluster_id) for cluster_id in cluster_ids]
+
+        return gt, gt_topic, image_ids, gt_cluster_id
+
+    """
+    Return the sections of the groundtruth snapshot (see common/snapshot.py)
+    """
+
+    def gt_snapshot_sections(self):
+        topics = [str(topic) for topic in self.gt_topic]
+        image_ids = self.gt_image_id
+        cluster_ids = [str(cluster_id) for cluster_id in self.gt_cluster_id]
+
+        return {
+            'strings': {'topics': topics, 'image_ids': image_ids, 'cluster_ids': cluster_ids,
+                        'allowed_image_ids': sorted(self.load_allowed_image_ids())}
+        }
+
     """
     Load and return allowed image ids
     """
 
     def load_allowed_image_ids(self):
+        if self.snapshot is not None:
+            return self.snapshot.strings('allowed_image_ids').as_set()
+
         image_ids = set()
         with open(self.allowed_image_ids_file_path) as f:
             for image_id in f.readlines():
@@ -96,60 +148,37 @@ class LifelogLmrtEvaluator:
     # Format : topic_id, image_id, score
     def load_predictions(self, submission_file_path):
         predictions = {}
-        topic_ids_gt = list(self.gt.keys())
+        topic_ids_gt = self.gt.keys()
         allowed_image_ids = self.load_allowed_image_ids()
-        images_in_topic = {}
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter=',', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
-
-            for row in reader:
-                lineCnt += 1
-
-                # Not 3 comma separated tokens on line => Error
-                if len(row) != 3:
-                    raise Exception(
-                        "Wrong format: Each line must consist of a topic ID followed by a comma, an image ID, a comma, and a score ({}). {}"
-                            .format("<topic_id>,<image_id>,<confidence_score>", self.line_nbr_string(lineCnt)))
-
-                topic_id = row[0].strip()
+        schema = SubmissionSchema([
                 # Topic ID does not exist in testset => Error
-                if topic_id not in topic_ids_gt:
-                    raise Exception("Topic ID '{}' in submission file does not exist in testset {}"
-                                    .format(topic_id, self.line_nbr_string(lineCnt)))
-
-                image_id = row[1].strip()
+                Column(0, strip=True, allowed=topic_ids_gt,
+                    error="Topic ID '{value}' in submission file does not exist in testset {line}"),
                 # Image ID does not exist in testset => Error
-                if image_id not in allowed_image_ids:
-                    raise Exception("'{}' is not a valid image ID {}"
-                                    .format(image_id, self.line_nbr_string(lineCnt)))
-
-                # Image ID occured more than once for a given topic => Error
-                occured_images_for_topic = images_in_topic.get(topic_id, list())
-                if image_id in occured_images_for_topic:
-                    raise Exception("Image ID '{}' specified more than once for topic ID {}. {}"
-                                    .format(image_id, topic_id, self.line_nbr_string(lineCnt)))
-
-                occured_images_for_topic.append(image_id)
-                images_in_topic[topic_id] = occured_images_for_topic
-
+                Column(1, strip=True, allowed=allowed_image_ids,
+                    error="'{value}' is not a valid image ID {line}"),
                 # Score not a number or not between 0 and 1 => Error
-                try:
-                    score = float(row[2])
-                    if score < 0 or score > 1:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("Score must be a number between 0 and 1 {}"
-                                    .format(self.line_nbr_string(lineCnt)))
-
-                values_for_topic = predictions.get(topic_id, list())
-                values_for_topic.append((image_id, score))
-                predictions[topic_id] = values_for_topic
-
-            # nbr topics in gt != nbr topics in submission file => Error
-            if len(topic_ids_gt) != len(images_in_topic):
-                raise Exception("Not all topics from testset included in submission file {}"
-                                .format(self.line_nbr_string(lineCnt)))
+                Column(2, parse=float, min_value=0, max_value=1,
+                    error="Score must be a number between 0 and 1 {line}")
+            ],
+            delimiter=',',
+            # Not 3 comma separated tokens on line => Error
+            min_fields=3,
+            arity_error="Wrong format: Each line must consist of a topic ID followed by a comma, an image ID, a comma, and a score (<topic_id>,<image_id>,<confidence_score>). {line}",
+            # Image ID occured more than once for a given topic => Error
+            unique=[0, 1],
+            unique_error="Image ID '{1}' specified more than once for topic ID {0}. {line}")
+
+        reader = SubmissionReader(submission_file_path, schema)
+        for lineCnt, (topic_id, image_id, score) in reader:
+            values_for_topic = predictions.get(topic_id, list())
+            values_for_topic.append((image_id, score))
+            predictions[topic_id] = values_for_topic
+
+        # nbr topics in gt != nbr topics in submission file => Error
+        if len(topic_ids_gt) != len(predictions):
+            raise Exception("Not all topics from testset included in submission file {}"
+                            .format(self.line_nbr_string(reader.line_count)))
 
         return predictions
 
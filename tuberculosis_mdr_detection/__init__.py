@@ -1 +1,6 @@
-from .tuberculosis_mdr_detection_evaluator import TuberculosisMdrDetectionEvaluator
+#The evaluator module is only imported when TuberculosisMdrDetectionEvaluator is accessed
+def __getattr__(name):
+    if name == 'TuberculosisMdrDetectionEvaluator':
+        from .tuberculosis_mdr_detection_evaluator import TuberculosisMdrDetectionEvaluator
+        return TuberculosisMdrDetectionEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
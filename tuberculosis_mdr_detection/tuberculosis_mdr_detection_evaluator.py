@@ -1,35 +1,50 @@
-import csv
-import pandas as pd
 import numpy as np
-from sklearn import metrics
+
+from ..common.snapshot import Snapshot, dataframe_from_snapshot, dataframe_sections, is_snapshot
+from ..common.submission_reader import Column, SubmissionSchema, SubmissionReader
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
 
 class TuberculosisMdrDetectionEvaluator:
 
     def __init__(self, answer_file_path, debug_mode=False):
         #Ground Truth file
         self.answer_file_path = answer_file_path
-        self.gt = self.load_gt()
-
+        #Measures of the phases returned with the result (see common/telemetry.py)
+        self.debug_mode = debug_mode
+        #Ground truth snapshot (if answer_file_path is a compiled snapshot)
+        self.snapshot = None
+        with measure_phase() as self.load_gt_measures:
+            self.gt = self.load_gt()
+
+    @score_cached
     def _evaluate(self, client_payload, context={}):
         submission_file_path = client_payload['submission_file_path']
+        telemetry = Telemetry(self, context)
 
-        predictions = self.load_predictions(submission_file_path)
+        with telemetry.phase('load_predictions'):
+            predictions = self.load_predictions(submission_file_path)
 
-        predictedProbs = np.asarray([], float)
-        trueClasses = np.asarray([], float)
-        for key in predictions:
-            prediction = float(predictions[key])
-            gtruth = self.gt.loc[self.gt[0] == key]
+        with telemetry.phase('match_gt'):
+            predictedProbs = np.asarray([], float)
+            trueClasses = np.asarray([], float)
+            for key in predictions:
+                prediction = float(predictions[key])
+                gtruth = self.gt.loc[self.gt[0] == key]
 
-            predictedProbs = np.append(predictedProbs, prediction)
-            trueClasses = np.append(trueClasses, gtruth.values[0][1])
+                predictedProbs = np.append(predictedProbs, prediction)
+                trueClasses = np.append(trueClasses, gtruth.values[0][1])
 
-        predictedClasses = (predictedProbs > 0.5).astype(float)
-        matched = (predictedClasses == trueClasses).astype(int)
-        acc = matched.sum() / len(matched)
+        with telemetry.phase('compute_acc'):
+            predictedClasses = (predictedProbs > 0.5).astype(float)
+            matched = (predictedClasses == trueClasses).astype(int)
+            acc = matched.sum() / len(matched)
 
-        fpr, tpr, thr = metrics.roc_curve(trueClasses, predictedProbs, pos_label=1)
-        auc = metrics.auc(fpr, tpr)
+        with telemetry.phase('compute_auc'):
+            # scikit-learn is slow to import, it is only loaded when the score is computed
+            from sklearn import metrics
+            fpr, tpr, thr = metrics.roc_curve(trueClasses, predictedProbs, pos_label=1)
+            auc = metrics.auc(fpr, tpr)
 
         #_result_object = {
         #    "ACC": acc,
@@ -40,60 +55,50 @@ class TuberculosisMdrDetectionEvaluator:
             "score": acc,
             "score_secondary": auc
         }
-        return _result_object
+        return telemetry.result(_result_object)
 
     def load_predictions(self,submission_file_path):
-        pairs = {}
-        patient_ids_gt = self.gt[0].tolist()
-
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter=',', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
-            occured_patients = []
-            for row in reader:
-                lineCnt += 1
-                #Not 2 comma separated tokens on line => Error
-                if len(row) != 2:
-                    raise Exception("Wrong format: Each line must consist of a patient ID followed by a comma and a score ({}) {}"
-                        .format("<patient_id>,<score>", self.line_nbr_string(lineCnt)))
-
-                patient_id = row[0]
-
+        patient_ids_gt = set(self.gt[0].tolist())
+        schema = SubmissionSchema([
                 # Patient ID does not exist in testset => Error
-                if patient_id not in patient_ids_gt:
-                    raise Exception("Patient ID '{}' in submission file does not exist in testset {}"
-                        .format(patient_id, self.line_nbr_string(lineCnt)))
-
-                # Patient ID occured at least twice in file => Error
-                if patient_id in occured_patients:
-                    raise Exception("Patient ID '{}' was specified more than once in submission file {}"
-                        .format(patient_id, self.line_nbr_string(lineCnt)))
-
-                occured_patients.append(patient_id)
-
+                Column(0, allowed=patient_ids_gt,
+                    error="Patient ID '{value}' in submission file does not exist in testset {line}"),
                 # 2nd value on row not a number or not between 0 and 1 => Error
-                try:
-                    probability = float(row[1])
-                    if probability < 0 or probability > 1:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("Score must be a number between 0 and 1 {}"
-                        .format(self.line_nbr_string(lineCnt)))
-
-                pairs[row[0]] = row[1]
-
-            # In case not all images from the testset are contained in the file => Error
-            if(len(occured_patients) != len (patient_ids_gt)):
-                raise Exception("Number of patient IDs in submission file not equal to number of patient IDs in testset")
+                Column(1, parse=float, min_value=0, max_value=1,
+                    error="Score must be a number between 0 and 1 {line}")
+            ],
+            delimiter=',',
+            #Not 2 comma separated tokens on line => Error
+            min_fields=2,
+            arity_error="Wrong format: Each line must consist of a patient ID followed by a comma and a score (<patient_id>,<score>) {line}",
+            # Patient ID occured at least twice in file => Error
+            unique=[0],
+            unique_error="Patient ID '{0}' was specified more than once in submission file {line}")
+
+        patient_ids, probabilities = SubmissionReader(submission_file_path, schema).read_columns()
+        pairs = dict(zip(patient_ids, probabilities))
+
+        # In case not all images from the testset are contained in the file => Error
+        if(len(pairs) != len (patient_ids_gt)):
+            raise Exception("Number of patient IDs in submission file not equal to number of patient IDs in testset")
 
         return pairs
 
 
     def load_gt(self):
+        if is_snapshot(self.answer_file_path):
+            self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+            return dataframe_from_snapshot(self.snapshot)
+        # pandas is slow to import, it is only loaded with the ground truth
+        import pandas as pd
         return pd.read_csv(self.answer_file_path, sep=",", header=None)
         #print(self.gt[0].tolist())
 
 
+    def gt_snapshot_sections(self):
+        return dataframe_sections(self.gt)
+
+
     def line_nbr_string(self, line_nbr):
         return "(Line nbr {})".format(line_nbr)
 
@@ -1 +1,6 @@
-from .tuberculosis_severity_scoring_evaluator import TuberculosisSeverityScoringEvaluator
+#The evaluator module is only imported when TuberculosisSeverityScoringEvaluator is accessed
+def __getattr__(name):
+    if name == 'TuberculosisSeverityScoringEvaluator':
+        from .tuberculosis_severity_scoring_evaluator import TuberculosisSeverityScoringEvaluator
+        return TuberculosisSeverityScoringEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
@@ -1,6 +1,10 @@
 import csv
 import numpy as np
-from sklearn import metrics
+
+from ..common.snapshot import Snapshot, is_snapshot
+from ..common.submission_reader import Column, SubmissionSchema, SubmissionReader
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
 """
 Evaluator class
 Evaluates one single runfile
@@ -15,36 +19,49 @@ class TuberculosisSeverityScoringEvaluator:
     def __init__(self, answer_file_path, debug_mode=False):
         #Ground Truth file
         self.answer_file_path = answer_file_path
-        self.gt = self.load_gt()
+        #Measures of the phases returned with the result (see common/telemetry.py)
+        self.debug_mode = debug_mode
+        #Ground truth snapshot (if answer_file_path is a compiled snapshot)
+        self.snapshot = None
+        with measure_phase() as self.load_gt_measures:
+            self.gt = self.load_gt()
 
     """
     This is the only method that will be called by the framework
     Parameter 'submission_file_path': Path of the submitted runfile
     returns a _result_object that can contain up to 2 different scores
     """
+    @score_cached
     def _evaluate(self, client_payload, context={}):
         submission_file_path = client_payload['submission_file_path']
-
-        predictions = self.load_predictions(submission_file_path)
-
-        predictedScores = np.asarray([], float)
-        predictedProbs = np.asarray([], float)
-        trueScores = np.asarray([], float)
-        trueClasses = np.asarray([], float)
-        for key in predictions:
-            prediction = predictions[key]
-            gtruth = self.gt[key]
-
-            predictedScores = np.append(predictedScores, prediction[0])
-            predictedProbs = np.append(predictedProbs, prediction[1])
-            trueScores = np.append(trueScores, gtruth[0])
-            trueClasses = np.append(trueClasses, gtruth[1])
-
-        squaredErrors = np.power(predictedScores - trueScores, 2)
-        rmse = np.power(np.mean(squaredErrors), 0.5)
-
-        fpr, tpr, thr = metrics.roc_curve(trueClasses, predictedProbs, pos_label=1)
-        auc = metrics.auc(fpr, tpr)
+        telemetry = Telemetry(self, context)
+
+        with telemetry.phase('load_predictions'):
+            predictions = self.load_predictions(submission_file_path)
+
+        with telemetry.phase('match_gt'):
+            predictedScores = np.asarray([], float)
+            predictedProbs = np.asarray([], float)
+            trueScores = np.asarray([], float)
+            trueClasses = np.asarray([], float)
+            for key in predictions:
+                prediction = predictions[key]
+                gtruth = self.gt[key]
+
+                predictedScores = np.append(predictedScores, prediction[0])
+                predictedProbs = np.append(predictedProbs, prediction[1])
+                trueScores = np.append(trueScores, gtruth[0])
+                trueClasses = np.append(trueClasses, gtruth[1])
+
+        with telemetry.phase('compute_rmse'):
+            squaredErrors = np.power(predictedScores - trueScores, 2)
+            rmse = np.power(np.mean(squaredErrors), 0.5)
+
+        with telemetry.phase('compute_auc'):
+            # scikit-learn is slow to import, it is only loaded when the score is computed
+            from sklearn import metrics
+            fpr, tpr, thr = metrics.roc_curve(trueClasses, predictedProbs, pos_label=1)
+            auc = metrics.auc(fpr, tpr)
 
         #_result_object = {
         #  "RMSE": rmse,
@@ -56,7 +73,7 @@ class TuberculosisSeverityScoringEvaluator:
           "score_secondary" : auc
         }
 
-        return _result_object
+        return telemetry.result(_result_object)
 
     """
     Loads and returns a predictions object (dictionary) that contains the submitted data that will be used in the _evaluate method
@@ -69,57 +86,33 @@ class TuberculosisSeverityScoringEvaluator:
     # Return a dict where the value of dict[patient_id] is a tuple (severity_score, probability)
     def load_predictions(self,submission_file_path):
         predictions = {}
-        patient_ids_gt = list(self.gt.keys())
+        patient_ids_gt = self.gt.keys()
         allowed_severity_scores = set([self.gt[i][0] for i in self.gt])
-        occured_patient_ids = []
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter=',', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
-
-            for row in reader:
-                lineCnt += 1
-
-                #Not 3 comma separated tokens on line => Error
-                if len(row) != 3:
-                    raise Exception("Wrong format: Each line must consist of an image ID followed by a comma, a TB severity score and a probability ({}). {}"
-                        .format("<patient_id>,<tb_severity_score>,<probability>", self.line_nbr_string(lineCnt)))
-
-                patient_id = row[0]
+        schema = SubmissionSchema([
                 # Patient ID does not exist in testset => Error
-                if patient_id not in patient_ids_gt:
-                    raise Exception("Patient ID '{}' in submission file does not exist in testset {}"
-                        .format(patient_id, self.line_nbr_string(lineCnt)))
-
-                # Patient ID occured at least twice in file => Error
-                if patient_id in occured_patient_ids:
-                    raise Exception("Patient ID '{}' was specified more than once in submission file {}"
-                        .format(patient_id, self.line_nbr_string(lineCnt)))
-
-                occured_patient_ids.append(patient_id)
-
+                Column(0, allowed=patient_ids_gt,
+                    error="Patient ID '{value}' in submission file does not exist in testset {line}"),
                 # 2nd row of line is not an int or contained in possible_tb_types => Error
-                try:
-                    svr_score = int(row[1])
-                    if svr_score not in allowed_severity_scores:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("Invalid TB severity score '{}'. Possible values are: {}. {}"
-                        .format(row[1], allowed_severity_scores, self.line_nbr_string(lineCnt)))
-
+                Column(1, parse=int, allowed=allowed_severity_scores,
+                    error="Invalid TB severity score '{value}'. Possible values are: {allowed}. {line}"),
                 # Probability not a number or not between 0 and 1 => Error
-                try:
-                    probability = float(row[2])
-                    if probability < 0 or probability > 1:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("Probability must be a number between 0 and 1 {}"
-                        .format(self.line_nbr_string(lineCnt)))
-
-                predictions[patient_id] = (svr_score, probability)
-
-            # In case not all images from the testset are contained in the file => Error
-            if(len(occured_patient_ids) != len (patient_ids_gt)):
-                raise Exception("Number of patient IDs in submission file not equal to number of patient IDs in testset")
+                Column(2, parse=float, min_value=0, max_value=1,
+                    error="Probability must be a number between 0 and 1 {line}")
+            ],
+            delimiter=',',
+            #Not 3 comma separated tokens on line => Error
+            min_fields=3,
+            arity_error="Wrong format: Each line must consist of an image ID followed by a comma, a TB severity score and a probability (<patient_id>,<tb_severity_score>,<probability>). {line}",
+            # Patient ID occured at least twice in file => Error
+            unique=[0],
+            unique_error="Patient ID '{0}' was specified more than once in submission file {line}")
+
+        for lineCnt, (patient_id, svr_score, probability) in SubmissionReader(submission_file_path, schema):
+            predictions[patient_id] = (svr_score, probability)
+
+        # In case not all images from the testset are contained in the file => Error
+        if(len(predictions) != len (patient_ids_gt)):
+            raise Exception("Number of patient IDs in submission file not equal to number of patient IDs in testset")
 
         return predictions
 
@@ -128,6 +121,9 @@ class TuberculosisSeverityScoringEvaluator:
     Load and return groundtruth data
     """
     def load_gt(self):
+        if is_snapshot(self.answer_file_path):
+            return self.load_gt_snapshot()
+
         gt = {}
         with open(self.answer_file_path) as csvfile:
             reader = csv.reader(csvfile, delimiter=',', quoting=csv.QUOTE_NONE)
@@ -140,6 +136,27 @@ class TuberculosisSeverityScoringEvaluator:
         return gt
 
 
+    """
+    Load and return groundtruth data from a compiled snapshot (see common/snapshot.py)
+    """
+    def load_gt_snapshot(self):
+        self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+        patient_ids = self.snapshot.strings('patient_ids').tolist()
+        svr_scores = self.snapshot.array('svr_scores').tolist()
+        probabilities = self.snapshot.array('probabilities').tolist()
+        return dict(zip(patient_ids, zip(svr_scores, probabilities)))
+
+
+    """
+    Return the sections of the groundtruth snapshot (see common/snapshot.py)
+    """
+    def gt_snapshot_sections(self):
+        return {
+            'arrays': {'svr_scores': np.array([self.gt[patient_id][0] for patient_id in self.gt], dtype=np.int64),
+                       'probabilities': np.array([self.gt[patient_id][1] for patient_id in self.gt], dtype=np.float64)},
+            'strings': {'patient_ids': list(self.gt)}
+        }
+
 
     def line_nbr_string(self, line_nbr):
         return "(Line nbr {})".format(line_nbr)
@@ -1 +1,6 @@
-from .tuberculosis_tb_type_evaluator import TuberculosisTbTypeEvaluator
\ No newline at end of file
+#The evaluator module is only imported when TuberculosisTbTypeEvaluator is accessed
+def __getattr__(name):
+    if name == 'TuberculosisTbTypeEvaluator':
+        from .tuberculosis_tb_type_evaluator import TuberculosisTbTypeEvaluator
+        return TuberculosisTbTypeEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
@@ -1,8 +1,9 @@
-import csv
-import pandas as pd
 import numpy as np
-from sklearn import metrics
-from sklearn.metrics.classification import confusion_matrix
+
+from ..common.snapshot import Snapshot, dataframe_from_snapshot, dataframe_sections, is_snapshot
+from ..common.submission_reader import Column, SubmissionSchema, SubmissionReader
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
 
 
 class TuberculosisTbTypeEvaluator:
@@ -10,9 +11,16 @@ class TuberculosisTbTypeEvaluator:
     def __init__(self, answer_file_path,debug_mode=False):
         #Ground Truth file
         self.answer_file_path = answer_file_path
-        self.gt = self.load_gt()
+        #Measures of the phases returned with the result (see common/telemetry.py)
+        self.debug_mode = debug_mode
+        #Ground truth snapshot (if answer_file_path is a compiled snapshot)
+        self.snapshot = None
+        with measure_phase() as self.load_gt_measures:
+            self.gt = self.load_gt()
 
     def cohensKappa(self, trueClasses, predictedClasses):
+        # scikit-learn is slow to import, it is only loaded when the score is computed
+        from sklearn import metrics
         confusionMat = metrics.confusion_matrix(trueClasses, predictedClasses)
 
         m = confusionMat.shape[0]
@@ -32,24 +40,30 @@ class TuberculosisTbTypeEvaluator:
 
         return kappa
 
+    @score_cached
     def _evaluate(self, client_payload, context={}):
         submission_file_path = client_payload['submission_file_path']
+        telemetry = Telemetry(self, context)
 
-        predictions = self.load_predictions(submission_file_path)
+        with telemetry.phase('load_predictions'):
+            predictions = self.load_predictions(submission_file_path)
 
-        predictedClasses = np.asarray([], float)
-        trueClasses = np.asarray([], float)
-        for key in predictions:
-            prediction = float(predictions[key])
-            gtruth = self.gt.loc[self.gt[0] == key]
+        with telemetry.phase('match_gt'):
+            predictedClasses = np.asarray([], float)
+            trueClasses = np.asarray([], float)
+            for key in predictions:
+                prediction = float(predictions[key])
+                gtruth = self.gt.loc[self.gt[0] == key]
 
-            predictedClasses = np.append(predictedClasses, prediction)
-            trueClasses = np.append(trueClasses, gtruth.values[0][1])
+                predictedClasses = np.append(predictedClasses, prediction)
+                trueClasses = np.append(trueClasses, gtruth.values[0][1])
 
-        matched = (predictedClasses == trueClasses).astype(int)
-        acc = matched.sum() / len(matched)
+        with telemetry.phase('compute_acc'):
+            matched = (predictedClasses == trueClasses).astype(int)
+            acc = matched.sum() / len(matched)
 
-        kappa = self.cohensKappa(trueClasses, predictedClasses)
+        with telemetry.phase('cohensKappa'):
+            kappa = self.cohensKappa(trueClasses, predictedClasses)
 
         #_result_object = {
         #  "ACC": acc,
@@ -62,60 +76,51 @@ class TuberculosisTbTypeEvaluator:
         }
 
 
-        return _result_object
+        return telemetry.result(_result_object)
 
     def load_predictions(self,submission_file_path):
-        pairs = {}
-        patient_ids_gt = self.gt[0].tolist()
+        patient_ids_gt = set(self.gt[0].tolist())
         possible_tb_types = set(self.gt[1].tolist())
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter=',', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
-            occured_patients = []
-            for row in reader:
-                lineCnt += 1
-                #Not 2 comma separated tokens on line => Error
-                if len(row) != 2:
-                    raise Exception("Wrong format: Each line must consist of an patient ID followed by a comma and the TB type ({}) {}"
-                        .format("<patient_id>,<tb_type>", self.line_nbr_string(lineCnt)))
-
-                patient_id = row[0]
-
+        schema = SubmissionSchema([
                 # Patient ID does not exist in testset => Error
-                if patient_id not in patient_ids_gt:
-                    raise Exception("Patient ID '{}' in submission file does not exist in testset {}"
-                        .format(patient_id, self.line_nbr_string(lineCnt)))
-
-                # Patient ID occured at least twice in file => Error
-                if patient_id in occured_patients:
-                    raise Exception("Patient ID '{}' was specified more than once in submission file {}"
-                        .format(patient_id, self.line_nbr_string(lineCnt)))
-
-                occured_patients.append(patient_id)
-
+                Column(0, allowed=patient_ids_gt,
+                    error="Patient ID '{value}' in submission file does not exist in testset {line}"),
                 # 2nd row of line is not an int or contained in possible_tb_types => Error
-                try:
-                    tb_type = int(row[1])
-                    if tb_type not in possible_tb_types:
-                        raise ValueError
-                except ValueError:
-                    raise Exception("TB type '{}' does not exist {}. Possible values are: {}"
-                        .format(row[1], self.line_nbr_string(lineCnt), possible_tb_types))
-
-                pairs[row[0]] = row[1]
-
-            # In case not all patients from the testset are contained in the file => Error
-            if(len(occured_patients) != len (patient_ids_gt)):
-                raise Exception("Number of patient IDs in submission file not equal to number of patient IDs in testset")
+                Column(1, parse=int, allowed=possible_tb_types,
+                    error="TB type '{value}' does not exist {line}. Possible values are: {allowed}")
+            ],
+            delimiter=',',
+            #Not 2 comma separated tokens on line => Error
+            min_fields=2,
+            arity_error="Wrong format: Each line must consist of an patient ID followed by a comma and the TB type (<patient_id>,<tb_type>) {line}",
+            # Patient ID occured at least twice in file => Error
+            unique=[0],
+            unique_error="Patient ID '{0}' was specified more than once in submission file {line}")
+
+        patient_ids, tb_types = SubmissionReader(submission_file_path, schema).read_columns()
+        pairs = dict(zip(patient_ids, tb_types))
+
+        # In case not all patients from the testset are contained in the file => Error
+        if(len(pairs) != len (patient_ids_gt)):
+            raise Exception("Number of patient IDs in submission file not equal to number of patient IDs in testset")
 
         return pairs
 
 
     def load_gt(self):
+        if is_snapshot(self.answer_file_path):
+            self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+            return dataframe_from_snapshot(self.snapshot)
+        # pandas is slow to import, it is only loaded with the ground truth
+        import pandas as pd
         return pd.read_csv(self.answer_file_path, sep=",", header=None)
         #print(self.gt[0].tolist())
 
 
+    def gt_snapshot_sections(self):
+        return dataframe_sections(self.gt)
+
+
     def line_nbr_string(self, line_nbr):
         return "(Line nbr {})".format(line_nbr)
 
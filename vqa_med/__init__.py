@@ -1 +1,6 @@
-from .vqa_med_evaluator import VqaMedEvaluator
+#The evaluator module is only imported when VqaMedEvaluator is accessed
+def __getattr__(name):
+    if name == 'VqaMedEvaluator':
+        from .vqa_med_evaluator import VqaMedEvaluator
+        return VqaMedEvaluator
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
@@ -1,13 +1,11 @@
 import codecs
-import csv
 import string
-import nltk
 import warnings
-from nltk.translate.bleu_score import SmoothingFunction
-from nltk.corpus import stopwords
-from nltk.stem.snowball import SnowballStemmer
-from nltk.corpus import wordnet as wn
-from scipy import spatial
+
+from ..common.snapshot import Snapshot, is_snapshot
+from ..common.submission_reader import Column, SubmissionSchema, SubmissionReader
+from ..common.score_cache import score_cached
+from ..common.telemetry import Telemetry, measure_phase
 """
 Evaluator class
 Evaluates one single runfile
@@ -27,8 +25,17 @@ class VqaMedEvaluator:
     def __init__(self, answer_file_path,debug_mode=False):
         #Ground truth file
         self.answer_file_path = answer_file_path
+        #Measures of the phases returned with the result (see common/telemetry.py)
+        self.debug_mode = debug_mode
+        #Ground truth snapshot (if answer_file_path is a compiled snapshot)
+        self.snapshot = None
         #Ground truth data
-        self.gt = self.load_gt()
+        with measure_phase() as self.load_gt_measures:
+            self.gt = self.load_gt()
+        #Image ID of each QA-ID in the testset
+        self.image_id_by_qa_id = {}
+        for qa_id, image_id, answer in reversed(self.gt):
+            self.image_id_by_qa_id[qa_id] = image_id
         #Used for WUPS
         self.word_pair_dict = {}
         #...
@@ -38,14 +45,19 @@ class VqaMedEvaluator:
     Parameter 'submission_file_path': Path of the submitted runfile
     returns a _result_object that can contain up to 2 different scores
     """
+    @score_cached
     def _evaluate(self, client_payload, context={}):
         submission_file_path = client_payload['submission_file_path']
+        telemetry = Telemetry(self, context)
         #Load predictions
-        predictions = self.load_predictions(submission_file_path)
+        with telemetry.phase('load_predictions'):
+            predictions = self.load_predictions(submission_file_path)
         #Compute first score
-        wbss = self.compute_wbss(predictions)
+        with telemetry.phase('compute_wbss'):
+            wbss = self.compute_wbss(predictions)
         #Compute second score
-        bleu = self.compute_bleu(predictions)
+        with telemetry.phase('compute_bleu'):
+            bleu = self.compute_bleu(predictions)
 
         #Create object that is returned to the CrowdAI framework
         #_result_object = {
@@ -58,13 +70,15 @@ class VqaMedEvaluator:
           "score_secondary" : bleu
         }
 
-        return _result_object
+        return telemetry.result(_result_object)
 
     """
     Load and return groundtruth data
     """
     def load_gt(self):
-        #return gt
+        if is_snapshot(self.answer_file_path):
+            return self.load_gt_snapshot()
+
         results = []
         for line in codecs.open(self.answer_file_path,'r','utf-8'):
             QID = line.split('\t')[0]
@@ -73,6 +87,26 @@ class VqaMedEvaluator:
             results.append((QID, ImageID, ans))
         return results
 
+    """
+    Load and return groundtruth data from a compiled snapshot (see common/snapshot.py)
+    """
+    def load_gt_snapshot(self):
+        self.snapshot = Snapshot(self.answer_file_path, type(self).__name__)
+        qa_ids = self.snapshot.strings('qa_ids').tolist()
+        image_ids = self.snapshot.strings('image_ids').tolist()
+        answers = self.snapshot.strings('answers').tolist()
+        return list(zip(qa_ids, image_ids, answers))
+
+    """
+    Return the sections of the groundtruth snapshot (see common/snapshot.py)
+    """
+    def gt_snapshot_sections(self):
+        return {
+            'strings': {'qa_ids': [tup[0] for tup in self.gt],
+                        'image_ids': [tup[1] for tup in self.gt],
+                        'answers': [tup[2] for tup in self.gt]}
+        }
+
     """
     Loads and returns a predictions object (dictionary) that contains the submitted data that will be used in the _evaluate method
     Parameter 'submission_file_path': Path of the submitted runfile
@@ -81,53 +115,44 @@ class VqaMedEvaluator:
     """
     def load_predictions(self, submission_file_path):
 
-        qa_ids_testset = [tup[0] for tup in self.gt]
-        image_ids_testset = [tup[1] for tup in self.gt]
         predictions = []
-        occured_qaid_imageid_pairs = []
-
-        with open(submission_file_path) as csvfile:
-            reader = csv.reader(csvfile, delimiter='\t', quoting=csv.QUOTE_NONE)
-            lineCnt = 0
-            occured_images = []
-            for row in reader:
-                lineCnt += 1
-                # Not 2 nor 3 tab separated tokens on line => Error
-                if(len(row) != 3 and len(row) != 2):
-                    raise Exception("Wrong format: Each line must consist of an QA-ID followed by a tab, an Image ID, a tab and an answer ({}), where the answer can be empty {}"
-                        .format("<QA-ID><TAB><Image-ID><TAB><Answer>", self.line_nbr_string(lineCnt)))
-
-                qa_id = row[0]
-                image_id = row[1]
-
-                #QA-ID - Image-ID pair does not match with testset => Error
-                try:
-                    i = qa_ids_testset.index(qa_id)
-                    expected_image_id = image_ids_testset[i]
-                    if image_id != expected_image_id:
-                        raise Exception
-                except :
-                    raise Exception("QA-ID '{}' with Image-ID '{}' does not represent a valid QA-ID - IMAGE ID pair in the testset {}"
-                        .format(qa_id, image_id, self.line_nbr_string(lineCnt)))
-
-                #QA-ID - Image-ID already appeared => Error
-                if (qa_id, image_id) in occured_qaid_imageid_pairs:
-                    raise Exception("The QA-ID '{}' with Image-ID '{}' pair appeared more than once in the submission file {}"
-                        .format(qa_id, image_id, self.line_nbr_string(lineCnt)))
-
-                answer = row[2] if (len(row) == 3) else ""
-
-                predictions.append((qa_id, image_id, answer))
-                occured_qaid_imageid_pairs.append((qa_id, image_id))
-
-            # Not all QA-ID Image-ID pairs included => Error
-            if len(predictions) != len(self.gt):
-                raise Exception("Number of QA-ID - Image-ID pairs in submission file does not correspond with number of QA-ID - Image-ID pairs in testset")
-
+        schema = SubmissionSchema([
+                # Answer can be empty
+                Column(2, default="")
+            ],
+            delimiter='\t',
+            # Not 2 nor 3 tab separated tokens on line => Error
+            min_fields=2,
+            max_fields=3,
+            arity_error="Wrong format: Each line must consist of an QA-ID followed by a tab, an Image ID, a tab and an answer (<QA-ID><TAB><Image-ID><TAB><Answer>), where the answer can be empty {line}",
+            row_check=self.check_qaid_imageid_pair,
+            #QA-ID - Image-ID already appeared => Error
+            unique=[0, 1],
+            unique_error="The QA-ID '{0}' with Image-ID '{1}' pair appeared more than once in the submission file {line}")
+
+        for lineCnt, (qa_id, image_id, answer) in SubmissionReader(submission_file_path, schema):
+            predictions.append((qa_id, image_id, answer))
+
+        # Not all QA-ID Image-ID pairs included => Error
+        if len(predictions) != len(self.gt):
+            raise Exception("Number of QA-ID - Image-ID pairs in submission file does not correspond with number of QA-ID - Image-ID pairs in testset")
 
         return predictions
 
 
+    """
+    Checks that the QA-ID and the Image-ID of a line (row) match the testset
+    """
+    def check_qaid_imageid_pair(self, row, lineCnt):
+        qa_id = row[0]
+        image_id = row[1]
+
+        #QA-ID - Image-ID pair does not match with testset => Error
+        if self.image_id_by_qa_id.get(qa_id) != image_id:
+            raise Exception("QA-ID '{}' with Image-ID '{}' does not represent a valid QA-ID - IMAGE ID pair in the testset {}"
+                .format(qa_id, image_id, self.line_nbr_string(lineCnt)))
+
+
 
     """
     Compute and return the primary score
@@ -137,6 +162,8 @@ class VqaMedEvaluator:
     Valiation should be handled in the load_predictions method
     """
     def compute_wbss(self, predictions):
+        # NLTK and scipy are slow to import, they are only loaded when the scores are computed
+        import nltk
         nltk.download('wordnet')
         count = 0
         totalscore_wbss = 0.0
@@ -207,6 +234,7 @@ class VqaMedEvaluator:
             return  self.word_pair_dict[a+','+b]
 
         def get_semantic_field(a):
+            from nltk.corpus import wordnet as wn
             return wn.synsets(a, pos=wn.NOUN)
 
         if a == b: return 1.0
@@ -240,6 +268,7 @@ class VqaMedEvaluator:
         return final_score
 
     def calculateCosineSimilarity(self, vector1, vector2):
+        from scipy import spatial
         return 1-spatial.distance.cosine(vector1, vector2)
 
     """
@@ -250,6 +279,10 @@ class VqaMedEvaluator:
     Valiation should be handled in the load_predictions method
     """
     def compute_bleu(self, predictions):
+        import nltk
+        from nltk.translate.bleu_score import SmoothingFunction
+        from nltk.corpus import stopwords
+        from nltk.stem.snowball import SnowballStemmer
 
         # Hide warnings
         warnings.filterwarnings('ignore')